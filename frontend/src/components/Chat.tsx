@@ -20,6 +20,10 @@ const Chat: React.FC<ChatProps> = ({ auditId, auditTitle }) => {
     const [sessionId, setSessionId] = useState<string>();
     const [loading, setLoading] = useState(false);
     const messagesEndRef = useRef<HTMLDivElement>(null);
+    const abortRef = useRef<AbortController | null>(null);
+
+    // Laufende Antwort abbrechen, wenn die Komponente verlassen wird
+    useEffect(() => () => abortRef.current?.abort(), []);
 
     useEffect(() => {
         messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -31,6 +35,12 @@ const Chat: React.FC<ChatProps> = ({ auditId, auditTitle }) => {
 
         const userMsg = input;
         setInput('');
+
+        // Eine noch laufende Antwort abbrechen, bevor die neue Frage gestellt wird
+        abortRef.current?.abort();
+        const controller = new AbortController();
+        abortRef.current = controller;
+
         setMessages(prev => [...prev, { role: 'user', content: userMsg }]);
         setLoading(true);
 
@@ -61,9 +71,11 @@ const Chat: React.FC<ChatProps> = ({ auditId, auditTitle }) => {
                         }
                         return newMessages;
                     });
-                }
+                },
+                controller.signal
             );
         } catch (error) {
+            if (controller.signal.aborted) return;
             console.error("Chat error", error);
             setMessages(prev => {
                 const newMessages = [...prev];
@@ -74,11 +86,17 @@ const Chat: React.FC<ChatProps> = ({ auditId, auditTitle }) => {
                 return newMessages;
             });
         } finally {
-            setLoading(false);
+            if (abortRef.current === controller) {
+                abortRef.current = null;
+                setLoading(false);
+            }
         }
     };
 
     const handleNewChat = () => {
+        abortRef.current?.abort();
+        abortRef.current = null;
+        setLoading(false);
         setMessages([]);
         setSessionId(undefined);
     };
@@ -7,17 +7,24 @@ import type { Finding } from '../services/findingService';
 interface AuditDetailContext {
     audit: Audit;
     setAudit: (audit: Audit) => void;
+    takePreloaded: (section: 'findings') => Finding[] | undefined;
 }
 
 const ActionTrackingPhase: React.FC = () => {
-    const { audit } = useOutletContext<AuditDetailContext>();
+    const { audit, takePreloaded } = useOutletContext<AuditDetailContext>();
     const [findings, setFindings] = useState<Finding[]>([]);
     const [loading, setLoading] = useState(true);
     const [editingId, setEditingId] = useState<string | null>(null);
     const [actionForm, setActionForm] = useState({ action_description: '', action_due_date: '', action_status: 'OPEN' });
 
     useEffect(() => {
-        loadFindings();
+        const preloaded = takePreloaded('findings');
+        if (preloaded) {
+            setFindings(preloaded);
+            setLoading(false);
+        } else {
+            loadFindings();
+        }
     }, [audit.id]);
 
     const loadFindings = async () => {
@@ -1,8 +1,8 @@
-import { useEffect, useState } from 'react';
+import { useCallback, useEffect, useRef, useState } from 'react';
 import { useParams, NavLink, Outlet, useNavigate } from 'react-router-dom';
 import { ArrowLeft, ClipboardList, Search as SearchIcon, FileBarChart, CheckSquare, FolderOpen, Sparkles } from 'lucide-react';
-import { getAudit } from '../services/auditService';
-import type { Audit, AuditStatus } from '../services/auditService';
+import { getAuditOverview } from '../services/auditService';
+import type { Audit, AuditOverview, AuditStatus } from '../services/auditService';
 import Chat from '../components/Chat';
 
 const STATUS_LABELS: Record<AuditStatus, string> = {
@@ -27,23 +27,39 @@ const phaseTabs = [
     { path: 'dokumente', label: 'Dokumente', icon: FolderOpen },
 ];
 
+// Listen, die die Phasenseiten beim ersten Öffnen aus der Übersicht übernehmen
+type PreloadedSection = 'findings' | 'documents' | 'reports';
+type Preloaded = Pick<AuditOverview, PreloadedSection>;
+
 const AuditDetailPage: React.FC = () => {
     const { id } = useParams<{ id: string }>();
     const navigate = useNavigate();
     const [audit, setAudit] = useState<Audit | null>(null);
     const [loading, setLoading] = useState(true);
     const [showChat, setShowChat] = useState(false);
+    const preloaded = useRef<Preloaded>({});
 
     useEffect(() => {
         if (id) {
             setLoading(true);
-            getAudit(Number(id))
-                .then(setAudit)
+            // Ein Aufruf statt je einem pro Phasenseite
+            getAuditOverview(Number(id), ['findings', 'documents', 'reports'], ['report_content'])
+                .then(({ findings, documents, reports, ...rest }) => {
+                    preloaded.current = { findings, documents, reports };
+                    setAudit(rest);
+                })
                 .catch(() => navigate('/audits'))
                 .finally(() => setLoading(false));
         }
     }, [id, navigate]);
 
+    // Jede Liste wird nur einmal ausgegeben; spätere Aufrufe laden selbst, damit nach Änderungen nichts veraltet
+    const takePreloaded = useCallback(<K extends PreloadedSection>(section: K): Preloaded[K] => {
+        const data = preloaded.current[section];
+        delete preloaded.current[section];
+        return data;
+    }, []);
+
     if (loading) {
         return <div className="flex items-center justify-center h-full text-gray-500">Laden...</div>;
     }
@@ -108,7 +124,7 @@ const AuditDetailPage: React.FC = () => {
 
                 {/* Phase Content */}
                 <div className="flex-1 overflow-y-auto">
-                    <Outlet context={{ audit, setAudit }} />
+                    <Outlet context={{ audit, setAudit, takePreloaded }} />
                 </div>
             </div>
 
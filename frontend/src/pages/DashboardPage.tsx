@@ -2,17 +2,21 @@ import { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { BarChart3, AlertTriangle, CheckCircle, Clock, FileText, ArrowRight } from 'lucide-react';
 import { useAudits } from '../context/AuditContext';
-import { getFindings } from '../services/findingService';
-import type { Finding } from '../services/findingService';
+import { getDashboardStats } from '../services/dashboardService';
+import type { DashboardStats } from '../services/dashboardService';
 
-interface DashboardStats {
-    totalAudits: number;
-    byStatus: Record<string, number>;
-    totalFindings: number;
-    openFindings: number;
-    highSeverityFindings: number;
-    overdueActions: number;
-}
+const EMPTY_STATS: DashboardStats = {
+    total_audits: 0,
+    audits_by_status: {},
+    total_findings: 0,
+    open_findings: 0,
+    findings_by_status: {},
+    findings_by_severity: {},
+    high_severity_findings: 0,
+    overdue_actions: 0,
+    overdue_preview: [],
+    per_audit: [],
+};
 
 const STATUS_LABELS: Record<string, string> = {
     PLANUNG: 'Planung',
@@ -31,57 +35,25 @@ const STATUS_COLORS: Record<string, string> = {
 const DashboardPage: React.FC = () => {
     const { audits, loading: auditsLoading } = useAudits();
     const navigate = useNavigate();
-    const [stats, setStats] = useState<DashboardStats>({
-        totalAudits: 0,
-        byStatus: {},
-        totalFindings: 0,
-        openFindings: 0,
-        highSeverityFindings: 0,
-        overdueActions: 0,
-    });
-    const [allFindings, setAllFindings] = useState<Finding[]>([]);
-    const [loadingFindings, setLoadingFindings] = useState(true);
+    const [stats, setStats] = useState<DashboardStats>(EMPTY_STATS);
+    const [loadingStats, setLoadingStats] = useState(true);
 
     useEffect(() => {
-        if (audits.length > 0) {
-            loadAllFindings();
-        } else {
-            setLoadingFindings(false);
-        }
+        loadStats();
     }, [audits]);
 
-    const loadAllFindings = async () => {
-        setLoadingFindings(true);
+    const loadStats = async () => {
+        setLoadingStats(true);
         try {
-            const findingsPromises = audits.map(a => getFindings(a.id).catch(() => []));
-            const results = await Promise.all(findingsPromises);
-            const findings = results.flat();
-            setAllFindings(findings);
-
-            const now = new Date();
-            setStats({
-                totalAudits: audits.length,
-                byStatus: audits.reduce((acc, a) => {
-                    acc[a.status] = (acc[a.status] || 0) + 1;
-                    return acc;
-                }, {} as Record<string, number>),
-                totalFindings: findings.length,
-                openFindings: findings.filter(f => f.status === 'OPEN').length,
-                highSeverityFindings: findings.filter(f => f.severity === 'HIGH').length,
-                overdueActions: findings.filter(f =>
-                    f.action_due_date &&
-                    new Date(f.action_due_date) < now &&
-                    f.action_status !== 'DONE'
-                ).length,
-            });
+            setStats(await getDashboardStats());
         } catch (error) {
-            console.error('Failed to load findings', error);
+            console.error('Failed to load dashboard stats', error);
         } finally {
-            setLoadingFindings(false);
+            setLoadingStats(false);
         }
     };
 
-    const isLoading = auditsLoading || loadingFindings;
+    const isLoading = auditsLoading || loadingStats;
 
     return (
         <div className="p-8 max-w-6xl mx-auto">
@@ -100,7 +72,7 @@ const DashboardPage: React.FC = () => {
                                 </div>
                                 <span className="text-sm text-gray-500">Prüfungen</span>
                             </div>
-                            <div className="text-3xl font-bold text-gray-800">{stats.totalAudits}</div>
+                            <div className="text-3xl font-bold text-gray-800">{stats.total_audits}</div>
                         </div>
                         <div className="bg-white rounded-xl p-5 shadow-sm border border-gray-200">
                             <div className="flex items-center gap-3 mb-2">
@@ -109,7 +81,7 @@ const DashboardPage: React.FC = () => {
                                 </div>
                                 <span className="text-sm text-gray-500">Offene Feststellungen</span>
                             </div>
-                            <div className="text-3xl font-bold text-gray-800">{stats.openFindings}</div>
+                            <div className="text-3xl font-bold text-gray-800">{stats.open_findings}</div>
                         </div>
                         <div className="bg-white rounded-xl p-5 shadow-sm border border-gray-200">
                             <div className="flex items-center gap-3 mb-2">
@@ -118,7 +90,7 @@ const DashboardPage: React.FC = () => {
                                 </div>
                                 <span className="text-sm text-gray-500">Hohe Priorität</span>
                             </div>
-                            <div className="text-3xl font-bold text-gray-800">{stats.highSeverityFindings}</div>
+                            <div className="text-3xl font-bold text-gray-800">{stats.high_severity_findings}</div>
                         </div>
                         <div className="bg-white rounded-xl p-5 shadow-sm border border-gray-200">
                             <div className="flex items-center gap-3 mb-2">
@@ -127,7 +99,7 @@ const DashboardPage: React.FC = () => {
                                 </div>
                                 <span className="text-sm text-gray-500">Überfällige Maßnahmen</span>
                             </div>
-                            <div className="text-3xl font-bold text-red-600">{stats.overdueActions}</div>
+                            <div className="text-3xl font-bold text-red-600">{stats.overdue_actions}</div>
                         </div>
                     </div>
 
@@ -137,8 +109,8 @@ const DashboardPage: React.FC = () => {
                             <h3 className="text-lg font-semibold text-gray-800 mb-4">Prüfungen nach Status</h3>
                             <div className="space-y-3">
                                 {Object.entries(STATUS_LABELS).map(([status, label]) => {
-                                    const count = stats.byStatus[status] || 0;
-                                    const pct = stats.totalAudits > 0 ? (count / stats.totalAudits) * 100 : 0;
+                                    const count = stats.audits_by_status[status] || 0;
+                                    const pct = stats.total_audits > 0 ? (count / stats.total_audits) * 100 : 0;
                                     return (
                                         <div key={status}>
                                             <div className="flex justify-between text-sm mb-1">
@@ -187,33 +159,26 @@ const DashboardPage: React.FC = () => {
                     </div>
 
                     {/* Overdue actions */}
-                    {stats.overdueActions > 0 && (
+                    {stats.overdue_actions > 0 && (
                         <div className="bg-red-50 rounded-xl p-6 border border-red-200">
                             <h3 className="text-lg font-semibold text-red-800 mb-3 flex items-center gap-2">
                                 <AlertTriangle className="w-5 h-5" />
                                 Überfällige Maßnahmen
                             </h3>
                             <div className="space-y-2">
-                                {allFindings
-                                    .filter(f =>
-                                        f.action_due_date &&
-                                        new Date(f.action_due_date) < new Date() &&
-                                        f.action_status !== 'DONE'
-                                    )
-                                    .slice(0, 5)
-                                    .map(f => (
-                                        <div key={f.id} className="flex items-center justify-between bg-white rounded-lg px-4 py-2 border border-red-100">
-                                            <div>
-                                                <span className="text-sm font-medium text-gray-800">{f.title}</span>
-                                                {f.action_description && (
-                                                    <p className="text-xs text-gray-500 mt-0.5">{f.action_description}</p>
-                                                )}
-                                            </div>
-                                            <span className="text-xs text-red-600 font-medium">
-                                                Fällig: {f.action_due_date ? new Date(f.action_due_date).toLocaleDateString('de-DE') : ''}
-                                            </span>
+                                {stats.overdue_preview.map(f => (
+                                    <div key={f.id} className="flex items-center justify-between bg-white rounded-lg px-4 py-2 border border-red-100">
+                                        <div>
+                                            <span className="text-sm font-medium text-gray-800">{f.title}</span>
+                                            {f.action_description && (
+                                                <p className="text-xs text-gray-500 mt-0.5">{f.action_description}</p>
+                                            )}
                                         </div>
-                                    ))}
+                                        <span className="text-xs text-red-600 font-medium">
+                                            Fällig: {f.action_due_date ? new Date(f.action_due_date).toLocaleDateString('de-DE') : ''}
+                                        </span>
+                                    </div>
+                                ))}
                             </div>
                         </div>
                     )}
@@ -10,6 +10,7 @@ import type { DocumentAnalysis, AnalysisType } from '../services/analysisService
 interface AuditDetailContext {
     audit: Audit;
     setAudit: (audit: Audit) => void;
+    takePreloaded: (section: 'documents') => UploadedDocument[] | undefined;
 }
 
 const FILE_ICONS: Record<string, typeof FileText> = {
@@ -26,7 +27,7 @@ const ANALYSIS_TYPES: { value: AnalysisType; label: string; description: string
 ];
 
 const DocumentsPage: React.FC = () => {
-    const { audit } = useOutletContext<AuditDetailContext>();
+    const { audit, takePreloaded } = useOutletContext<AuditDetailContext>();
     const [documents, setDocuments] = useState<UploadedDocument[]>([]);
     const [loading, setLoading] = useState(true);
     const [uploading, setUploading] = useState(false);
@@ -42,9 +43,31 @@ const DocumentsPage: React.FC = () => {
     const [analysisLoading, setAnalysisLoading] = useState(false);
 
     useEffect(() => {
-        loadDocuments();
+        const preloaded = takePreloaded('documents');
+        if (preloaded) {
+            setDocuments(preloaded);
+            setLoading(false);
+        } else {
+            loadDocuments();
+        }
     }, [audit.id]);
 
+    // Solange Texte noch extrahiert werden, die Liste regelmäßig aktualisieren
+    useEffect(() => {
+        const pending = documents.some(
+            d => d.extraction_status === 'PENDING' || d.extraction_status === 'PROCESSING'
+        );
+        if (!pending) return;
+        const timer = setTimeout(async () => {
+            try {
+                setDocuments(await getDocuments(audit.id));
+            } catch (error) {
+                console.error('Failed to refresh documents', error);
+            }
+        }, 2000);
+        return () => clearTimeout(timer);
+    }, [documents, audit.id]);
+
     const loadDocuments = async () => {
         setLoading(true);
         try {
@@ -185,6 +208,12 @@ const DocumentsPage: React.FC = () => {
                                         <span className="text-xs text-gray-400 flex-shrink-0">
                                             {doc.filename.split('.').pop()?.toUpperCase()}
                                         </span>
+                                        {(doc.extraction_status === 'PENDING' || doc.extraction_status === 'PROCESSING') && (
+                                            <span className="text-xs text-amber-600 flex-shrink-0">Text wird extrahiert…</span>
+                                        )}
+                                        {doc.extraction_status === 'FAILED' && (
+                                            <span className="text-xs text-red-600 flex-shrink-0">Extraktion fehlgeschlagen</span>
+                                        )}
                                     </div>
                                     <div className="flex items-center gap-2 flex-shrink-0">
                                         <span className="text-xs text-gray-400">
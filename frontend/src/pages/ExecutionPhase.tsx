@@ -9,6 +9,7 @@ import type { Finding, FindingCreate } from '../services/findingService';
 interface AuditDetailContext {
     audit: Audit;
     setAudit: (audit: Audit) => void;
+    takePreloaded: (section: 'findings') => Finding[] | undefined;
 }
 
 const SEVERITY_COLORS: Record<string, string> = {
@@ -24,7 +25,7 @@ const SEVERITY_LABELS: Record<string, string> = {
 };
 
 const ExecutionPhase: React.FC = () => {
-    const { audit, setAudit } = useOutletContext<AuditDetailContext>();
+    const { audit, setAudit, takePreloaded } = useOutletContext<AuditDetailContext>();
     const [findings, setFindings] = useState<Finding[]>([]);
     const [loading, setLoading] = useState(true);
     const [showForm, setShowForm] = useState(false);
@@ -32,7 +33,13 @@ const ExecutionPhase: React.FC = () => {
     const [formData, setFormData] = useState<FindingCreate>({ title: '', description: '', severity: 'MEDIUM' });
 
     useEffect(() => {
-        loadFindings();
+        const preloaded = takePreloaded('findings');
+        if (preloaded) {
+            setFindings(preloaded);
+            setLoading(false);
+        } else {
+            loadFindings();
+        }
     }, [audit.id]);
 
     const loadFindings = async () => {
@@ -3,23 +3,34 @@ import { useOutletContext } from 'react-router-dom';
 import { FileBarChart, Download, RefreshCw, Clock } from 'lucide-react';
 import type { Audit } from '../services/auditService';
 import { updateAuditStatus } from '../services/auditService';
-import { generateReport, getReports } from '../services/reportService';
+import { generateReportStream, getReports } from '../services/reportService';
 import type { AuditReport } from '../services/reportService';
 
 interface AuditDetailContext {
     audit: Audit;
     setAudit: (audit: Audit) => void;
+    takePreloaded: (section: 'reports') => AuditReport[] | undefined;
 }
 
 const ReportingPhase: React.FC = () => {
-    const { audit, setAudit } = useOutletContext<AuditDetailContext>();
+    const { audit, setAudit, takePreloaded } = useOutletContext<AuditDetailContext>();
     const [reports, setReports] = useState<AuditReport[]>([]);
     const [loading, setLoading] = useState(true);
     const [generating, setGenerating] = useState(false);
     const [selectedReport, setSelectedReport] = useState<AuditReport | null>(null);
+    const [generateError, setGenerateError] = useState<string | null>(null);
 
     useEffect(() => {
-        loadReports();
+        const preloaded = takePreloaded('reports');
+        if (preloaded) {
+            setReports(preloaded);
+            if (preloaded.length > 0) {
+                setSelectedReport(preloaded[0]);
+            }
+            setLoading(false);
+        } else {
+            loadReports();
+        }
     }, [audit.id]);
 
     const loadReports = async () => {
@@ -39,12 +50,29 @@ const ReportingPhase: React.FC = () => {
 
     const handleGenerate = async (useAi: boolean) => {
         setGenerating(true);
+        setGenerateError(null);
+        const previous = selectedReport;
+        // Entwurf, der während des Streamings live angezeigt wird
+        let draft: AuditReport = {
+            id: 'draft',
+            audit_id: audit.id,
+            version: (reports[0]?.version ?? 0) + 1,
+            content_markdown: '',
+            generated_at: null,
+        };
+        setSelectedReport(draft);
         try {
-            const report = await generateReport(audit.id, useAi);
-            setReports(prev => [report, ...prev]);
+            const report = await generateReportStream(audit.id, useAi, chunk => {
+                draft = { ...draft, content_markdown: (draft.content_markdown || '') + chunk };
+                setSelectedReport(draft);
+            });
+            setReports(prev => report.reused ? prev : [report, ...prev]);
             setSelectedReport(report);
         } catch (error) {
             console.error('Failed to generate report', error);
+            // Der Server speichert abgebrochene Berichte nicht – den Entwurf daher verwerfen
+            setSelectedReport(previous);
+            setGenerateError(error instanceof Error ? error.message : 'Bericht konnte nicht erstellt werden');
         } finally {
             setGenerating(false);
         }
@@ -60,7 +88,8 @@ const ReportingPhase: React.FC = () => {
     };
 
     const handleDownloadMarkdown = () => {
-        if (!selectedReport?.content_markdown) return;
+        // Nur gespeicherte Versionen herunterladen, keinen laufenden Entwurf
+        if (!selectedReport?.content_markdown || selectedReport.id === 'draft') return;
         const blob = new Blob([selectedReport.content_markdown], { type: 'text/markdown' });
         const url = URL.createObjectURL(blob);
         const a = document.createElement('a');
@@ -97,6 +126,12 @@ const ReportingPhase: React.FC = () => {
                 </div>
             </div>
 
+            {generateError && (
+                <div className="mb-4 p-3 bg-red-50 border border-red-200 text-red-700 rounded-lg text-sm">
+                    Bericht konnte nicht erstellt werden: {generateError}
+                </div>
+            )}
+
             {loading ? (
                 <div className="text-center py-8 text-gray-500">Laden...</div>
             ) : reports.length === 0 ? (
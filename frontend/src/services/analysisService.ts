@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { getAllPages } from './pagination';
 
 const API_URL = '/api/analysis';
 
@@ -11,21 +12,76 @@ export interface DocumentAnalysis {
     prompt: string | null;
     result: string | null;
     created_at: string | null;
+    cached?: boolean;
 }
 
 export const analyzeDocument = async (
     fileId: string,
     analysisType: AnalysisType,
     customPrompt?: string,
+    force: boolean = false,
 ): Promise<DocumentAnalysis> => {
     const response = await axios.post(`${API_URL}/document/${fileId}`, {
         analysis_type: analysisType,
         custom_prompt: customPrompt,
+        force,
     });
     return response.data;
 };
 
-export const getAnalyses = async (fileId: string): Promise<DocumentAnalysis[]> => {
-    const response = await axios.get(`${API_URL}/document/${fileId}`);
-    return response.data;
+export const getAnalyses = async (fileId: string): Promise<DocumentAnalysis[]> =>
+    getAllPages<DocumentAnalysis>(`${API_URL}/document/${fileId}`);
+
+export type BatchAnalysisFrame =
+    | { type: 'metadata'; audit_id: number; analysis_type: AnalysisType; total: number }
+    | { type: 'analysis'; filename: string; analysis: DocumentAnalysis }
+    | { type: 'error'; file_id: string; filename: string; error: string }
+    | { type: 'done'; succeeded: number; failed: number; duration_ms: number };
+
+export const analyzeAuditDocuments = async (
+    auditId: number,
+    analysisType: AnalysisType,
+    onFrame: (frame: BatchAnalysisFrame) => void,
+    customPrompt?: string,
+    force: boolean = false,
+): Promise<void> => {
+    const response = await fetch(`${API_URL}/audits/${auditId}`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+            analysis_type: analysisType,
+            custom_prompt: customPrompt,
+            force,
+        }),
+    });
+
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+
+    if (!response.body) throw new Error("No response body");
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            try {
+                onFrame(JSON.parse(line));
+            } catch (e) {
+                console.error("Error parsing stream line:", e, "Line:", line);
+            }
+        }
+    }
 };
@@ -1,4 +1,9 @@
 import axios from 'axios';
+import { getAllPages } from './pagination';
+import type { Finding } from './findingService';
+import type { Risk } from './riskService';
+import type { UploadedDocument } from './documentService';
+import type { AuditReport } from './reportService';
 
 const API_URL = '/api/audits';
 
@@ -30,16 +35,35 @@ export interface AuditCreate {
     responsible_person?: string;
 }
 
-export const getAudits = async (): Promise<Audit[]> => {
-    const response = await axios.get(API_URL);
-    return response.data;
-};
+export type OverviewSection = 'findings' | 'risks' | 'documents' | 'reports';
+export type OverviewExpansion = 'report_content' | 'extracted_text';
+
+export interface AuditOverview extends Audit {
+    findings?: Finding[];
+    risks?: Risk[];
+    documents?: (UploadedDocument & { extracted_text?: string | null })[];
+    reports?: AuditReport[];
+}
+
+export const getAudits = async (): Promise<Audit[]> => getAllPages<Audit>(API_URL);
 
 export const getAudit = async (id: number): Promise<Audit> => {
     const response = await axios.get(`${API_URL}/${id}`);
     return response.data;
 };
 
+export const getAuditOverview = async (
+    id: number,
+    include?: OverviewSection[],
+    expand?: OverviewExpansion[],
+): Promise<AuditOverview> => {
+    const params: Record<string, string> = {};
+    if (include) params.include = include.join(',');
+    if (expand) params.expand = expand.join(',');
+    const response = await axios.get(`${API_URL}/${id}/overview`, { params });
+    return response.data;
+};
+
 export const createAudit = async (audit: AuditCreate): Promise<Audit> => {
     const response = await axios.post(API_URL, audit);
     return response.data;
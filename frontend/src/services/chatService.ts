@@ -18,7 +18,8 @@ export const sendMessage = async (
     message: string,
     sessionId: string | undefined,
     onChunk: (chunk: string) => void,
-    onMetadata: (metadata: any) => void
+    onMetadata: (metadata: any) => void,
+    signal?: AbortSignal
 ): Promise<void> => {
     try {
         console.log('Sending message to:', API_URL);
@@ -34,6 +35,8 @@ export const sendMessage = async (
                 message,
                 session_id: sessionId
             }),
+            // Abbrechen schließt die Verbindung; der Server stoppt dann die KI-Antwort
+            signal,
         });
 
         console.log('Response status:', response.status);
@@ -60,7 +63,6 @@ export const sendMessage = async (
                 if (!line.trim()) continue;
                 try {
                     const data = JSON.parse(line);
-                    console.log('Received:', data);
                     if (data.type === 'metadata') {
                         onMetadata(data);
                     } else if (data.type === 'content') {
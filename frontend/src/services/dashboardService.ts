@@ -0,0 +1,37 @@
+import axios from 'axios';
+
+const API_URL = '/api/dashboard';
+
+export interface OverdueAction {
+    id: string;
+    audit_id: number;
+    title: string;
+    action_description: string | null;
+    action_due_date: string | null;
+}
+
+export interface AuditRollup {
+    audit_id: number;
+    total_findings: number;
+    open_findings: number;
+    high_severity_findings: number;
+    overdue_actions: number;
+}
+
+export interface DashboardStats {
+    total_audits: number;
+    audits_by_status: Record<string, number>;
+    total_findings: number;
+    open_findings: number;
+    findings_by_status: Record<string, number>;
+    findings_by_severity: Record<string, number>;
+    high_severity_findings: number;
+    overdue_actions: number;
+    overdue_preview: OverdueAction[];
+    per_audit: AuditRollup[];
+}
+
+export const getDashboardStats = async (): Promise<DashboardStats> => {
+    const response = await axios.get(`${API_URL}/stats`);
+    return response.data;
+};
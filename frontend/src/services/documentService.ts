@@ -1,15 +1,104 @@
 import axios from 'axios';
+import { getAllPages } from './pagination';
 
 const API_URL = '/api/upload';
 
+export type ExtractionStatus = 'PENDING' | 'PROCESSING' | 'READY' | 'FAILED';
+
 export interface UploadedDocument {
     id: string;
     filename: string;
     content_type: string | null;
+    extraction_status: ExtractionStatus;
     created_at: string | null;
 }
 
+export interface ExtractionStatusResponse {
+    id: string;
+    extraction_status: ExtractionStatus;
+    extraction_error: string | null;
+    text_length: number | null;
+}
+
+// Größere Dateien in Teilen hochladen (nginx begrenzt einzelne Requests auf 50 MB)
+const RESUMABLE_THRESHOLD = 32 * 1024 * 1024;
+const PART_RETRIES = 5;
+
+export interface ResumableUploadState {
+    upload_id: string;
+    status: 'OPEN' | 'COMPLETING' | 'COMPLETED';
+    file_id: string | null;
+    size: number;
+    part_size: number;
+    part_count: number;
+    received_bytes: number;
+    missing_parts: number[];
+}
+
+const sha256Hex = async (data: ArrayBuffer): Promise<string | undefined> => {
+    // crypto.subtle gibt es nur in sicheren Kontexten (HTTPS, localhost)
+    if (!globalThis.crypto?.subtle) return undefined;
+    const digest = await globalThis.crypto.subtle.digest('SHA-256', data);
+    return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+const putPart = async (uploadId: string, partNumber: number, blob: Blob) => {
+    const data = await blob.arrayBuffer();
+    const checksum = await sha256Hex(data);
+    for (let attempt = 1; ; attempt++) {
+        try {
+            await axios.put(`${API_URL}/resumable/${uploadId}/parts/${partNumber}`, data, {
+                headers: {
+                    'Content-Type': 'application/octet-stream',
+                    ...(checksum ? { 'X-Part-SHA256': checksum } : {}),
+                },
+            });
+            return;
+        } catch (error) {
+            if (attempt >= PART_RETRIES) throw error;
+            await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** (attempt - 1)));
+        }
+    }
+};
+
+/**
+ * Fortsetzbarer Upload: mit `uploadId` eines abgebrochenen Uploads werden
+ * nur die noch fehlenden Teile gesendet.
+ */
+export const uploadDocumentResumable = async (
+    auditId: number,
+    file: File,
+    onProgress?: (receivedBytes: number, totalBytes: number) => void,
+    uploadId?: string,
+) => {
+    const state: ResumableUploadState = uploadId
+        ? (await axios.get(`${API_URL}/resumable/${uploadId}`)).data
+        : (
+              await axios.post(`${API_URL}/resumable`, {
+                  audit_id: auditId,
+                  filename: file.name,
+                  size: file.size,
+                  content_type: file.type || null,
+              })
+          ).data;
+
+    let received = state.received_bytes;
+    for (const partNumber of state.missing_parts) {
+        const start = (partNumber - 1) * state.part_size;
+        const blob = file.slice(start, Math.min(start + state.part_size, file.size));
+        await putPart(state.upload_id, partNumber, blob);
+        received += blob.size;
+        onProgress?.(received, file.size);
+    }
+
+    const response = await axios.post(`${API_URL}/resumable/${state.upload_id}/complete`);
+    return response.data;
+};
+
 export const uploadDocument = async (auditId: number, file: File) => {
+    if (file.size > RESUMABLE_THRESHOLD) {
+        return uploadDocumentResumable(auditId, file);
+    }
     const formData = new FormData();
     formData.append('audit_id', auditId.toString());
     formData.append('file', file);
@@ -22,11 +111,19 @@ export const uploadDocument = async (auditId: number, file: File) => {
     return response.data;
 };
 
-export const getDocuments = async (auditId: number): Promise<UploadedDocument[]> => {
-    const response = await axios.get(`${API_URL}/audits/${auditId}`);
+export const getDocuments = async (auditId: number): Promise<UploadedDocument[]> =>
+    getAllPages<UploadedDocument>(`${API_URL}/audits/${auditId}`);
+
+// Der Upload kehrt sofort zurück; der Text wird im Hintergrund extrahiert
+export const getExtractionStatus = async (fileId: string): Promise<ExtractionStatusResponse> => {
+    const response = await axios.get(`${API_URL}/${fileId}/status`);
     return response.data;
 };
 
+// Direkt als src für PDF-Viewer/iframe verwendbar; der Server unterstützt Range-Anfragen
+export const getDocumentContentUrl = (fileId: string, download = false): string =>
+    `${API_URL}/${fileId}/content${download ? '?download=true' : ''}`;
+
 export const deleteDocument = async (fileId: string): Promise<void> => {
     await axios.delete(`${API_URL}/${fileId}`);
 };
@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { getAllPages } from './pagination';
 
 const API_URL = '/api/findings';
 
@@ -32,10 +33,8 @@ export interface FindingUpdate {
     action_status?: string;
 }
 
-export const getFindings = async (auditId: number): Promise<Finding[]> => {
-    const response = await axios.get(`${API_URL}/audits/${auditId}`);
-    return response.data;
-};
+export const getFindings = async (auditId: number): Promise<Finding[]> =>
+    getAllPages<Finding>(`${API_URL}/audits/${auditId}`);
 
 export const getFinding = async (findingId: string): Promise<Finding> => {
     const response = await axios.get(`${API_URL}/${findingId}`);
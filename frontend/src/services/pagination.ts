@@ -0,0 +1,18 @@
+import axios from 'axios';
+
+// Listen-Endpunkte liefern Seiten (Keyset-Pagination); den Cursor der nächsten Seite gibt der Server im Header zurück
+const NEXT_CURSOR_HEADER = 'x-next-cursor';
+const PAGE_SIZE = 500;
+
+export const getAllPages = async <T>(url: string): Promise<T[]> => {
+    const items: T[] = [];
+    let cursor: string | undefined;
+    do {
+        const response = await axios.get<T[]>(url, {
+            params: { limit: PAGE_SIZE, ...(cursor ? { cursor } : {}) },
+        });
+        items.push(...response.data);
+        cursor = response.headers[NEXT_CURSOR_HEADER] || undefined;
+    } while (cursor);
+    return items;
+};
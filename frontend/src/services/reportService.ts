@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { getAllPages } from './pagination';
 
 const API_URL = '/api/reports';
 
@@ -8,24 +9,81 @@ export interface AuditReport {
     version: number;
     content_markdown: string | null;
     generated_at: string | null;
+    reused?: boolean;
 }
 
 export const generateReport = async (
     auditId: number,
     useAi: boolean = true,
+    force: boolean = false,
 ): Promise<AuditReport> => {
     const response = await axios.post(`${API_URL}/audits/${auditId}/generate`, {
         use_ai: useAi,
+        force,
     });
     return response.data;
 };
 
-export const getReports = async (auditId: number): Promise<AuditReport[]> => {
-    const response = await axios.get(`${API_URL}/audits/${auditId}`);
-    return response.data;
-};
+export const getReports = async (auditId: number): Promise<AuditReport[]> =>
+    getAllPages<AuditReport>(`${API_URL}/audits/${auditId}`);
 
 export const getReport = async (reportId: string): Promise<AuditReport> => {
     const response = await axios.get(`${API_URL}/${reportId}`);
     return response.data;
 };
+
+export type ReportStreamFrame =
+    | { type: 'metadata'; audit_id: number; use_ai: boolean }
+    | { type: 'content'; chunk: string }
+    | { type: 'error'; error: string }
+    | { type: 'report'; report: AuditReport };
+
+export const generateReportStream = async (
+    auditId: number,
+    useAi: boolean,
+    onChunk: (chunk: string) => void,
+    force: boolean = false,
+): Promise<AuditReport> => {
+    const response = await fetch(`${API_URL}/audits/${auditId}/generate/stream`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ use_ai: useAi, force }),
+    });
+
+    if (!response.ok) {
+        throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+    }
+
+    if (!response.body) throw new Error("No response body");
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let report: AuditReport | null = null;
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop() || '';
+
+        for (const line of lines) {
+            if (!line.trim()) continue;
+            const frame: ReportStreamFrame = JSON.parse(line);
+            if (frame.type === 'content') {
+                onChunk(frame.chunk);
+            } else if (frame.type === 'report') {
+                report = frame.report;
+            } else if (frame.type === 'error') {
+                throw new Error(frame.error);
+            }
+        }
+    }
+
+    if (!report) throw new Error("Stream ended without report");
+    return report;
+};
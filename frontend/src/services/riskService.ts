@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { getAllPages } from './pagination';
 
 const API_URL = '/api/risks';
 
@@ -19,10 +20,8 @@ export interface RiskCreate {
     likelihood?: string;
 }
 
-export const getRisks = async (auditId: number): Promise<Risk[]> => {
-    const response = await axios.get(`${API_URL}/audits/${auditId}`);
-    return response.data;
-};
+export const getRisks = async (auditId: number): Promise<Risk[]> =>
+    getAllPages<Risk>(`${API_URL}/audits/${auditId}`);
 
 export const createRisk = async (auditId: number, risk: RiskCreate): Promise<Risk> => {
     const response = await axios.post(`${API_URL}/audits/${auditId}`, risk);
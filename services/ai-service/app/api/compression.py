@@ -0,0 +1,154 @@
+"""
+Kompression großer Antworten (Brotli, falls installiert, sonst gzip).
+
+Komprimiert werden nur vollständig vorliegende Antworten (ein einziger
+Body-Block) ab ``minimum_size`` Bytes mit textartigem Content-Type. Gestreamte
+Antworten – insbesondere der NDJSON-Chat-Stream – sowie bereits kodierte oder
+binäre Inhalte (PDF, Office, Bilder, ZIP) laufen unverändert durch.
+"""
+import asyncio
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+# Streams werden nie gepuffert, auch wenn sie als ein Block ankommen
+STREAMING_TYPES = ("application/x-ndjson", "text/event-stream")
+# Größere Bodies in einem Thread komprimieren, um die Event-Loop nicht zu blockieren
+OFFLOAD_SIZE = 256 * 1024
+
+
+def _quality(accept_encoding: str, coding: str) -> float:
+    wildcard = 0.0
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        name = name.strip().lower()
+        if name == coding:
+            return q
+        if name == "*":
+            wildcard = q
+    return wildcard
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """``br`` vor ``gzip``, jeweils nur wenn der Client sie (mit q > 0) akzeptiert."""
+    if not accept_encoding:
+        return None
+    if brotli is not None and _quality(accept_encoding, "br") > 0:
+        return "br"
+    if _quality(accept_encoding, "gzip") > 0:
+        return "gzip"
+    return None
+
+
+def is_compressible(headers: Headers) -> bool:
+    if "content-encoding" in headers:
+        return False
+    # Byte-Bereiche beziehen sich auf die unkomprimierte Datei
+    if "content-range" in headers or "accept-ranges" in headers:
+        return False
+    content_type = headers.get("content-type", "").lower()
+    if content_type.startswith(STREAMING_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES) or "+json" in content_type
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(self, encoding, send))
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+
+class _CompressingSend:
+    """Hält den Response-Start zurück, bis feststeht, ob der Body komprimiert wird."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send) -> None:
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Message] = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if message["status"] in (204, 304) or not is_compressible(headers):
+                # Header sofort senden, damit Streams ohne Verzögerung beginnen
+                self.passthrough = True
+                await self.send(message)
+            else:
+                self.start = message
+            return
+
+        if message["type"] != "http.response.body" or self.start is None:
+            await self.send(message)
+            return
+
+        start, self.start = self.start, None
+        self.passthrough = True
+        headers = MutableHeaders(raw=start["headers"])
+        headers.add_vary_header("Accept-Encoding")
+        body = message.get("body", b"")
+        if message.get("more_body", False) or len(body) < self.middleware.minimum_size:
+            start["headers"] = headers.raw
+            await self.send(start)
+            await self.send(message)
+            return
+
+        if len(body) >= OFFLOAD_SIZE:
+            compressed = await asyncio.to_thread(self.middleware.compress, body, self.encoding)
+        else:
+            compressed = self.middleware.compress(body, self.encoding)
+
+        headers["Content-Encoding"] = self.encoding
+        headers["Content-Length"] = str(len(compressed))
+        start["headers"] = headers.raw
+        await self.send(start)
+        await self.send({"type": "http.response.body", "body": compressed})
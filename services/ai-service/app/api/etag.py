@@ -0,0 +1,77 @@
+"""
+Bedingte GET-Anfragen (ETag / If-None-Match) für Lese-Endpunkte.
+
+Das ETag ist ein schwaches ETag über Primärschlüssel und ``row_version`` der
+ausgelieferten Zeilen. Diese werden vorab mit einer schmalen Abfrage gelesen;
+stimmt das ETag mit ``If-None-Match`` überein, antwortet der Endpunkt mit 304,
+ohne die vollständigen Zeilen zu laden oder zu serialisieren.
+"""
+import hashlib
+import json
+from typing import Any, Optional, Sequence, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Query
+
+from app.api.pagination import TOTAL_COUNT_HEADER, PageKeys, page_keys
+
+ETAG_HEADER = "ETag"
+# Browser dürfen speichern, müssen aber vor jeder Verwendung revalidieren
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    raw = json.dumps(parts, default=str, separators=(",", ":")).encode("utf-8")
+    return f'W/"{hashlib.sha1(raw).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Schwacher Vergleich nach RFC 9110: das Präfix ``W/`` wird ignoriert."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def conditional(request: Request, response: Response, *parts: Any) -> Optional[Response]:
+    """
+    Liefert eine 304-Antwort, wenn der Client den Stand ``parts`` bereits hat.
+
+    Andernfalls werden ETag und Cache-Control an ``response`` gesetzt und
+    ``None`` zurückgegeben; der Endpunkt baut dann die Antwort wie gewohnt.
+    """
+    etag = make_etag(*parts)
+    headers = {ETAG_HEADER: etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+def conditional_page(
+    request: Request,
+    response: Response,
+    name: str,
+    query: Query,
+    sort_columns: Sequence,
+    limit: int,
+    cursor: str | None,
+    version_column=None,
+) -> Tuple[Optional[Response], PageKeys]:
+    """
+    ``conditional`` für eine Seite von ``paginate``.
+
+    Grundlage sind die Gesamtanzahl sowie Schlüssel und Version der Zeilen der
+    Seite (plus der ersten Zeile der Folgeseite, die über den Cursor entscheidet).
+    Bei 304 wird auch ``X-Total-Count`` mitgesendet. Die gelesenen Schlüssel
+    werden mit zurückgegeben, damit ``paginate(..., page=page)`` sie nicht
+    erneut abfragen muss.
+    """
+    page = page_keys(query, sort_columns, limit, cursor, version_column)
+    not_modified = conditional(request, response, name, page.total, [list(k) for k in page.keys])
+    if not_modified is not None:
+        not_modified.headers[TOTAL_COUNT_HEADER] = str(page.total)
+    return not_modified, page
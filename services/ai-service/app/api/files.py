@@ -0,0 +1,156 @@
+"""
+Auslieferung gespeicherter Dateien mit HTTP-Range und bedingten Anfragen.
+
+Starlettes ``FileResponse`` (0.36) überträgt nur ganze Dateien. ``file_response``
+ergänzt:
+- ``Range: bytes=…`` (ein Bereich) -> 206 mit ``Content-Range``, sonst 416,
+- ``If-Range`` (nur bei unverändertem ETag bzw. Last-Modified gilt der Bereich),
+- ``If-None-Match`` / ``If-Modified-Since`` -> 304.
+Die Datei wird blockweise gelesen; unterstützt der Server ``http.response.pathsend``,
+überträgt er ganze Dateien selbst.
+"""
+import mimetypes
+import os
+import re
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+import anyio
+from fastapi import Request, Response
+from starlette.responses import FileResponse
+from starlette.types import Receive, Scope, Send
+
+from app.api.etag import etag_matches
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeFileResponse(FileResponse):
+    """``FileResponse`` für einen einzelnen Byte-Bereich (206 Partial Content)."""
+
+    def __init__(self, path: str, start: int, end: int, stat_result: os.stat_result, **kwargs) -> None:
+        super().__init__(path, status_code=206, stat_result=stat_result, **kwargs)
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        remaining = self.end - self.start + 1
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # Datei wurde während der Übertragung gekürzt
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Ein Bereich als (start, end) inklusive. None bei unerfüllbarem Bereich;
+    mehrere Bereiche werden nicht unterstützt und als ganze Datei beantwortet.
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        raise ValueError(header)
+    first, last = match.groups()
+    if not first and not last:
+        raise ValueError(header)
+    if not first:
+        # Suffix: die letzten n Bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        return None
+    return start, end
+
+
+def guess_media_type(filename: str, stored_type: Optional[str]) -> str:
+    """Gespeicherter Typ des Uploads, sofern aussagekräftig, sonst anhand der Endung."""
+    if stored_type and stored_type not in ("application/octet-stream", "binary/octet-stream"):
+        return stored_type
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    # If-None-Match hat Vorrang; If-Modified-Since nur ohne ETag-Vergleich (RFC 9110, 13.1.3)
+    if request.headers.get("if-none-match"):
+        return etag_matches(request, etag)
+    since = request.headers.get("if-modified-since")
+    if since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def file_response(
+    request: Request,
+    path: str,
+    filename: str,
+    media_type: str,
+    disposition: str = "inline",
+) -> Response:
+    """Ganze Datei (200), Bereich (206), 304 oder 416 – je nach Anfrage-Headern."""
+    stat_result = os.stat(path)
+    full = FileResponse(
+        path,
+        media_type=media_type,
+        filename=filename,
+        stat_result=stat_result,
+        content_disposition_type=disposition,
+        headers={"Accept-Ranges": "bytes", "Cache-Control": "private, no-cache"},
+    )
+    etag = full.headers["etag"]
+    last_modified = full.headers["last-modified"]
+
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return Response(
+            status_code=304,
+            headers={"ETag": etag, "Last-Modified": last_modified, "Accept-Ranges": "bytes"},
+        )
+
+    range_header = request.headers.get("range")
+    if not range_header or "," in range_header:
+        return full
+
+    # If-Range: Bereich nur liefern, wenn der Client noch dieselbe Version hat (starker Vergleich)
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() not in (etag, last_modified):
+        return full
+
+    try:
+        byte_range = parse_range(range_header, stat_result.st_size)
+    except ValueError:
+        return full
+    if byte_range is None:
+        return Response(
+            status_code=416,
+            headers={"Content-Range": f"bytes */{stat_result.st_size}", "Accept-Ranges": "bytes"},
+        )
+
+    start, end = byte_range
+    return RangeFileResponse(
+        path,
+        start,
+        end,
+        stat_result,
+        media_type=media_type,
+        filename=filename,
+        content_disposition_type=disposition,
+        headers={"Accept-Ranges": "bytes", "Cache-Control": "private, no-cache"},
+    )
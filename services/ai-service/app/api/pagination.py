@@ -0,0 +1,132 @@
+"""
+Keyset-Pagination für Listen-Endpunkte.
+
+Der Cursor ist der (base64-kodierte) Primärschlüssel der letzten gelieferten
+Zeile. Die Sortierwerte werden per Subquery aus der Datenbank gelesen, damit
+Zeitstempel nicht über die API hin- und zurückkonvertiert werden müssen.
+"""
+import base64
+import binascii
+import json
+from typing import Any, List, NamedTuple, Optional, Sequence
+
+from fastapi import HTTPException, Response
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Query
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+TOTAL_COUNT_HEADER = "X-Total-Count"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(key: Any) -> str:
+    raw = json.dumps(key).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Any:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Ungültiger Cursor")
+
+
+class PageKeys(NamedTuple):
+    """Ergebnis von ``page_keys``; kann an ``paginate`` weitergereicht werden."""
+
+    total: int
+    keys: List[tuple]
+
+
+def _after_cursor(sort_columns: Sequence, key_column, key: Any):
+    """WHERE-Bedingung für alle Zeilen nach dem Cursor (absteigend sortiert)."""
+    anchors = [
+        select(col).where(key_column == key).scalar_subquery()
+        for col in sort_columns
+    ]
+    clauses = []
+    for i, col in enumerate(sort_columns):
+        equal_prefix = [sort_columns[j] == anchors[j] for j in range(i)]
+        clauses.append(and_(*equal_prefix, col < anchors[i]))
+    return or_(*clauses)
+
+
+def page_keys(
+    query: Query,
+    sort_columns: Sequence,
+    limit: int,
+    cursor: str | None,
+    version_column=None,
+) -> PageKeys:
+    """
+    Gesamtanzahl und (Schlüssel[, Version]) der Zeilen, die ``paginate`` liefern
+    würde, inklusive der ersten Zeile der Folgeseite. Lädt nur diese Spalten.
+    """
+    key_column = sort_columns[-1]
+    total = query.order_by(None).with_entities(func.count(key_column)).scalar() or 0
+
+    if cursor:
+        query = query.filter(_after_cursor(sort_columns, key_column, decode_cursor(cursor)))
+
+    columns = [key_column] if version_column is None else [key_column, version_column]
+    keys = (
+        query.order_by(*[col.desc() for col in sort_columns])
+        .with_entities(*columns)
+        .limit(limit + 1)
+        .all()
+    )
+    return PageKeys(total, [tuple(k) for k in keys])
+
+
+def paginate(
+    query: Query,
+    response: Response,
+    sort_columns: Sequence,
+    limit: int,
+    cursor: str | None,
+    page: Optional[PageKeys] = None,
+) -> List[Any]:
+    """
+    Liefert eine Seite von ``query``, absteigend sortiert nach ``sort_columns``.
+
+    Die letzte Sortierspalte muss der Primärschlüssel sein, damit die
+    Reihenfolge stabil ist. Gesamtanzahl und nächster Cursor werden als
+    Header gesetzt.
+
+    Hat der Endpunkt die Schlüssel der Seite bereits mit ``page_keys`` gelesen
+    (etwa für das ETag), werden nur noch diese Zeilen per Primärschlüssel
+    geladen – ohne erneute Zählung und Cursor-Abfrage.
+    """
+    key_column = sort_columns[-1]
+    order = [col.desc() for col in sort_columns]
+
+    if page is not None:
+        response.headers[TOTAL_COUNT_HEADER] = str(page.total)
+        ids = [key[0] for key in page.keys]
+        if len(ids) > limit:
+            ids = ids[:limit]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(ids[-1])
+        if not ids:
+            return []
+        return query.filter(key_column.in_(ids)).order_by(*order).all()
+
+    total = query.order_by(None).with_entities(func.count(key_column)).scalar()
+    response.headers[TOTAL_COUNT_HEADER] = str(total or 0)
+
+    if cursor:
+        query = query.filter(_after_cursor(sort_columns, key_column, decode_cursor(cursor)))
+
+    rows = (
+        query.order_by(*order)
+        .limit(limit + 1)
+        .all()
+    )
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(rows[-1], key_column.key))
+
+    return rows
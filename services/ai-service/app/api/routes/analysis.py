@@ -1,11 +1,24 @@
-from typing import Optional
+import asyncio
+import hashlib
+import json
+import time
+from typing import Callable, List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
-from app.models.database import get_db, UploadedFile, DocumentAnalysis
+from app.api.etag import conditional_page
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from app.config import settings
+from app.models.database import (
+    get_db, Audit, UploadedFile, UploadedFileText, DocumentAnalysis,
+    EXTRACTION_FAILED, EXTRACTION_PENDING, EXTRACTION_PROCESSING,
+)
+from app.services.ndjson import encode_frame
 from app.services.openai_service import OpenAIService
+from app.services.single_flight import single_flight
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
@@ -13,6 +26,7 @@ router = APIRouter(prefix="/analysis", tags=["analysis"])
 class AnalysisRequest(BaseModel):
     analysis_type: str  # RISK, SUMMARY, COMPLIANCE, CUSTOM
     custom_prompt: Optional[str] = None
+    force: bool = False  # Cache umgehen und neu analysieren
 
 
 class AnalysisRead(BaseModel):
@@ -24,6 +38,142 @@ class AnalysisRead(BaseModel):
     created_at: Optional[str]
 
 
+def _analysis_to_dict(analysis: DocumentAnalysis) -> dict:
+    return {
+        "id": analysis.id,
+        "file_id": analysis.file_id,
+        "analysis_type": analysis.analysis_type,
+        "prompt": analysis.prompt,
+        "result": analysis.result,
+        "created_at": analysis.created_at.isoformat() if analysis.created_at else None,
+    }
+
+
+def _analysis_cache_key(content_hash: str, analysis_type: str, custom_prompt: str, model: str) -> str:
+    """Inhaltsadressierter Schlüssel: gleicher Text + gleiche Anfrage = gleiches Ergebnis."""
+    if analysis_type != "CUSTOM":
+        custom_prompt = ""  # wird vom Prompt-Template ignoriert
+    payload = json.dumps([content_hash, analysis_type, custom_prompt, model], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+VALID_ANALYSIS_TYPES = ("RISK", "SUMMARY", "COMPLIANCE", "CUSTOM")
+
+
+def _validate_analysis_type(analysis_type: str) -> None:
+    if analysis_type not in VALID_ANALYSIS_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ungültiger Analysetyp. Erlaubt: {VALID_ANALYSIS_TYPES}",
+        )
+
+
+def _openai_service() -> OpenAIService:
+    try:
+        return OpenAIService()
+    except RuntimeError:
+        raise HTTPException(status_code=503, detail="OpenAI-Service nicht verfügbar")
+
+
+async def _analyze_file(
+    db: Session,
+    uploaded_file: UploadedFile,
+    request: AnalysisRequest,
+    get_service: Callable[[], OpenAIService],
+) -> dict:
+    """Analysiert eine Datei (mit Ergebnis-Cache) und speichert die DocumentAnalysis."""
+    file_id = uploaded_file.id
+
+    if uploaded_file.extraction_status in (EXTRACTION_PENDING, EXTRACTION_PROCESSING):
+        raise HTTPException(status_code=409, detail="Textextraktion läuft noch")
+    if uploaded_file.extraction_status == EXTRACTION_FAILED:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Textextraktion fehlgeschlagen: {uploaded_file.extraction_error}",
+        )
+
+    # Nur Metadaten des Texts laden; der komprimierte Inhalt wird erst bei einem Cache-Miss gelesen
+    text_meta = (
+        db.query(UploadedFileText.content_hash, UploadedFileText.original_size)
+        .filter(UploadedFileText.file_id == file_id)
+        .first()
+    )
+    if not text_meta or not text_meta.original_size:
+        raise HTTPException(status_code=400, detail="Kein extrahierter Text vorhanden")
+
+    _validate_analysis_type(request.analysis_type)
+
+    content_hash = text_meta.content_hash
+    if not content_hash:
+        content_hash = hashlib.sha256(uploaded_file.extracted_text.encode("utf-8")).hexdigest()
+    cache_key = _analysis_cache_key(
+        content_hash, request.analysis_type, request.custom_prompt or "", settings.openai_model
+    )
+
+    # compute läuft ggf. für mehrere Aufrufer (single_flight) und darf daher weder die
+    # Session noch die Datei-Instanz des ersten Aufrufers verwenden
+    bind = db.get_bind()
+
+    async def compute() -> dict:
+        with Session(bind=bind) as compute_db:
+            if not request.force:
+                cached = (
+                    compute_db.query(DocumentAnalysis)
+                    .filter(DocumentAnalysis.cache_key == cache_key)
+                    .order_by(DocumentAnalysis.created_at.desc())
+                    .first()
+                )
+                if cached:
+                    if cached.file_id != file_id:
+                        # Byte-identisches Dokument in anderer Prüfung: Ergebnis für diese Datei übernehmen
+                        cached = DocumentAnalysis(
+                            file_id=file_id,
+                            analysis_type=request.analysis_type,
+                            prompt=request.custom_prompt,
+                            result=cached.result,
+                            model=cached.model,
+                            cache_key=cache_key,
+                        )
+                        compute_db.add(cached)
+                        compute_db.commit()
+                        compute_db.refresh(cached)
+                    return {**_analysis_to_dict(cached), "cached": True}
+
+            current = compute_db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+            if not current:
+                raise HTTPException(status_code=404, detail="Datei nicht gefunden")
+            extracted_text = current.extracted_text
+
+        # Die Session ist geschlossen; während des LLM-Aufrufs ist keine Verbindung belegt
+        service = get_service()
+        # Identischer Text (auch aus anderen Dateien) wird nur einmal gleichzeitig analysiert
+        run = await single_flight.do(
+            f"analysis-llm:{cache_key}",
+            lambda: service.analyze_document_with_stats(
+                extracted_text=extracted_text,
+                analysis_type=request.analysis_type,
+                custom_prompt=request.custom_prompt or "",
+            ),
+        )
+
+        with Session(bind=bind) as compute_db:
+            analysis = DocumentAnalysis(
+                file_id=file_id,
+                analysis_type=request.analysis_type,
+                prompt=request.custom_prompt,
+                result=run["result"],
+                model=service.model,
+                cache_key=cache_key,
+            )
+            compute_db.add(analysis)
+            compute_db.commit()
+            compute_db.refresh(analysis)
+            return {**_analysis_to_dict(analysis), "cached": False, "stats": run["stats"]}
+
+    # Doppelklicks / parallele Anfragen für dieselbe Datei teilen sich ein Ergebnis
+    return await single_flight.do(f"analysis:{file_id}:{cache_key}:{int(request.force)}", compute)
+
+
 @router.post("/document/{file_id}", status_code=status.HTTP_201_CREATED)
 async def analyze_document(
     file_id: str,
@@ -34,63 +184,116 @@ async def analyze_document(
     if not uploaded_file:
         raise HTTPException(status_code=404, detail="Datei nicht gefunden")
 
-    if not uploaded_file.extracted_text:
-        raise HTTPException(status_code=400, detail="Kein extrahierter Text vorhanden")
+    return await _analyze_file(db, uploaded_file, request, _openai_service)
 
-    valid_types = ("RISK", "SUMMARY", "COMPLIANCE", "CUSTOM")
-    if request.analysis_type not in valid_types:
-        raise HTTPException(status_code=400, detail=f"Ungültiger Analysetyp. Erlaubt: {valid_types}")
 
-    try:
-        service = OpenAIService()
-    except RuntimeError:
-        raise HTTPException(status_code=503, detail="OpenAI-Service nicht verfügbar")
+@router.post("/audits/{audit_id}")
+async def analyze_audit_documents(
+    audit_id: int,
+    request: AnalysisRequest,
+    db: Session = Depends(get_db),
+):
+    """
+    Analysiert alle Dokumente einer Prüfung parallel (höchstens
+    ``settings.analysis_batch_workers`` gleichzeitig) und streamt jedes
+    Ergebnis als NDJSON-Zeile, sobald es vorliegt.
+    """
+    audit = db.query(Audit).filter(Audit.id == audit_id).first()
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit nicht gefunden")
 
-    result = await service.analyze_document(
-        extracted_text=uploaded_file.extracted_text,
-        analysis_type=request.analysis_type,
-        custom_prompt=request.custom_prompt or "",
-    )
+    _validate_analysis_type(request.analysis_type)
 
-    analysis = DocumentAnalysis(
-        file_id=file_id,
-        analysis_type=request.analysis_type,
-        prompt=request.custom_prompt,
-        result=result,
+    # Nur IDs/Dateinamen vorab laden: die Session der Anfrage wird vor dem Streamen
+    # geschlossen. Jeder Worker-Task arbeitet mit einer eigenen Session, damit sich
+    # parallele Abfragen und Commits nicht über die awaits hinweg vermischen.
+    files = (
+        db.query(UploadedFile.id, UploadedFile.filename)
+        .filter(UploadedFile.audit_id == audit_id)
+        .order_by(UploadedFile.created_at.asc(), UploadedFile.id.asc())
+        .all()
     )
-    db.add(analysis)
-    db.commit()
-    db.refresh(analysis)
 
-    return {
-        "id": analysis.id,
-        "file_id": analysis.file_id,
-        "analysis_type": analysis.analysis_type,
-        "prompt": analysis.prompt,
-        "result": analysis.result,
-        "created_at": analysis.created_at.isoformat() if analysis.created_at else None,
-    }
+    services: List[OpenAIService] = []
+
+    def get_service() -> OpenAIService:
+        if not services:
+            services.append(_openai_service())
+        return services[0]
+
+    semaphore = asyncio.Semaphore(max(1, settings.analysis_batch_workers))
+    bind = db.get_bind()
+
+    async def run_one(file_id: str, filename: str) -> dict:
+        async with semaphore:
+            try:
+                with Session(bind=bind) as task_db:
+                    uploaded_file = task_db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+                    if not uploaded_file:
+                        raise HTTPException(status_code=404, detail="Datei nicht gefunden")
+                    analysis = await _analyze_file(task_db, uploaded_file, request, get_service)
+                return {"type": "analysis", "filename": filename, "analysis": analysis}
+            except HTTPException as e:
+                error = e.detail
+            except Exception as e:
+                error = str(e)
+            return {
+                "type": "error",
+                "file_id": file_id,
+                "filename": filename,
+                "error": error,
+            }
+
+    async def generate():
+        started = time.perf_counter()
+        yield encode_frame({
+            "type": "metadata",
+            "audit_id": audit_id,
+            "analysis_type": request.analysis_type,
+            "total": len(files),
+        })
+
+        succeeded = failed = 0
+        tasks = [asyncio.create_task(run_one(f.id, f.filename)) for f in files]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                frame = await next_done
+                if frame["type"] == "analysis":
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield encode_frame(frame)
+        finally:
+            # Client getrennt (Generator geschlossen): ausstehende Analysen nicht weiterlaufen lassen
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+        yield encode_frame({
+            "type": "done",
+            "succeeded": succeeded,
+            "failed": failed,
+            "duration_ms": round((time.perf_counter() - started) * 1000),
+        })
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 
 @router.get("/document/{file_id}")
 def get_analyses(
     file_id: str,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
 ):
-    analyses = (
-        db.query(DocumentAnalysis)
-        .filter(DocumentAnalysis.file_id == file_id)
-        .order_by(DocumentAnalysis.created_at.desc())
-        .all()
-    )
-    return [
-        {
-            "id": a.id,
-            "file_id": a.file_id,
-            "analysis_type": a.analysis_type,
-            "prompt": a.prompt,
-            "result": a.result,
-            "created_at": a.created_at.isoformat() if a.created_at else None,
-        }
-        for a in analyses
-    ]
+    # Analysen werden nie geändert, nur neu angelegt: die IDs genügen als Version
+    query = db.query(DocumentAnalysis).filter(DocumentAnalysis.file_id == file_id)
+    sort_columns = [DocumentAnalysis.created_at, DocumentAnalysis.id]
+    not_modified, page = conditional_page(request, response, "analyses", query, sort_columns, limit, cursor)
+    if not_modified:
+        return not_modified
+
+    analyses = paginate(query, response, sort_columns=sort_columns, limit=limit, cursor=cursor, page=page)
+    return [_analysis_to_dict(a) for a in analyses]
@@ -2,12 +2,18 @@ from typing import List
 from datetime import date, datetime
 from enum import Enum
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
-from app.models.database import Audit
+from app.api.etag import conditional, conditional_page
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from app.api.routes.findings import FindingRead
+from app.api.routes.risks import RiskRead
+from app.models.database import Audit, AuditFinding, AuditReport, Risk, UploadedFile
 from app.models.database import get_db
+from app.services.export import iter_audit_export
 
 
 class AuditStatus(str, Enum):
@@ -63,6 +69,20 @@ class AuditRead(BaseModel):
 
 router = APIRouter(prefix="/audits", tags=["audits"])
 
+OVERVIEW_SECTIONS = ("findings", "risks", "documents", "reports")
+OVERVIEW_EXPANSIONS = ("report_content", "extracted_text")
+
+
+def _parse_list_param(value: str, allowed: tuple, name: str) -> set:
+    items = {v.strip() for v in value.split(",") if v.strip()}
+    unknown = items - set(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ungültige Werte für '{name}': {sorted(unknown)}. Erlaubt: {allowed}",
+        )
+    return items
+
 
 @router.post("", response_model=AuditRead, status_code=status.HTTP_201_CREATED)
 def create_audit(payload: AuditCreate, db: Session = Depends(get_db)) -> Audit:
@@ -84,17 +104,165 @@ def create_audit(payload: AuditCreate, db: Session = Depends(get_db)) -> Audit:
 
 
 @router.get("", response_model=List[AuditRead])
-def list_audits(db: Session = Depends(get_db)) -> List[Audit]:
-    audits = db.query(Audit).order_by(Audit.created_at.desc()).all()
-    return audits
+def list_audits(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+) -> List[Audit]:
+    sort_columns = [Audit.created_at, Audit.id]
+    not_modified, page = conditional_page(
+        request, response, "audits", db.query(Audit), sort_columns, limit, cursor, Audit.row_version
+    )
+    if not_modified:
+        return not_modified
+
+    return paginate(
+        db.query(Audit),
+        response,
+        sort_columns=sort_columns,
+        limit=limit,
+        cursor=cursor,
+        page=page,
+    )
 
 
 @router.get("/{audit_id}", response_model=AuditRead)
-def get_audit(audit_id: int, db: Session = Depends(get_db)) -> Audit:
-    audit = db.query(Audit).filter(Audit.id == audit_id).first()
+def get_audit(
+    audit_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db),
+) -> Audit:
+    version = db.query(Audit.row_version).filter(Audit.id == audit_id).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    not_modified = conditional(request, response, "audit", audit_id, version)
+    if not_modified:
+        return not_modified
+
+    return db.query(Audit).filter(Audit.id == audit_id).first()
+
+
+def _overview_versions(db: Session, audit_id: int, sections: set) -> dict:
+    """Schlüssel und Versionen aller Zeilen, aus denen die Übersicht besteht."""
+    children = {
+        "findings": (AuditFinding.id, AuditFinding.row_version, AuditFinding.audit_id),
+        "risks": (Risk.id, Risk.row_version, Risk.audit_id),
+        "documents": (UploadedFile.id, UploadedFile.row_version, UploadedFile.audit_id),
+        # Berichte werden nie geändert, nur neu angelegt
+        "reports": (AuditReport.id, AuditReport.version, AuditReport.audit_id),
+    }
+    versions = {}
+    for section in sorted(sections):
+        key, version, parent = children[section]
+        rows = db.query(key, version).filter(parent == audit_id).order_by(key).all()
+        versions[section] = [list(row) for row in rows]
+    return versions
+
+
+@router.get("/{audit_id}/overview")
+def get_audit_overview(
+    audit_id: int,
+    request: Request,
+    response: Response,
+    include: str = ",".join(OVERVIEW_SECTIONS),
+    expand: str = "",
+    db: Session = Depends(get_db),
+):
+    """
+    Audit inklusive Feststellungen, Risiken, Dokumenten und Berichten in einem Aufruf.
+
+    Jeder Abschnitt in ``include`` kostet genau eine zusätzliche SELECT-Abfrage.
+    Große Textspalten (Berichtsinhalt, extrahierter Dokumenttext) werden nur
+    geladen, wenn sie über ``expand`` angefordert werden.
+    """
+    sections = _parse_list_param(include, OVERVIEW_SECTIONS, "include")
+    expansions = _parse_list_param(expand, OVERVIEW_EXPANSIONS, "expand")
+
+    version = db.query(Audit.row_version).filter(Audit.id == audit_id).scalar()
+    if version is None:
+        raise HTTPException(status_code=404, detail="Audit not found")
+    not_modified = conditional(
+        request, response, "overview", audit_id, version,
+        sorted(expansions), _overview_versions(db, audit_id, sections),
+    )
+    if not_modified:
+        return not_modified
+
+    options = []
+    if "findings" in sections:
+        options.append(selectinload(Audit.findings))
+    if "risks" in sections:
+        options.append(selectinload(Audit.risks))
+    if "documents" in sections:
+        loader = selectinload(Audit.documents)
+        if "extracted_text" in expansions:
+            loader = loader.selectinload(UploadedFile.text_content)
+        options.append(loader)
+    if "reports" in sections:
+        loader = selectinload(Audit.reports)
+        if "report_content" not in expansions:
+            loader = loader.defer(AuditReport.content_markdown)
+        options.append(loader)
+
+    audit = db.query(Audit).options(*options).filter(Audit.id == audit_id).first()
     if not audit:
         raise HTTPException(status_code=404, detail="Audit not found")
-    return audit
+
+    overview = AuditRead.model_validate(audit).model_dump()
+
+    if "findings" in sections:
+        overview["findings"] = [FindingRead.model_validate(f).model_dump() for f in audit.findings]
+    if "risks" in sections:
+        overview["risks"] = [RiskRead.model_validate(r).model_dump() for r in audit.risks]
+    if "documents" in sections:
+        documents = []
+        for d in audit.documents:
+            item = {
+                "id": d.id,
+                "filename": d.filename,
+                "content_type": d.content_type,
+                "extraction_status": d.extraction_status,
+                "created_at": d.created_at.isoformat() if d.created_at else None,
+            }
+            if "extracted_text" in expansions:
+                item["extracted_text"] = d.extracted_text
+            documents.append(item)
+        overview["documents"] = documents
+    if "reports" in sections:
+        reports = []
+        for r in audit.reports:
+            item = {
+                "id": r.id,
+                "audit_id": r.audit_id,
+                "version": r.version,
+                "generated_at": r.generated_at.isoformat() if r.generated_at else None,
+            }
+            if "report_content" in expansions:
+                item["content_markdown"] = r.content_markdown
+            reports.append(item)
+        overview["reports"] = reports
+
+    return overview
+
+
+@router.get("/{audit_id}/export")
+def export_audit(audit_id: int, db: Session = Depends(get_db)):
+    """
+    Komplettes Audit als ZIP zur Archivierung: Stammdaten, Feststellungen und
+    Risiken (CSV/JSON), alle Berichtsversionen, Original-Uploads und Analysen.
+    Das Archiv wird während der Übertragung erzeugt.
+    """
+    if db.query(Audit.id).filter(Audit.id == audit_id).scalar() is None:
+        raise HTTPException(status_code=404, detail="Audit not found")
+
+    return StreamingResponse(
+        iter_audit_export(db.get_bind(), audit_id),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="audit-{audit_id}-export.zip"'},
+    )
 
 
 @router.patch("/{audit_id}", response_model=AuditRead)
@@ -4,7 +4,7 @@ from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import os
 
-from app.models.database import get_db, Audit
+from app.models.database import get_db
 from app.services.openai_service import OpenAIService
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -30,7 +30,8 @@ async def test_endpoint():
 async def chat(payload: ChatRequest, db: Session = Depends(get_db)):
     """
     RAG-enhanced chat: retrieves relevant document chunks from Weaviate,
-    includes chat history, and streams the OpenAI response.
+    includes chat history, and streams the OpenAI response. The audit context
+    is loaded inside the chat pipeline, concurrently with retrieval.
     """
     import json
 
@@ -48,30 +49,10 @@ async def chat(payload: ChatRequest, db: Session = Depends(get_db)):
             }) + "\n"
         return StreamingResponse(error_stream(), media_type="application/x-ndjson")
 
-    # Build audit context for the system prompt
-    audit_context = ""
     audit_id_str = str(payload.audit_id) if payload.audit_id else "0"
 
-    if payload.audit_id:
-        try:
-            audit_id_int = int(payload.audit_id)
-            audit = db.query(Audit).filter(Audit.id == audit_id_int).first()
-            if audit:
-                parts = [f"Prüfung: {audit.title}"]
-                if audit.audit_type:
-                    parts.append(f"Typ: {audit.audit_type}")
-                if audit.scope:
-                    parts.append(f"Umfang: {audit.scope}")
-                if audit.objectives:
-                    parts.append(f"Ziele: {audit.objectives}")
-                if audit.status:
-                    parts.append(f"Status: {audit.status}")
-                audit_context = "\n".join(parts)
-        except (ValueError, TypeError):
-            pass
-
     try:
-        service = OpenAIService(audit_context=audit_context)
+        service = OpenAIService()
     except RuntimeError:
         async def error_stream():
             yield json.dumps({
@@ -86,12 +67,18 @@ async def chat(payload: ChatRequest, db: Session = Depends(get_db)):
         return StreamingResponse(error_stream(), media_type="application/x-ndjson")
 
     async def generate():
-        async for chunk in service.chat_stream(
+        # Trennt der Client die Verbindung, bricht Starlette diesen Generator ab;
+        # chat_stream schließt dann den OpenAI-Stream und speichert die Teilantwort.
+        stream = service.chat_stream(
             db=db,
             audit_id=audit_id_str,
             session_id=payload.session_id,
             user_message=payload.message,
-        ):
-            yield chunk
+        )
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
 
     return StreamingResponse(generate(), media_type="application/x-ndjson")
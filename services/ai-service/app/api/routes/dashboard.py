@@ -0,0 +1,115 @@
+import time
+from datetime import date
+from typing import Any, Dict
+
+from fastapi import APIRouter, Depends
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.database import Audit, AuditFinding, get_db
+
+router = APIRouter(prefix="/dashboard", tags=["dashboard"])
+
+OVERDUE_PREVIEW_LIMIT = 5
+
+# Kurzlebiger Prozess-Cache für die Kennzahlen (TTL über settings.dashboard_cache_ttl)
+_stats_cache: Dict[str, Any] = {"expires_at": 0.0, "data": None}
+
+
+def _overdue_filter(today: date):
+    return (
+        AuditFinding.action_due_date.isnot(None),
+        AuditFinding.action_due_date < today,
+        or_(AuditFinding.action_status.is_(None), AuditFinding.action_status != "DONE"),
+    )
+
+
+def _compute_stats(db: Session) -> Dict[str, Any]:
+    today = date.today()
+
+    by_status = dict(
+        db.query(Audit.status, func.count(Audit.id)).group_by(Audit.status).all()
+    )
+
+    findings_by_status = dict(
+        db.query(AuditFinding.status, func.count(AuditFinding.id))
+        .group_by(AuditFinding.status)
+        .all()
+    )
+    findings_by_severity = {
+        (severity or "NONE"): count
+        for severity, count in db.query(AuditFinding.severity, func.count(AuditFinding.id))
+        .group_by(AuditFinding.severity)
+        .all()
+    }
+
+    is_overdue = and_(*_overdue_filter(today))
+    per_audit_rows = (
+        db.query(
+            AuditFinding.audit_id,
+            func.count(AuditFinding.id),
+            func.sum(case((AuditFinding.status == "OPEN", 1), else_=0)),
+            func.sum(case((AuditFinding.severity == "HIGH", 1), else_=0)),
+            func.sum(case((is_overdue, 1), else_=0)),
+        )
+        .group_by(AuditFinding.audit_id)
+        .all()
+    )
+    per_audit = [
+        {
+            "audit_id": audit_id,
+            "total_findings": total,
+            "open_findings": int(open_count or 0),
+            "high_severity_findings": int(high_count or 0),
+            "overdue_actions": int(overdue_count or 0),
+        }
+        for audit_id, total, open_count, high_count, overdue_count in per_audit_rows
+    ]
+
+    overdue = (
+        db.query(AuditFinding)
+        .filter(*_overdue_filter(today))
+        .order_by(AuditFinding.action_due_date.asc(), AuditFinding.id.asc())
+        .limit(OVERDUE_PREVIEW_LIMIT)
+        .all()
+    )
+
+    return {
+        "total_audits": sum(by_status.values()),
+        "audits_by_status": by_status,
+        "total_findings": sum(findings_by_status.values()),
+        "open_findings": findings_by_status.get("OPEN", 0),
+        "findings_by_status": findings_by_status,
+        "findings_by_severity": findings_by_severity,
+        "high_severity_findings": findings_by_severity.get("HIGH", 0),
+        "overdue_actions": sum(row["overdue_actions"] for row in per_audit),
+        "overdue_preview": [
+            {
+                "id": f.id,
+                "audit_id": f.audit_id,
+                "title": f.title,
+                "action_description": f.action_description,
+                "action_due_date": f.action_due_date.isoformat() if f.action_due_date else None,
+            }
+            for f in overdue
+        ],
+        "per_audit": per_audit,
+    }
+
+
+@router.get("/stats")
+def get_dashboard_stats(
+    fresh: bool = False,
+    db: Session = Depends(get_db),
+):
+    now = time.monotonic()
+    ttl = settings.dashboard_cache_ttl
+    if not fresh and ttl > 0 and _stats_cache["data"] is not None and now < _stats_cache["expires_at"]:
+        return _stats_cache["data"]
+
+    data = _compute_stats(db)
+    if ttl > 0:
+        _stats_cache["data"] = data
+        _stats_cache["expires_at"] = now + ttl
+    return data
@@ -1,11 +1,14 @@
 from typing import List
 from datetime import date, datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from app.api.etag import conditional, conditional_page
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
 from app.models.database import Audit, AuditFinding, get_db
+from app.services.similarity import SIMILARITY_KINDS, find_similar
 
 
 class FindingBase(BaseModel):
@@ -78,30 +81,77 @@ def create_finding(
 @router.get("/audits/{audit_id}", response_model=List[FindingRead])
 def list_findings_for_audit(
     audit_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
 ) -> List[AuditFinding]:
     audit = db.query(Audit).filter(Audit.id == audit_id).first()
     if not audit:
         raise HTTPException(status_code=404, detail="Audit not found")
 
-    findings = (
-        db.query(AuditFinding)
-        .filter(AuditFinding.audit_id == audit.id)
-        .order_by(AuditFinding.created_at.desc())
-        .all()
+    query = db.query(AuditFinding).filter(AuditFinding.audit_id == audit.id)
+    sort_columns = [AuditFinding.created_at, AuditFinding.id]
+    not_modified, page = conditional_page(
+        request, response, "findings", query, sort_columns, limit, cursor, AuditFinding.row_version
     )
-    return findings
+    if not_modified:
+        return not_modified
+
+    return paginate(query, response, sort_columns=sort_columns, limit=limit, cursor=cursor, page=page)
 
 
 @router.get("/{finding_id}", response_model=FindingRead)
 def get_finding(
     finding_id: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ) -> AuditFinding:
-    finding = db.query(AuditFinding).filter(AuditFinding.id == finding_id).first()
-    if not finding:
+    version = db.query(AuditFinding.row_version).filter(AuditFinding.id == finding_id).scalar()
+    if version is None:
         raise HTTPException(status_code=404, detail="Finding not found")
-    return finding
+    not_modified = conditional(request, response, "finding", finding_id, version)
+    if not_modified:
+        return not_modified
+
+    return db.query(AuditFinding).filter(AuditFinding.id == finding_id).first()
+
+
+@router.get("/{finding_id}/similar")
+def get_similar_findings(
+    finding_id: str,
+    k: int = Query(5, ge=1, le=50),
+    types: str = "finding",
+    include_same_audit: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    Ähnliche Feststellungen (optional auch Risiken) aus anderen Audits, z.B. um
+    Maßnahmenbeschreibungen wiederzuverwenden. ``status`` ist PENDING, solange
+    das Embedding der Feststellung noch berechnet wird.
+    """
+    kinds = [t.strip() for t in types.split(",") if t.strip()]
+    unknown = set(kinds) - set(SIMILARITY_KINDS)
+    if unknown or not kinds:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ungültige Werte für 'types': {sorted(unknown)}. Erlaubt: {SIMILARITY_KINDS}",
+        )
+
+    audit_id = db.query(AuditFinding.audit_id).filter(AuditFinding.id == finding_id).scalar()
+    if audit_id is None:
+        raise HTTPException(status_code=404, detail="Finding not found")
+
+    results = find_similar(
+        db, "finding", finding_id, audit_id, k=k, kinds=kinds, include_same_audit=include_same_audit
+    )
+    return {
+        "finding_id": finding_id,
+        "status": "PENDING" if results is None else "READY",
+        "results": results or [],
+    }
 
 
 @router.patch("/{finding_id}", response_model=FindingRead)
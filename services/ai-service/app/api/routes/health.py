@@ -1,7 +1,38 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from app.services.llm_scheduler import llm_scheduler
+from app.models.database import get_db
+from app.services.indexing import index_worker
+from app.services.ndjson import stream_stats
+from app.services.similarity import embedding_worker
 
 router = APIRouter(tags=["health"])
 
 @router.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "ai-service"}
+
+
+@router.get("/metrics/llm")
+async def llm_metrics():
+    """Warteschlangenlänge, Wartezeiten und Retries des LLM-Schedulers."""
+    return llm_scheduler.metrics()
+
+
+@router.get("/metrics/streams")
+async def stream_metrics():
+    """Frames und Token-Deltas pro gestreamter Antwort (Wirkung der Frame-Bündelung)."""
+    return stream_stats.metrics()
+
+
+@router.get("/metrics/indexing")
+def indexing_metrics(db: Session = Depends(get_db)):
+    """Offene, laufende und fehlgeschlagene Aufträge an den document-service."""
+    return index_worker.metrics(db.get_bind())
+
+
+@router.get("/metrics/similarity")
+def similarity_metrics(db: Session = Depends(get_db)):
+    """Ausstehende und berechnete Embeddings für ähnliche Feststellungen."""
+    return embedding_worker.metrics(db.get_bind())
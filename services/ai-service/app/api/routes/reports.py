@@ -1,37 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import Response
+import hashlib
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from typing import Optional
 
+from app.api.etag import conditional, conditional_page
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
+from app.config import settings
 from app.models.database import (
     get_db, Audit, AuditFinding, Risk, UploadedFile, DocumentAnalysis, AuditReport,
 )
 from app.services.openai_service import OpenAIService
+from app.services.single_flight import single_flight
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 
 class ReportGenerateRequest(BaseModel):
     use_ai: bool = True
+    force: bool = False  # auch bei unveränderten Eingabedaten neu generieren
 
 
-@router.post("/audits/{audit_id}/generate", status_code=status.HTTP_201_CREATED)
-async def generate_report(
-    audit_id: int,
-    request: ReportGenerateRequest,
-    db: Session = Depends(get_db),
-):
-    audit = db.query(Audit).filter(Audit.id == audit_id).first()
-    if not audit:
-        raise HTTPException(status_code=404, detail="Audit nicht gefunden")
+def _report_to_dict(report: AuditReport) -> dict:
+    return {
+        "id": report.id,
+        "audit_id": report.audit_id,
+        "version": report.version,
+        "content_markdown": report.content_markdown,
+        "generated_at": report.generated_at.isoformat() if report.generated_at else None,
+    }
 
-    findings = db.query(AuditFinding).filter(AuditFinding.audit_id == audit_id).all()
-    risks = db.query(Risk).filter(Risk.audit_id == audit_id).all()
-    documents = db.query(UploadedFile).filter(UploadedFile.audit_id == audit_id).all()
 
-    # Build report data
-    report_data = {
+def _build_report_data(db: Session, audit: Audit) -> dict:
+    # Feste Reihenfolge, damit der Fingerprint der Daten stabil bleibt
+    findings = (
+        db.query(AuditFinding)
+        .filter(AuditFinding.audit_id == audit.id)
+        .order_by(AuditFinding.created_at.asc(), AuditFinding.id.asc())
+        .all()
+    )
+    risks = (
+        db.query(Risk)
+        .filter(Risk.audit_id == audit.id)
+        .order_by(Risk.created_at.asc(), Risk.id.asc())
+        .all()
+    )
+    document_names = [
+        name
+        for (name,) in db.query(UploadedFile.filename)
+        .filter(UploadedFile.audit_id == audit.id)
+        .order_by(UploadedFile.created_at.asc(), UploadedFile.id.asc())
+    ]
+
+    return {
         "title": audit.title,
         "description": audit.description,
         "status": audit.status,
@@ -62,20 +86,44 @@ async def generate_report(
             }
             for r in risks
         ],
-        "documents_count": len(documents),
-        "document_names": [d.filename for d in documents],
+        "documents_count": len(document_names),
+        "document_names": document_names,
     }
 
-    # Generate report content
-    if request.use_ai:
-        try:
-            service = OpenAIService()
-            content_markdown = await service.generate_report(report_data)
-        except Exception as e:
-            content_markdown = _build_manual_report(report_data)
-    else:
-        content_markdown = _build_manual_report(report_data)
 
+def _report_fingerprint(report_data: dict, use_ai: bool) -> str:
+    canonical = json.dumps(
+        {
+            "data": report_data,
+            "use_ai": use_ai,
+            "model": settings.openai_model if use_ai else None,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _find_reusable_report(db: Session, audit_id: int, input_hash: str) -> AuditReport | None:
+    """Neueste Version, falls sie aus denselben Eingabedaten erzeugt wurde."""
+    latest = (
+        db.query(AuditReport)
+        .filter(AuditReport.audit_id == audit_id)
+        .order_by(AuditReport.version.desc())
+        .first()
+    )
+    if latest and latest.input_hash == input_hash:
+        return latest
+    return None
+
+
+def _save_report(
+    db: Session,
+    audit_id: int,
+    content_markdown: str,
+    input_hash: str | None = None,
+) -> AuditReport:
     # Determine version
     existing_count = (
         db.query(AuditReport)
@@ -87,59 +135,162 @@ async def generate_report(
         audit_id=audit_id,
         version=existing_count + 1,
         content_markdown=content_markdown,
+        input_hash=input_hash,
     )
     db.add(report)
     db.commit()
     db.refresh(report)
+    return report
 
-    return {
-        "id": report.id,
-        "audit_id": report.audit_id,
-        "version": report.version,
-        "content_markdown": report.content_markdown,
-        "generated_at": report.generated_at.isoformat() if report.generated_at else None,
-    }
+
+@router.post("/audits/{audit_id}/generate", status_code=status.HTTP_201_CREATED)
+async def generate_report(
+    audit_id: int,
+    request: ReportGenerateRequest,
+    db: Session = Depends(get_db),
+):
+    audit = db.query(Audit).filter(Audit.id == audit_id).first()
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit nicht gefunden")
+
+    # Build report data
+    report_data = _build_report_data(db, audit)
+    requested_hash = _report_fingerprint(report_data, request.use_ai)
+
+    async def compute() -> dict:
+        if not request.force:
+            reusable = _find_reusable_report(db, audit_id, requested_hash)
+            if reusable:
+                return {**_report_to_dict(reusable), "reused": True}
+
+        # Generate report content
+        used_ai = False
+        if request.use_ai:
+            try:
+                service = OpenAIService()
+                content_markdown = await service.generate_report(report_data)
+                used_ai = True
+            except Exception as e:
+                content_markdown = _build_manual_report(report_data)
+        else:
+            content_markdown = _build_manual_report(report_data)
+
+        report = _save_report(db, audit_id, content_markdown, _report_fingerprint(report_data, used_ai))
+        return {**_report_to_dict(report), "reused": False}
+
+    # Gleichzeitige identische Anfragen (Doppelklick, zwei Prüfer) erzeugen nur eine Version
+    return await single_flight.do(f"report:{audit_id}:{requested_hash}:{int(request.force)}", compute)
+
+
+@router.post("/audits/{audit_id}/generate/stream")
+async def generate_report_stream(
+    audit_id: int,
+    request: ReportGenerateRequest,
+    db: Session = Depends(get_db),
+):
+    """
+    Wie ``generate_report``, liefert den Bericht aber als NDJSON-Stream
+    (gleiches Format wie der Chat): ``metadata``, dann ``content``-Chunks,
+    zum Abschluss ``report`` mit dem gespeicherten AuditReport.
+    """
+    audit = db.query(Audit).filter(Audit.id == audit_id).first()
+    if not audit:
+        raise HTTPException(status_code=404, detail="Audit nicht gefunden")
+
+    report_data = _build_report_data(db, audit)
+
+    reusable = None
+    if not request.force:
+        reusable = _find_reusable_report(db, audit_id, _report_fingerprint(report_data, request.use_ai))
+    if reusable:
+        report = _report_to_dict(reusable)
+
+        async def replay():
+            yield json.dumps({"type": "metadata", "audit_id": audit_id, "use_ai": request.use_ai}) + "\n"
+            yield json.dumps({"type": "content", "chunk": report["content_markdown"] or ""}) + "\n"
+            yield json.dumps({"type": "report", "report": {**report, "reused": True}}) + "\n"
+
+        return StreamingResponse(replay(), media_type="application/x-ndjson")
+
+    service = None
+    if request.use_ai:
+        try:
+            service = OpenAIService()
+        except RuntimeError:
+            service = None
+
+    # Die Session der Anfrage ist geschlossen, bevor der Body läuft; gespeichert wird mit eigener Session
+    bind = db.get_bind()
+
+    async def generate():
+        yield json.dumps({"type": "metadata", "audit_id": audit_id, "use_ai": service is not None}) + "\n"
+
+        parts = []
+        used_ai = False
+        if service is not None:
+            try:
+                async for chunk in service.generate_report_stream(report_data):
+                    parts.append(chunk)
+                    yield json.dumps({"type": "content", "chunk": chunk}) + "\n"
+            except Exception as e:
+                if parts:
+                    # Teilweise gestreamten Bericht nicht als neue Version speichern
+                    yield json.dumps({
+                        "type": "error",
+                        "error": f"Fehler bei der Berichtserstellung: {str(e)}",
+                    }) + "\n"
+                    return
+            used_ai = bool(parts)
+
+        if not parts:
+            manual = _build_manual_report(report_data)
+            parts.append(manual)
+            yield json.dumps({"type": "content", "chunk": manual}) + "\n"
+
+        with Session(bind=bind) as save_db:
+            report = _save_report(save_db, audit_id, "".join(parts), _report_fingerprint(report_data, used_ai))
+            saved = _report_to_dict(report)
+        yield json.dumps({"type": "report", "report": {**saved, "reused": False}}) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 
 @router.get("/audits/{audit_id}")
 def get_reports(
     audit_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
 ):
-    reports = (
-        db.query(AuditReport)
-        .filter(AuditReport.audit_id == audit_id)
-        .order_by(AuditReport.version.desc())
-        .all()
-    )
-    return [
-        {
-            "id": r.id,
-            "audit_id": r.audit_id,
-            "version": r.version,
-            "content_markdown": r.content_markdown,
-            "generated_at": r.generated_at.isoformat() if r.generated_at else None,
-        }
-        for r in reports
-    ]
+    # Berichte werden nie geändert, nur neu angelegt: die IDs genügen als Version
+    query = db.query(AuditReport).filter(AuditReport.audit_id == audit_id)
+    sort_columns = [AuditReport.version, AuditReport.id]
+    not_modified, page = conditional_page(request, response, "reports", query, sort_columns, limit, cursor)
+    if not_modified:
+        return not_modified
+
+    reports = paginate(query, response, sort_columns=sort_columns, limit=limit, cursor=cursor, page=page)
+    return [_report_to_dict(r) for r in reports]
 
 
 @router.get("/{report_id}")
 def get_report(
     report_id: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ):
-    report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
-    if not report:
+    exists = db.query(AuditReport.id).filter(AuditReport.id == report_id).scalar()
+    if not exists:
         raise HTTPException(status_code=404, detail="Bericht nicht gefunden")
+    not_modified = conditional(request, response, "report", report_id)
+    if not_modified:
+        return not_modified
 
-    return {
-        "id": report.id,
-        "audit_id": report.audit_id,
-        "version": report.version,
-        "content_markdown": report.content_markdown,
-        "generated_at": report.generated_at.isoformat() if report.generated_at else None,
-    }
+    report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
+    return _report_to_dict(report)
 
 
 def _build_manual_report(data: dict) -> str:
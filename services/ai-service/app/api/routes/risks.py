@@ -1,10 +1,12 @@
 from typing import List
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
+from app.api.etag import conditional, conditional_page
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
 from app.models.database import Audit, Risk, get_db
 
 
@@ -68,30 +70,42 @@ def create_risk(
 @router.get("/audits/{audit_id}", response_model=List[RiskRead])
 def list_risks_for_audit(
     audit_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
 ) -> List[Risk]:
     audit = db.query(Audit).filter(Audit.id == audit_id).first()
     if not audit:
         raise HTTPException(status_code=404, detail="Audit not found")
 
-    risks = (
-        db.query(Risk)
-        .filter(Risk.audit_id == audit.id)
-        .order_by(Risk.created_at.desc())
-        .all()
+    query = db.query(Risk).filter(Risk.audit_id == audit.id)
+    sort_columns = [Risk.created_at, Risk.id]
+    not_modified, page = conditional_page(
+        request, response, "risks", query, sort_columns, limit, cursor, Risk.row_version
     )
-    return risks
+    if not_modified:
+        return not_modified
+
+    return paginate(query, response, sort_columns=sort_columns, limit=limit, cursor=cursor, page=page)
 
 
 @router.get("/{risk_id}", response_model=RiskRead)
 def get_risk(
     risk_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
 ) -> Risk:
-    risk = db.query(Risk).filter(Risk.id == risk_id).first()
-    if not risk:
+    version = db.query(Risk.row_version).filter(Risk.id == risk_id).scalar()
+    if version is None:
         raise HTTPException(status_code=404, detail="Risk not found")
-    return risk
+    not_modified = conditional(request, response, "risk", risk_id, version)
+    if not_modified:
+        return not_modified
+
+    return db.query(Risk).filter(Risk.id == risk_id).first()
 
 
 @router.patch("/{risk_id}", response_model=RiskRead)
@@ -0,0 +1,40 @@
+import time
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.models.database import SEARCH_KINDS, get_db
+from app.services.search import search
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+@router.get("")
+def search_all(
+    q: str = Query(..., min_length=2, max_length=200),
+    audit_id: int | None = None,
+    types: str = ",".join(SEARCH_KINDS),
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    """
+    Volltextsuche über Feststellungen, Risiken, Berichte und Dokumenttexte.
+
+    ``types`` schränkt die Arten ein (kommagetrennt), ``audit_id`` auf ein Audit.
+    Titel und Ausschnitt sind HTML-escaped, Fundstellen mit ``<mark>`` markiert.
+    """
+    kinds = [t.strip() for t in types.split(",") if t.strip()]
+    unknown = set(kinds) - set(SEARCH_KINDS)
+    if unknown or not kinds:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Ungültige Werte für 'types': {sorted(unknown)}. Erlaubt: {SEARCH_KINDS}",
+        )
+
+    started = time.perf_counter()
+    results = search(db, q, audit_id=audit_id, kinds=kinds, limit=limit)
+    return {
+        "query": q,
+        "results": results,
+        "took_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
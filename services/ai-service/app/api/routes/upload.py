@@ -1,60 +1,58 @@
+import hashlib
 import os
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, Query, Request, Response, status
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
+from app.api.etag import conditional_page
+from app.api.files import file_response, guess_media_type
+from app.api.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate
 from app.config import settings
-from app.models.database import Audit, ChatSession, UploadedFile, get_db
-
-from pypdf import PdfReader
-try:
-    from docx import Document as DocxDocument
-except ImportError:
-    DocxDocument = None
-try:
-    from openpyxl import load_workbook
-except ImportError:
-    load_workbook = None
+from app.models.database import (
+    Audit, ChatSession, UploadedFile, UploadedFileText, EXTRACTION_PENDING, generate_uuid, get_db,
+)
+from app.services.extraction import artifact_path
+from app.services.extraction_jobs import extraction_queue
+from app.services.indexing import enqueue_deindex, index_worker
+from app.services.resumable_upload import (
+    UploadError,
+    abort_upload,
+    complete_upload,
+    create_upload,
+    get_upload,
+    stored_path,
+    upload_state,
+    write_part,
+)
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
 os.makedirs(settings.upload_dir, exist_ok=True)
 
 
-def _extract_text_from_file(path: str, content_type: str, filename: str) -> str:
-    text = ""
+class ResumableUploadCreate(BaseModel):
+    audit_id: int
+    filename: str = Field(..., min_length=1, max_length=512)
+    size: int = Field(..., ge=0)
+    content_type: str | None = None
+    session_id: str | None = None
+    sha256: str | None = Field(None, pattern="^[0-9a-fA-F]{64}$")
 
-    if content_type == "application/pdf" or filename.lower().endswith(".pdf"):
-        reader = PdfReader(path)
-        parts = []
-        for page in reader.pages:
-            parts.append(page.extract_text() or "")
-        text = "\n".join(parts)
 
-    elif filename.lower().endswith(".docx") and DocxDocument:
-        doc = DocxDocument(path)
-        parts = [p.text for p in doc.paragraphs if p.text]
-        text = "\n".join(parts)
+class ResumableUploadComplete(BaseModel):
+    sha256: str | None = Field(None, pattern="^[0-9a-fA-F]{64}$")
 
-    elif (filename.lower().endswith(".xlsx") or filename.lower().endswith(".xlsm")) and load_workbook:
-        wb = load_workbook(path, data_only=True)
-        parts = []
-        for sheet in wb.worksheets:
-            for row in sheet.iter_rows(values_only=True):
-                row_vals = [str(v) for v in row if v is not None]
-                if row_vals:
-                    parts.append(" | ".join(row_vals))
-        text = "\n".join(parts)
 
-    else:
-        try:
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-        except Exception:
-            text = ""
-
-    return text
+def _uploaded_response(uploaded: UploadedFile) -> dict:
+    return {
+        "id": uploaded.id,
+        "audit_id": uploaded.audit_id,
+        "session_id": uploaded.session_id,
+        "filename": uploaded.filename,
+        "extraction_status": uploaded.extraction_status,
+    }
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
@@ -82,55 +80,173 @@ async def upload_file(
         db.refresh(session)
 
     # Datei speichern
-    audit_dir = os.path.join(settings.upload_dir, str(audit.id))
-    os.makedirs(audit_dir, exist_ok=True)
-
-    file_path = os.path.join(audit_dir, file.filename)
+    file_id = generate_uuid()
+    file_path = stored_path(audit.id, file_id, file.filename)
     with open(file_path, "wb") as f:
         content = await file.read()
         f.write(content)
-
-    # Text extrahieren
-    extracted_text = _extract_text_from_file(
-        path=file_path,
-        content_type=file.content_type or "",
-        filename=file.filename,
-    )
+    file_hash = hashlib.sha256(content).hexdigest()
 
     uploaded = UploadedFile(
+        id=file_id,
         audit_id=audit.id,
         session_id=session.id,
         filename=file.filename,
         content_type=file.content_type,
         stored_path=file_path,
-        extracted_text=extracted_text,
+        file_hash=file_hash,
+        extraction_status=EXTRACTION_PENDING,
     )
     db.add(uploaded)
     db.commit()
     db.refresh(uploaded)
 
+    # Text extrahieren: im Worker-Pool, damit große PDFs den Event-Loop nicht blockieren
+    extraction_queue.submit(uploaded.id, db.get_bind())
+
+    return _uploaded_response(uploaded)
+
+
+# --- Fortsetzbare Uploads: anlegen, Teile senden, Stand abfragen, abschließen ---
+
+
+@router.post("/resumable", status_code=status.HTTP_201_CREATED)
+def create_resumable_upload(payload: ResumableUploadCreate, db: Session = Depends(get_db)):
+    try:
+        upload = create_upload(db, **payload.model_dump())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return upload_state(upload)
+
+
+@router.get("/resumable/{upload_id}")
+def get_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    try:
+        return upload_state(get_upload(db, upload_id))
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+@router.put("/resumable/{upload_id}/parts/{part_number}")
+async def put_resumable_part(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    part_sha256: str | None = Header(None, alias="X-Part-SHA256"),
+    db: Session = Depends(get_db),
+):
+    """Rohdaten des Teils im Body; ``X-Part-SHA256`` (hex) wird gegen die empfangenen Bytes geprüft."""
+    # Nur die Engine weitergeben: die Session der Anfrage belegt so keine Verbindung,
+    # solange der Body empfangen wird (write_part öffnet eigene, kurze Sessions)
+    try:
+        return await write_part(db.get_bind(), upload_id, part_number, request.stream(), part_sha256)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+@router.post("/resumable/{upload_id}/complete")
+def complete_resumable_upload(
+    upload_id: str,
+    payload: ResumableUploadComplete | None = None,
+    db: Session = Depends(get_db),
+):
+    try:
+        uploaded, completed = complete_upload(db, upload_id, payload.sha256 if payload else None)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    if completed:
+        extraction_queue.submit(uploaded.id, db.get_bind())
+    return _uploaded_response(uploaded)
+
+
+@router.delete("/resumable/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+def abort_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    try:
+        abort_upload(db, upload_id)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+@router.get("/{file_id}/status")
+def get_extraction_status(
+    file_id: str,
+    db: Session = Depends(get_db),
+):
+    uploaded = (
+        db.query(UploadedFile.id, UploadedFile.extraction_status, UploadedFile.extraction_error)
+        .filter(UploadedFile.id == file_id)
+        .first()
+    )
+    if not uploaded:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    text_length = (
+        db.query(UploadedFileText.original_size)
+        .filter(UploadedFileText.file_id == file_id)
+        .scalar()
+    )
     return {
         "id": uploaded.id,
-        "audit_id": uploaded.audit_id,
-        "session_id": uploaded.session_id,
-        "filename": uploaded.filename,
+        "extraction_status": uploaded.extraction_status,
+        "extraction_error": uploaded.extraction_error,
+        "text_length": text_length,
     }
 
 
+@router.get("/{file_id}/content")
+def get_file_content(
+    file_id: str,
+    request: Request,
+    download: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    Originaldatei ausliefern, mit Range-Unterstützung (PDF-Viewer laden
+    Seiten bei Bedarf) und bedingten Anfragen über ETag/Last-Modified.
+    """
+    uploaded = (
+        db.query(UploadedFile.filename, UploadedFile.content_type, UploadedFile.stored_path)
+        .filter(UploadedFile.id == file_id)
+        .first()
+    )
+    if not uploaded:
+        raise HTTPException(status_code=404, detail="File not found")
+    if not uploaded.stored_path or not os.path.isfile(uploaded.stored_path):
+        raise HTTPException(status_code=404, detail="Datei nicht mehr vorhanden")
+
+    return file_response(
+        request,
+        uploaded.stored_path,
+        filename=uploaded.filename,
+        media_type=guess_media_type(uploaded.filename, uploaded.content_type),
+        disposition="attachment" if download else "inline",
+    )
+
+
 @router.get("/audits/{audit_id}")
 def list_files_for_audit(
     audit_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     db: Session = Depends(get_db),
 ):
     audit = db.query(Audit).filter(Audit.id == audit_id).first()
     if not audit:
         raise HTTPException(status_code=404, detail="Audit not found")
 
-    files: List[UploadedFile] = (
-        db.query(UploadedFile)
-        .filter(UploadedFile.audit_id == audit.id)
-        .order_by(UploadedFile.created_at.desc())
-        .all()
+    query = db.query(UploadedFile).filter(UploadedFile.audit_id == audit.id)
+    sort_columns = [UploadedFile.created_at, UploadedFile.id]
+    not_modified, page = conditional_page(
+        request, response, "files", query, sort_columns, limit, cursor, UploadedFile.row_version
+    )
+    if not_modified:
+        return not_modified
+
+    files: List[UploadedFile] = paginate(
+        query, response, sort_columns=sort_columns, limit=limit, cursor=cursor, page=page
     )
 
     return [
@@ -138,6 +254,7 @@ def list_files_for_audit(
             "id": f.id,
             "filename": f.filename,
             "content_type": f.content_type,
+            "extraction_status": f.extraction_status,
             "created_at": f.created_at.isoformat() if f.created_at else None,
         }
         for f in files
@@ -157,5 +274,19 @@ def delete_file(
     if uploaded.stored_path and os.path.exists(uploaded.stored_path):
         os.remove(uploaded.stored_path)
 
+    # Gemeinsames Extraktionsergebnis entfernen, wenn keine andere Datei denselben Inhalt hat
+    if uploaded.file_hash:
+        shared = (
+            db.query(UploadedFile.id)
+            .filter(UploadedFile.file_hash == uploaded.file_hash, UploadedFile.id != uploaded.id)
+            .first()
+        )
+        artifact = artifact_path(settings.upload_dir, uploaded.file_hash)
+        if not shared and os.path.exists(artifact):
+            os.remove(artifact)
+
+    # Vektoren im document-service asynchron entfernen
+    enqueue_deindex(db, uploaded)
     db.delete(uploaded)
     db.commit()
+    index_worker.notify(db.get_bind())
@@ -12,6 +12,30 @@ class Settings(BaseSettings):
     openai_model: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
     openai_embedding_model: str = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-large")
 
+    # Chat: Token-Budget für den Prompt und Verdichtung älterer Nachrichten
+    chat_context_token_budget: int = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000"))
+    chat_retrieval_token_share: float = float(os.getenv("CHAT_RETRIEVAL_TOKEN_SHARE", "0.5"))
+    chat_history_token_budget: int = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+    # Chat-Stream: Token-Deltas sammeln, bis die Zeit (ms) oder Zeichenzahl erreicht ist (0 ms = jedes Delta einzeln)
+    chat_stream_flush_ms: float = float(os.getenv("CHAT_STREAM_FLUSH_MS", "30"))
+    chat_stream_flush_chars: int = int(os.getenv("CHAT_STREAM_FLUSH_CHARS", "256"))
+
+    # LLM-Scheduler: globale Nebenläufigkeit, Limits pro Aufruftyp, Tokens/Minute (0 = unbegrenzt)
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    llm_chat_concurrency: int = int(os.getenv("LLM_CHAT_CONCURRENCY", "6"))
+    llm_summary_concurrency: int = int(os.getenv("LLM_SUMMARY_CONCURRENCY", "2"))
+    llm_report_concurrency: int = int(os.getenv("LLM_REPORT_CONCURRENCY", "2"))
+    llm_analysis_concurrency: int = int(os.getenv("LLM_ANALYSIS_CONCURRENCY", "4"))
+    llm_tokens_per_minute: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "5"))
+    llm_backoff_base: float = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+    llm_backoff_max: float = float(os.getenv("LLM_BACKOFF_MAX", "30.0"))
+
+    # Dokumentanalyse: lange Dokumente werden abschnittsweise analysiert (Map-Reduce)
+    analysis_section_tokens: int = int(os.getenv("ANALYSIS_SECTION_TOKENS", "6000"))
+    analysis_max_concurrency: int = int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "4"))
+    analysis_batch_workers: int = int(os.getenv("ANALYSIS_BATCH_WORKERS", "4"))
+
     # Database
     database_url: str = os.getenv("DATABASE_URL", "sqlite:///./data/chatbot.db")
 
@@ -23,8 +47,37 @@ class Settings(BaseSettings):
     # Frontend / CORS
     frontend_url: str = os.getenv("FRONTEND_URL", "http://localhost:4173")
 
+    # HTTP-Kompression (gzip, Brotli falls installiert) für Antworten ab dieser Größe in Bytes
+    compression_min_size: int = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+    compression_gzip_level: int = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+    compression_brotli_quality: int = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+    # Dashboard
+    dashboard_cache_ttl: float = float(os.getenv("DASHBOARD_CACHE_TTL", "15"))
+
     # Files
     upload_dir: str = os.getenv("UPLOAD_DIR", "./data/uploads")
+    # Textextraktion im Hintergrund: Anzahl Worker, "process" (Standard) oder "thread"
+    extraction_workers: int = int(os.getenv("EXTRACTION_WORKERS", "2"))
+    extraction_executor: str = os.getenv("EXTRACTION_EXECUTOR", "process")
+    # Fortsetzbare Uploads: Teilgröße und Höchstgröße in Bytes, Gültigkeit unvollständiger Uploads in Stunden
+    upload_part_size: int = int(os.getenv("UPLOAD_PART_SIZE", str(8 * 1024 * 1024)))
+    upload_max_size: int = int(os.getenv("UPLOAD_MAX_SIZE", str(20 * 1024 ** 3)))
+    upload_expiry_hours: float = float(os.getenv("UPLOAD_EXPIRY_HOURS", "24"))
+
+    # Indexierung im document-service: Worker, Retries mit Backoff (Sekunden), Timeout pro Aufruf
+    document_service_url: str = os.getenv("DOCUMENT_SERVICE_URL", "http://document-service:8000")
+    index_worker_enabled: bool = os.getenv("INDEX_WORKER_ENABLED", "true").lower() == "true"
+    index_workers: int = int(os.getenv("INDEX_WORKERS", "2"))
+    index_max_attempts: int = int(os.getenv("INDEX_MAX_ATTEMPTS", "8"))
+    index_backoff_base: float = float(os.getenv("INDEX_BACKOFF_BASE", "2.0"))
+    index_backoff_max: float = float(os.getenv("INDEX_BACKOFF_MAX", "300"))
+    index_request_timeout: float = float(os.getenv("INDEX_REQUEST_TIMEOUT", "120"))
+
+    # Ähnliche Feststellungen: Embeddings im Hintergrund, gekürzt auf diese Dimension
+    similarity_worker_enabled: bool = os.getenv("SIMILARITY_WORKER_ENABLED", "true").lower() == "true"
+    similarity_dimensions: int = int(os.getenv("SIMILARITY_DIMENSIONS", "256"))
+    similarity_batch_size: int = int(os.getenv("SIMILARITY_BATCH_SIZE", "64"))
 
     class Config:
         env_file = ".env"
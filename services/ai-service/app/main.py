@@ -3,8 +3,14 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.models.database import init_db
-from app.api.routes import audits, findings, chat, upload, health, risks, analysis, reports
+from app.api.compression import CompressionMiddleware
+from app.config import settings
+from app.models.database import engine, init_db
+from app.services.extraction_jobs import extraction_queue
+from app.services.indexing import index_worker
+from app.services.search import backfill as backfill_search_index
+from app.services.similarity import backfill as backfill_embeddings, embedding_worker
+from app.api.routes import audits, findings, chat, upload, health, risks, analysis, reports, dashboard, search
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,6 +24,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "X-Next-Cursor", "ETag", "Content-Range", "Accept-Ranges"],
+)
+
+# Große JSON-Antworten komprimieren (Streams und Binärdateien ausgenommen)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compression_min_size,
+    gzip_level=settings.compression_gzip_level,
+    brotli_quality=settings.compression_brotli_quality,
 )
 
 # Router registrieren
@@ -29,6 +44,8 @@ app.include_router(chat.router, prefix="/api")
 app.include_router(upload.router, prefix="/api")
 app.include_router(analysis.router, prefix="/api")
 app.include_router(reports.router, prefix="/api")
+app.include_router(dashboard.router, prefix="/api")
+app.include_router(search.router, prefix="/api")
 
 
 @app.on_event("startup")
@@ -37,6 +54,18 @@ def startup_event():
     try:
         init_db()
         logger.info("Datenbank erfolgreich initialisiert.")
+        resumed = extraction_queue.resume_pending(engine)
+        if resumed:
+            logger.info(f"{resumed} unterbrochene Textextraktion(en) neu eingeplant.")
+        backfilled = backfill_search_index(engine)
+        if backfilled:
+            logger.info(f"Suchindex mit {backfilled} Einträgen aufgebaut.")
+        scheduled = backfill_embeddings(engine)
+        if scheduled:
+            logger.info(f"{scheduled} Embeddings für ähnliche Feststellungen eingeplant.")
+        embedding_worker.notify(engine)
+        # Offene (De-)Indexierungsaufträge weiter abarbeiten
+        index_worker.notify(engine)
     except Exception as e:
         logger.warning(f"Datenbank-Initialisierung fehlgeschlagen: {e}")
         logger.warning("Service wird ohne Datenbank fortgesetzt.")
@@ -1,8 +1,11 @@
+import hashlib
 import os
+import zlib
 from datetime import datetime, date
 from uuid import uuid4
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
     String,
@@ -10,8 +13,15 @@ from sqlalchemy import (
     DateTime,
     ForeignKey,
     Integer,
+    Float,
     Date,
+    LargeBinary,
+    UniqueConstraint,
     create_engine,
+    event,
+    inspect,
+    literal_column,
+    text,
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker, Session
 from sqlalchemy.sql import func
@@ -25,6 +35,11 @@ def generate_uuid() -> str:
     return str(uuid4())
 
 
+def row_version_column() -> Column:
+    """Zähler, der bei jedem UPDATE der Zeile um eins steigt (Grundlage der ETags, siehe app/api/etag.py)."""
+    return Column(Integer, nullable=False, default=1, onupdate=literal_column("row_version") + 1)
+
+
 # --- Core models ---
 
 
@@ -53,19 +68,44 @@ class Audit(Base):
     start_date = Column(Date, nullable=True)
     end_date = Column(Date, nullable=True)
     responsible_person = Column(String(255), nullable=True)  # Prüfungsleiter
+    row_version = row_version_column()
 
     sessions = relationship("ChatSession", back_populates="audit", cascade="all, delete-orphan")
-    documents = relationship("UploadedFile", back_populates="audit", cascade="all, delete-orphan")
-    findings = relationship("AuditFinding", back_populates="audit", cascade="all, delete-orphan")
-    risks = relationship("Risk", back_populates="audit", cascade="all, delete-orphan")
+    documents = relationship(
+        "UploadedFile",
+        back_populates="audit",
+        cascade="all, delete-orphan",
+        order_by="UploadedFile.created_at.desc()",
+    )
+    findings = relationship(
+        "AuditFinding",
+        back_populates="audit",
+        cascade="all, delete-orphan",
+        order_by="AuditFinding.created_at.desc()",
+    )
+    risks = relationship(
+        "Risk",
+        back_populates="audit",
+        cascade="all, delete-orphan",
+        order_by="Risk.created_at.desc()",
+    )
     plan_items = relationship("AuditPlanItem", back_populates="audit", cascade="all, delete-orphan")
+    reports = relationship(
+        "AuditReport",
+        back_populates="audit",
+        cascade="all, delete-orphan",
+        order_by="AuditReport.version.desc()",
+    )
 
 
 class ChatSession(Base):
     __tablename__ = "sessions"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False)
+    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False, index=True)
+    # Fortlaufende Zusammenfassung älterer Nachrichten (bis einschließlich summary_message_id)
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True),
@@ -84,32 +124,134 @@ class Message(Base):
     session_id = Column(String, ForeignKey("sessions.id"), nullable=False)
     role = Column(String(32), nullable=False)  # "user" | "assistant" | "system"
     content = Column(Text, nullable=False)
+    # Antwort abgebrochen (Client hat die Verbindung vor dem Ende des Streams getrennt)
+    truncated = Column(Boolean, nullable=False, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     session = relationship("ChatSession", back_populates="messages")
 
 
+EXTRACTION_PENDING = "PENDING"
+EXTRACTION_PROCESSING = "PROCESSING"
+EXTRACTION_READY = "READY"
+EXTRACTION_FAILED = "FAILED"
+
+
 class UploadedFile(Base):
     __tablename__ = "uploaded_files"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False)
+    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False, index=True)
     session_id = Column(String, ForeignKey("sessions.id"), nullable=True)
     filename = Column(String(512), nullable=False)
     content_type = Column(String(128), nullable=True)
     stored_path = Column(String(1024), nullable=False)
-    extracted_text = Column(Text, nullable=True)
+    # SHA-256 der Datei; Schlüssel des gemeinsamen Extraktionsergebnisses (siehe app/services/extraction.py)
+    file_hash = Column(String(64), nullable=True, index=True)
+    # PENDING -> PROCESSING -> READY | FAILED (siehe app/services/extraction_jobs.py)
+    extraction_status = Column(String(16), nullable=False, default=EXTRACTION_READY, index=True)
+    extraction_error = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    row_version = row_version_column()
 
     audit = relationship("Audit", back_populates="documents")
     session = relationship("ChatSession")
+    # Extrahierter Text liegt komprimiert in einer eigenen Tabelle und wird erst
+    # beim Zugriff auf ``extracted_text`` nachgeladen.
+    text_content = relationship(
+        "UploadedFileText",
+        uselist=False,
+        cascade="all, delete-orphan",
+    )
+
+    @property
+    def extracted_text(self) -> str | None:
+        return self.text_content.to_text() if self.text_content else None
+
+    @extracted_text.setter
+    def extracted_text(self, value: str | None) -> None:
+        if value is None:
+            self.text_content = None
+        elif self.text_content is not None:
+            self.text_content.set_text(value)
+        else:
+            self.text_content = UploadedFileText.from_text(value)
+
+
+class UploadedFileText(Base):
+    __tablename__ = "uploaded_file_texts"
+
+    file_id = Column(String, ForeignKey("uploaded_files.id"), primary_key=True)
+    compression = Column(String(16), nullable=False, default="zlib")
+    original_size = Column(Integer, nullable=False, default=0)  # Zeichen
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 des Klartexts
+    content = Column(LargeBinary, nullable=False)
+
+    @classmethod
+    def from_text(cls, value: str, **kwargs) -> "UploadedFileText":
+        row = cls(**kwargs)
+        row.set_text(value)
+        return row
+
+    def set_text(self, value: str) -> None:
+        raw = value.encode("utf-8")
+        self.compression = "zlib"
+        self.original_size = len(value)
+        self.content_hash = hashlib.sha256(raw).hexdigest()
+        self.content = zlib.compress(raw, 6)
+
+    def to_text(self) -> str:
+        if self.compression == "zlib":
+            return zlib.decompress(self.content).decode("utf-8")
+        return self.content.decode("utf-8")
+
+
+UPLOAD_OPEN = "OPEN"
+UPLOAD_COMPLETING = "COMPLETING"
+UPLOAD_COMPLETED = "COMPLETED"
+
+
+class ResumableUpload(Base):
+    """Fortsetzbarer Upload in nummerierten Teilen (siehe app/services/resumable_upload.py)."""
+
+    __tablename__ = "resumable_uploads"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False, index=True)
+    session_id = Column(String, ForeignKey("sessions.id"), nullable=True)
+    filename = Column(String(512), nullable=False)
+    content_type = Column(String(128), nullable=True)
+    total_size = Column(BigInteger, nullable=False)
+    part_size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=True)  # erwarteter Hash der ganzen Datei, falls angegeben
+    # OPEN -> COMPLETING -> COMPLETED; abgebrochene/abgelaufene Uploads werden gelöscht
+    status = Column(String(16), nullable=False, default=UPLOAD_OPEN, index=True)
+    file_id = Column(String, nullable=True)  # UploadedFile nach Abschluss
+    expires_at = Column(Float, nullable=False, index=True)  # Unix-Zeit
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    parts = relationship(
+        "UploadPart",
+        cascade="all, delete-orphan",
+        order_by="UploadPart.part_number",
+    )
+
+
+class UploadPart(Base):
+    __tablename__ = "upload_parts"
+
+    upload_id = Column(String, ForeignKey("resumable_uploads.id"), primary_key=True)
+    part_number = Column(Integer, primary_key=True)  # ab 1
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
 
 
 class AuditFinding(Base):
     __tablename__ = "audit_findings"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False)
+    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False, index=True)
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     severity = Column(String(32), nullable=True)  # LOW, MEDIUM, HIGH
@@ -125,6 +267,7 @@ class AuditFinding(Base):
         server_default=func.now(),
         onupdate=func.now(),
     )
+    row_version = row_version_column()
 
     audit = relationship("Audit", back_populates="findings")
 
@@ -133,12 +276,13 @@ class Risk(Base):
     __tablename__ = "risks"
 
     id = Column(Integer, primary_key=True, index=True)
-    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False)
+    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False, index=True)
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     impact = Column(String(32), nullable=True)  # HIGH, MEDIUM, LOW
     likelihood = Column(String(32), nullable=True)  # HIGH, MEDIUM, LOW
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    row_version = row_version_column()
 
     audit = relationship("Audit", back_populates="risks")
 
@@ -147,7 +291,7 @@ class AuditPlanItem(Base):
     __tablename__ = "audit_plan_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False)
+    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False, index=True)
     title = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     category = Column(String(64), nullable=True)  # VORBEREITUNG, PRUEFFELD, RISIKO
@@ -163,10 +307,13 @@ class DocumentAnalysis(Base):
     __tablename__ = "document_analyses"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    file_id = Column(String, ForeignKey("uploaded_files.id"), nullable=False)
+    file_id = Column(String, ForeignKey("uploaded_files.id"), nullable=False, index=True)
     analysis_type = Column(String(64), nullable=False)  # RISK, SUMMARY, COMPLIANCE, CUSTOM
     prompt = Column(Text, nullable=True)
     result = Column(Text, nullable=True)
+    model = Column(String(128), nullable=True)
+    # Hash aus Textinhalt, Analysetyp, Prompt und Modell (siehe routes/analysis.py)
+    cache_key = Column(String(64), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     file = relationship("UploadedFile")
@@ -176,12 +323,115 @@ class AuditReport(Base):
     __tablename__ = "audit_reports"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False)
+    audit_id = Column(Integer, ForeignKey("audits.id"), nullable=False, index=True)
     version = Column(Integer, nullable=False, default=1)
     content_markdown = Column(Text, nullable=True)
+    # SHA-256 der kanonischen Eingabedaten (siehe routes/reports.py::_report_fingerprint)
+    input_hash = Column(String(64), nullable=True)
     generated_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    audit = relationship("Audit")
+    audit = relationship("Audit", back_populates="reports")
+
+
+INDEX_ACTION_INDEX = "INDEX"
+INDEX_ACTION_DELETE = "DELETE"
+
+INDEX_JOB_PENDING = "PENDING"
+INDEX_JOB_RUNNING = "RUNNING"
+INDEX_JOB_DONE = "DONE"
+INDEX_JOB_FAILED = "FAILED"
+INDEX_JOB_CANCELLED = "CANCELLED"
+
+
+class IndexJob(Base):
+    """Auftrag an den document-service, eine Datei zu (de-)indexieren (siehe app/services/indexing.py)."""
+
+    __tablename__ = "index_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Kein Fremdschlüssel: DELETE-Aufträge überleben die gelöschte Datei
+    file_id = Column(String, nullable=False, index=True)
+    audit_id = Column(Integer, nullable=False)
+    action = Column(String(16), nullable=False)
+    filename = Column(String(512), nullable=True)
+    relative_path = Column(String(1024), nullable=True)  # relativ zum gemeinsamen Upload-Volume
+    content_hash = Column(String(64), nullable=True)
+    idempotency_key = Column(String(160), nullable=False, unique=True)
+    status = Column(String(16), nullable=False, default=INDEX_JOB_PENDING, index=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(Float, nullable=False, default=0.0)  # Unix-Zeit
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class TextEmbedding(Base):
+    """Embedding eines Feststellungs- bzw. Risikotexts für die Ähnlichkeitssuche (siehe app/services/similarity.py)."""
+
+    __tablename__ = "text_embeddings"
+    __table_args__ = (UniqueConstraint("kind", "ref_id", name="uq_text_embeddings_ref"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(16), nullable=False)  # "finding" | "risk"
+    ref_id = Column(String(64), nullable=False)
+    audit_id = Column(Integer, nullable=False, index=True)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 des eingebetteten Texts
+    model = Column(String(128), nullable=True)
+    # float32, L2-normiert; NULL = Berechnung steht noch aus
+    vector = Column(LargeBinary, nullable=True)
+    embedded_at = Column(Float, nullable=True, index=True)  # Unix-Zeit
+
+
+SEARCH_KINDS = ("finding", "risk", "report", "document")
+
+
+class SearchEntry(Base):
+    """Eintrag im Volltextindex (siehe app/services/search.py)."""
+
+    __tablename__ = "search_entries"
+    __table_args__ = (UniqueConstraint("kind", "ref_id", name="uq_search_entries_ref"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(16), nullable=False)  # siehe SEARCH_KINDS
+    ref_id = Column(String(64), nullable=False)
+    audit_id = Column(Integer, nullable=True, index=True)
+    title = Column(Text, nullable=False, default="")
+    body = Column(Text, nullable=False, default="")
+
+
+@event.listens_for(SearchEntry.__table__, "after_create")
+def _create_search_index(target, connection, **kw) -> None:
+    """Invertierter Index zu ``search_entries``: tsvector + GIN (Postgres) bzw. FTS5 (SQLite)."""
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(
+            "ALTER TABLE search_entries ADD COLUMN IF NOT EXISTS document tsvector "
+            "GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('german', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('german', coalesce(body, '')), 'B')) STORED"
+        ))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_search_entries_document ON search_entries USING GIN (document)"
+        ))
+    elif connection.dialect.name == "sqlite":
+        # External-Content-Tabelle: der Text liegt nur in search_entries, Trigger halten FTS5 synchron
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+            "title, body, content='search_entries', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ))
+        connection.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS search_entries_ai AFTER INSERT ON search_entries BEGIN "
+            "INSERT INTO search_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+        ))
+        connection.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS search_entries_ad AFTER DELETE ON search_entries BEGIN "
+            "INSERT INTO search_fts(search_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END"
+        ))
+        connection.execute(text(
+            "CREATE TRIGGER IF NOT EXISTS search_entries_au AFTER UPDATE ON search_entries BEGIN "
+            "INSERT INTO search_fts(search_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+            "INSERT INTO search_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END"
+        ))
 
 
 # --- Engine / Session ---
@@ -200,6 +450,88 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db() -> None:
     Base.metadata.create_all(bind=engine)
+    _migrate_schema(engine)
+    _migrate_legacy_extracted_text()
+
+
+# Spalten, die nachträglich zu bestehenden Tabellen hinzugekommen sind: (Tabelle, Spalte, SQL-Default).
+# NOT NULL-Spalten brauchen einen Default, damit vorhandene Zeilen gültig bleiben.
+ADDED_COLUMNS = [
+    ("document_analyses", "model", None),
+    ("document_analyses", "cache_key", None),
+    ("audit_reports", "input_hash", None),
+    ("sessions", "summary", None),
+    ("sessions", "summary_message_id", None),
+    ("messages", "truncated", "false"),
+    # Vorhandene Uploads wurden noch synchron extrahiert und gelten als fertig
+    ("uploaded_files", "extraction_status", f"'{EXTRACTION_READY}'"),
+    ("uploaded_files", "extraction_error", None),
+    ("uploaded_files", "file_hash", None),
+    ("audits", "row_version", "1"),
+    ("uploaded_files", "row_version", "1"),
+    ("audit_findings", "row_version", "1"),
+    ("risks", "row_version", "1"),
+]
+
+
+def _migrate_schema(bind) -> None:
+    """Bringt bereits bestehende Tabellen auf den Stand der Modelle; ``create_all`` ändert sie nicht."""
+    _add_missing_columns(bind)
+    _create_missing_indexes(bind)
+
+
+def _add_missing_columns(bind) -> None:
+    inspector = inspect(bind)
+    quote = bind.dialect.identifier_preparer.quote
+    for table_name, column_name, default in ADDED_COLUMNS:
+        if column_name in {column["name"] for column in inspector.get_columns(table_name)}:
+            continue
+        column = Base.metadata.tables[table_name].c[column_name]
+        ddl = (
+            f"ALTER TABLE {quote(table_name)} ADD COLUMN {quote(column_name)} "
+            f"{column.type.compile(dialect=bind.dialect)}"
+        )
+        if default is not None:
+            ddl += f" DEFAULT {default}"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        with bind.begin() as connection:
+            connection.execute(text(ddl))
+
+
+def _create_missing_indexes(bind) -> None:
+    """Legt Indizes an, die erst nachträglich im Modell ergänzt wurden (z.B. auf Fremdschlüsseln)."""
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        present = {index["name"] for index in inspector.get_indexes(table.name)}
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name not in present and {c.name for c in index.columns} <= columns:
+                index.create(bind=bind)
+
+
+def _migrate_legacy_extracted_text() -> None:
+    """Überträgt Texte aus der früheren Spalte uploaded_files.extracted_text in uploaded_file_texts."""
+    columns = {c["name"] for c in inspect(engine).get_columns("uploaded_files")}
+    if "extracted_text" not in columns:
+        return
+
+    with SessionLocal() as db:
+        file_ids = db.execute(text(
+            "SELECT id FROM uploaded_files WHERE extracted_text IS NOT NULL "
+            "AND id NOT IN (SELECT file_id FROM uploaded_file_texts)"
+        )).scalars().all()
+        for file_id in file_ids:
+            legacy_text = db.execute(
+                text("SELECT extracted_text FROM uploaded_files WHERE id = :id"),
+                {"id": file_id},
+            ).scalar()
+            db.add(UploadedFileText.from_text(legacy_text, file_id=file_id))
+            db.execute(
+                text("UPDATE uploaded_files SET extracted_text = NULL WHERE id = :id"),
+                {"id": file_id},
+            )
+            db.commit()
 
 
 def get_db() -> Session:
@@ -0,0 +1,122 @@
+"""
+Token-budgetierter Aufbau des Chat-Prompts.
+
+Systemprompt und aktuelle Frage sind gesetzt; der Rest des Budgets wird in
+dieser Reihenfolge vergeben: Dokumentauszüge (höchstens ``retrieval_share``
+des Budgets, nach Relevanz), Gesprächszusammenfassung, jüngste Nachrichten.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy.orm import Session
+
+from app.models.database import Audit
+from app.services.tokenizer import count_tokens
+
+# Pauschaler Overhead pro Chat-Nachricht (Rolle, Trennzeichen)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+RETRIEVAL_HEADER = "Relevante Dokumentauszüge:\n\n"
+SUMMARY_HEADER = "Zusammenfassung des bisherigen Gesprächs:\n"
+
+
+def _message_tokens(content: str, model: str) -> int:
+    return count_tokens(content, model) + MESSAGE_OVERHEAD_TOKENS
+
+
+def build_chat_messages(
+    *,
+    system_prompt: str,
+    user_message: str,
+    snippets: Sequence[str],
+    summary: Optional[str],
+    history: Sequence[Dict[str, str]],
+    budget: int,
+    retrieval_share: float,
+    model: str,
+) -> Dict[str, Any]:
+    """
+    Baut die Nachrichtenliste für die Completion.
+
+    ``history`` ist chronologisch (älteste zuerst) und enthält die aktuelle
+    Frage nicht. Zurückgegeben werden die Nachrichten und Kennzahlen dazu,
+    welche Teile ins Budget gepasst haben.
+    """
+    used = _message_tokens(system_prompt, model) + _message_tokens(user_message, model)
+
+    # Dokumentauszüge in Relevanzreihenfolge, bis der Retrieval-Anteil ausgeschöpft ist
+    retrieval_budget = min(int(budget * retrieval_share), budget - used)
+    included_snippets: List[str] = []
+    retrieval_tokens = _message_tokens(RETRIEVAL_HEADER, model)
+    for snippet in snippets:
+        tokens = count_tokens(snippet, model) + 1
+        if retrieval_tokens + tokens > retrieval_budget:
+            break
+        included_snippets.append(snippet)
+        retrieval_tokens += tokens
+    if included_snippets:
+        used += retrieval_tokens
+
+    summary_message = None
+    if summary:
+        content = f"{SUMMARY_HEADER}{summary}"
+        tokens = _message_tokens(content, model)
+        if used + tokens <= budget:
+            summary_message = {"role": "system", "content": content}
+            used += tokens
+
+    # Jüngste Nachrichten zuerst, bis das Budget erreicht ist
+    included_history: List[Dict[str, str]] = []
+    for message in reversed(history):
+        tokens = _message_tokens(message["content"], model)
+        if used + tokens > budget:
+            break
+        included_history.append(message)
+        used += tokens
+    included_history.reverse()
+
+    messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
+    if included_snippets:
+        messages.append({
+            "role": "system",
+            "content": RETRIEVAL_HEADER + "\n".join(included_snippets),
+        })
+    if summary_message:
+        messages.append(summary_message)
+    messages.extend(included_history)
+    messages.append({"role": "user", "content": user_message})
+
+    return {
+        "messages": messages,
+        "stats": {
+            "prompt_tokens": used,
+            "budget": budget,
+            "snippets": len(included_snippets),
+            "history_messages": len(included_history),
+            "summary": summary_message is not None,
+        },
+    }
+
+
+def load_audit_context(db: Session, audit_id: Any) -> str:
+    """Kurzbeschreibung der Prüfung für den Systemprompt (leer, falls unbekannt)."""
+    try:
+        audit_id_int = int(audit_id)
+    except (ValueError, TypeError):
+        return ""
+    if not audit_id_int:
+        return ""
+
+    audit = db.query(Audit).filter(Audit.id == audit_id_int).first()
+    if not audit:
+        return ""
+
+    parts = [f"Prüfung: {audit.title}"]
+    if audit.audit_type:
+        parts.append(f"Typ: {audit.audit_type}")
+    if audit.scope:
+        parts.append(f"Umfang: {audit.scope}")
+    if audit.objectives:
+        parts.append(f"Ziele: {audit.objectives}")
+    if audit.status:
+        parts.append(f"Status: {audit.status}")
+    return "\n".join(parts)
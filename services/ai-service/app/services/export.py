@@ -0,0 +1,239 @@
+"""
+Export eines Audits als ZIP-Archiv, erzeugt während der Übertragung.
+
+``iter_audit_export`` schreibt das Archiv mit ``zipfile`` in einen Puffer,
+der nach jedem Block geleert und als Chunk ausgeliefert wird. Weder das
+Archiv noch einzelne Dateien liegen vollständig im Speicher oder auf der
+Platte; der Speicherbedarf ist unabhängig von der Größe des Audits.
+
+Inhalt:
+- ``audit.json``, ``manifest.json`` (zum Schluss, inkl. fehlender Dateien),
+- ``findings.csv``/``findings.json``, ``risks.csv``/``risks.json``,
+- ``reports/`` – jede Berichtsversion als Markdown,
+- ``documents/`` – die Original-Uploads aus ``stored_path``,
+- ``analyses.jsonl`` – alle Dokumentanalysen, eine pro Zeile.
+"""
+import csv
+import io
+import json
+import os
+import re
+import zipfile
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.database import Audit, AuditFinding, AuditReport, DocumentAnalysis, Risk, UploadedFile
+
+CHUNK_SIZE = 1024 * 1024
+# Diese Formate sind bereits komprimiert und werden nur gespeichert
+STORED_EXTENSIONS = {
+    ".pdf", ".docx", ".xlsx", ".pptx", ".zip", ".gz", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".mp4",
+}
+# Ab dieser Größe braucht ein Eintrag ZIP64-Header
+ZIP64_THRESHOLD = 2 ** 31
+
+FINDING_COLUMNS = [
+    "id", "title", "description", "severity", "status",
+    "action_description", "action_due_date", "action_status", "created_at", "updated_at",
+]
+RISK_COLUMNS = ["id", "title", "description", "impact", "likelihood", "created_at"]
+
+
+class _Sink:
+    """Nicht seekbares Schreibziel für ``zipfile``; ``drain`` liefert das bisher Geschriebene."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _safe_name(name: str) -> str:
+    name = os.path.basename(name.replace("\\", "/")) or "datei"
+    return re.sub(r"[^\w.\- ]", "_", name)
+
+
+def _date_time(value: Optional[datetime]) -> tuple:
+    value = value or datetime.now()
+    return max(value.timetuple()[:6], (1980, 1, 1, 0, 0, 0))
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _row(obj: Any, columns: List[str]) -> Dict[str, Any]:
+    return {column: _plain(getattr(obj, column)) for column in columns}
+
+
+class _ArchiveWriter:
+    def __init__(self) -> None:
+        self.sink = _Sink()
+        self.zip = zipfile.ZipFile(self.sink, mode="w", compression=zipfile.ZIP_DEFLATED, compresslevel=6)
+        self.entries: List[str] = []
+
+    def _drain(self) -> Iterator[bytes]:
+        data = self.sink.drain()
+        if data:
+            yield data
+
+    def write_bytes(self, name: str, data: bytes, modified: Optional[datetime] = None) -> Iterator[bytes]:
+        info = zipfile.ZipInfo(name, date_time=_date_time(modified))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        self.zip.writestr(info, data)
+        self.entries.append(name)
+        yield from self._drain()
+
+    def write_json(self, name: str, value: Any, modified: Optional[datetime] = None) -> Iterator[bytes]:
+        data = json.dumps(value, ensure_ascii=False, indent=2, default=_plain).encode("utf-8")
+        yield from self.write_bytes(name, data, modified)
+
+    def write_file(self, name: str, path: str, modified: Optional[datetime] = None) -> Iterator[bytes]:
+        info = zipfile.ZipInfo(name, date_time=_date_time(modified))
+        stored = os.path.splitext(name)[1].lower() in STORED_EXTENSIONS
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        large = os.path.getsize(path) >= ZIP64_THRESHOLD
+        with open(path, "rb") as source, self.zip.open(info, mode="w", force_zip64=large) as target:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                target.write(chunk)
+                yield from self._drain()
+        self.entries.append(name)
+        yield from self._drain()
+
+    def write_rows(self, name: str, columns: List[str], rows: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+        """CSV (UTF-8 mit BOM, damit Excel Umlaute korrekt erkennt) zeilenweise schreiben."""
+        info = zipfile.ZipInfo(name, date_time=_date_time(None))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with io.TextIOWrapper(self.zip.open(info, mode="w"), encoding="utf-8-sig", newline="") as text:
+            writer = csv.DictWriter(text, fieldnames=columns)
+            writer.writeheader()
+            for i, row in enumerate(rows, start=1):
+                writer.writerow(row)
+                if i % 500 == 0:
+                    text.flush()
+                    yield from self._drain()
+        self.entries.append(name)
+        yield from self._drain()
+
+    def write_lines(self, name: str, records: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+        """JSON Lines: ein Datensatz pro Zeile, ohne die Liste im Speicher aufzubauen."""
+        info = zipfile.ZipInfo(name, date_time=_date_time(None))
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with self.zip.open(info, mode="w") as target:
+            for record in records:
+                target.write(json.dumps(record, ensure_ascii=False, default=_plain).encode("utf-8") + b"\n")
+                yield from self._drain()
+        self.entries.append(name)
+        yield from self._drain()
+
+    def close(self) -> Iterator[bytes]:
+        self.zip.close()
+        yield from self._drain()
+
+
+def iter_audit_export(bind: Engine, audit_id: int) -> Iterator[bytes]:
+    """
+    Erzeugt das ZIP-Archiv blockweise. Öffnet eine eigene Session, da der
+    Generator erst nach dem Ende des Requests-Handlers durchlaufen wird.
+    """
+    archive = _ArchiveWriter()
+    missing: List[Dict[str, Any]] = []
+
+    with Session(bind=bind) as db:
+        audit = db.query(Audit).filter(Audit.id == audit_id).first()
+        if audit is None:
+            return
+        audit_columns = [c.key for c in Audit.__table__.columns]
+        yield from archive.write_json("audit.json", _row(audit, audit_columns), audit.updated_at)
+
+        findings = (
+            db.query(AuditFinding)
+            .filter(AuditFinding.audit_id == audit_id)
+            .order_by(AuditFinding.created_at, AuditFinding.id)
+            .all()
+        )
+        finding_rows = [_row(f, FINDING_COLUMNS) for f in findings]
+        yield from archive.write_rows("findings.csv", FINDING_COLUMNS, iter(finding_rows))
+        yield from archive.write_json("findings.json", finding_rows)
+
+        risks = db.query(Risk).filter(Risk.audit_id == audit_id).order_by(Risk.created_at, Risk.id).all()
+        risk_rows = [_row(r, RISK_COLUMNS) for r in risks]
+        yield from archive.write_rows("risks.csv", RISK_COLUMNS, iter(risk_rows))
+        yield from archive.write_json("risks.json", risk_rows)
+
+        # Berichte und Analysen einzeln nachladen, damit nie alle Texte gleichzeitig im Speicher sind
+        report_ids = [
+            report_id for (report_id,) in db.query(AuditReport.id)
+            .filter(AuditReport.audit_id == audit_id)
+            .order_by(AuditReport.version, AuditReport.id)
+        ]
+        for report_id in report_ids:
+            report = db.query(AuditReport).filter(AuditReport.id == report_id).first()
+            name = f"reports/bericht_v{report.version}_{report.id[:8]}.md"
+            yield from archive.write_bytes(name, (report.content_markdown or "").encode("utf-8"), report.generated_at)
+            db.expunge(report)
+
+        documents = (
+            db.query(UploadedFile.id, UploadedFile.filename, UploadedFile.stored_path, UploadedFile.created_at)
+            .filter(UploadedFile.audit_id == audit_id)
+            .order_by(UploadedFile.created_at, UploadedFile.id)
+            .all()
+        )
+        for file_id, filename, stored_path, created_at in documents:
+            name = f"documents/{file_id[:8]}_{_safe_name(filename)}"
+            if not stored_path or not os.path.isfile(stored_path):
+                missing.append({"file_id": file_id, "filename": filename})
+                continue
+            yield from archive.write_file(name, stored_path, created_at)
+
+        def analyses() -> Iterator[Dict[str, Any]]:
+            query = (
+                db.query(DocumentAnalysis, UploadedFile.filename)
+                .join(UploadedFile, UploadedFile.id == DocumentAnalysis.file_id)
+                .filter(UploadedFile.audit_id == audit_id)
+                .order_by(DocumentAnalysis.created_at, DocumentAnalysis.id)
+            )
+            for analysis, filename in query.yield_per(50):
+                yield {
+                    "id": analysis.id,
+                    "file_id": analysis.file_id,
+                    "filename": filename,
+                    "analysis_type": analysis.analysis_type,
+                    "prompt": analysis.prompt,
+                    "model": analysis.model,
+                    "result": analysis.result,
+                    "created_at": analysis.created_at,
+                }
+
+        yield from archive.write_lines("analyses.jsonl", analyses())
+
+        yield from archive.write_json("manifest.json", {
+            "audit_id": audit_id,
+            "exported_at": datetime.now().isoformat(),
+            "findings": len(finding_rows),
+            "risks": len(risk_rows),
+            "reports": len(report_ids),
+            "documents": len(documents) - len(missing),
+            "missing_documents": missing,
+            "entries": archive.entries,
+        })
+
+    yield from archive.close()
@@ -0,0 +1,141 @@
+"""
+Textextraktion aus hochgeladenen Dateien (PDF, DOCX, XLSX, Text).
+
+Bewusst ohne Abhängigkeiten auf den Rest der Anwendung: die Funktionen laufen
+in Worker-Prozessen des Extraktions-Pools und müssen dort billig importierbar sein.
+
+Das Ergebnis (Text plus Seiten-/Tabellenblattstruktur) wird einmal pro Dateiinhalt
+als ``<upload_dir>/extracted/<sha256>.json.gz`` abgelegt. Der document-service
+liest dieselbe Datei über das gemeinsame Upload-Volume, statt selbst zu parsen.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from pypdf import PdfReader
+try:
+    from docx import Document as DocxDocument
+except ImportError:
+    DocxDocument = None
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
+
+# Bei Änderungen an Format oder Extraktionslogik erhöhen: ältere Artefakte werden dann neu erzeugt.
+# Der document-service (services/document-service/main.py) führt dieselbe Konstante und lehnt
+# Indexierungsaufträge mit abweichender Version ab – beide Dienste gemeinsam ausrollen.
+EXTRACTION_VERSION = 1
+EXTRACTED_DIRNAME = "extracted"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_document(path: str, content_type: str, filename: str) -> Dict[str, Any]:
+    """Text und Struktur: ``units`` sind Seiten (PDF), Tabellenblätter (XLSX) oder das ganze Dokument."""
+    units: List[Dict[str, Any]] = []
+
+    if content_type == "application/pdf" or filename.lower().endswith(".pdf"):
+        reader = PdfReader(path)
+        for number, page in enumerate(reader.pages, start=1):
+            units.append({"type": "page", "number": number, "text": page.extract_text() or ""})
+        text = "\n".join(unit["text"] for unit in units)
+
+    elif filename.lower().endswith(".docx") and DocxDocument:
+        doc = DocxDocument(path)
+        parts = [p.text for p in doc.paragraphs if p.text]
+        text = "\n".join(parts)
+        units.append({"type": "document", "text": text})
+
+    elif (filename.lower().endswith(".xlsx") or filename.lower().endswith(".xlsm")) and load_workbook:
+        wb = load_workbook(path, data_only=True)
+        for sheet in wb.worksheets:
+            parts = []
+            for row in sheet.iter_rows(values_only=True):
+                row_vals = [str(v) for v in row if v is not None]
+                if row_vals:
+                    parts.append(" | ".join(row_vals))
+            if parts:
+                units.append({"type": "sheet", "name": sheet.title, "text": "\n".join(parts)})
+        text = "\n".join(unit["text"] for unit in units)
+
+    else:
+        try:
+            with open(path, "r", encoding="utf-8", errors="ignore") as f:
+                text = f.read()
+        except Exception:
+            text = ""
+        units.append({"type": "document", "text": text})
+
+    return {"text": text, "units": units}
+
+
+def extract_text_from_file(path: str, content_type: str, filename: str) -> str:
+    return extract_document(path, content_type, filename)["text"]
+
+
+# --- Gemeinsamer Speicher ---
+
+def artifact_path(store_dir: str, content_hash: str) -> str:
+    return os.path.join(store_dir, EXTRACTED_DIRNAME, f"{content_hash}.json.gz")
+
+
+def load_artifact(store_dir: str, content_hash: str) -> Optional[Dict[str, Any]]:
+    try:
+        with gzip.open(artifact_path(store_dir, content_hash), "rt", encoding="utf-8") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if artifact.get("version") != EXTRACTION_VERSION:
+        return None
+    return artifact
+
+
+def save_artifact(store_dir: str, content_hash: str, artifact: Dict[str, Any]) -> None:
+    path = artifact_path(store_dir, content_hash)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Atomar ersetzen, damit der document-service nie eine halb geschriebene Datei liest
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with gzip.open(os.fdopen(fd, "wb"), "wt", encoding="utf-8") as f:
+            json.dump(artifact, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def extract_to_store(
+    path: str,
+    content_type: str,
+    filename: str,
+    store_dir: str,
+    content_hash: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Liefert das Extraktionsergebnis für den Dateiinhalt; geparst wird nur,
+    wenn für den Hash noch kein Artefakt existiert.
+    """
+    content_hash = content_hash or file_sha256(path)
+    artifact = load_artifact(store_dir, content_hash)
+    if artifact is not None:
+        return {**artifact, "reused": True}
+
+    artifact = {
+        "version": EXTRACTION_VERSION,
+        "content_hash": content_hash,
+        "filename": filename,
+        "content_type": content_type,
+        **extract_document(path, content_type, filename),
+    }
+    save_artifact(store_dir, content_hash, artifact)
+    return {**artifact, "reused": False}
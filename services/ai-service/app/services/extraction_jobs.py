@@ -0,0 +1,143 @@
+"""
+Asynchrone Textextraktion für Uploads.
+
+Der Upload speichert nur die Datei und legt den Datensatz mit
+``extraction_status = PENDING`` an. Die Extraktion läuft danach in einem
+Worker-Pool (Prozesse für das CPU-lastige Parsen, damit der Event-Loop und
+laufende Chat-Streams nicht blockieren). Das Ergebnis landet im gemeinsamen
+Extraktionsspeicher (pro Dateiinhalt einmal, auch für den document-service)
+und als Text in der Datenbank. Den Fortschritt liefert ``GET /api/upload/{id}/status``.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.database import (
+    EXTRACTION_FAILED,
+    EXTRACTION_PENDING,
+    EXTRACTION_PROCESSING,
+    EXTRACTION_READY,
+    UploadedFile,
+)
+from app.services.extraction import extract_to_store
+from app.services.indexing import enqueue_index, index_worker
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionQueue:
+    def __init__(self, workers: int, use_processes: bool = True) -> None:
+        self.workers = max(1, workers)
+        self.use_processes = use_processes
+        self._lock = threading.Lock()
+        self._jobs: Optional[ThreadPoolExecutor] = None
+        self._parsers: Optional[Executor] = None
+
+    @classmethod
+    def from_settings(cls) -> "ExtractionQueue":
+        return cls(
+            workers=settings.extraction_workers,
+            use_processes=settings.extraction_executor == "process",
+        )
+
+    def _executors(self) -> tuple:
+        # Pools erst beim ersten Upload starten (nicht schon beim Import/in Tests)
+        with self._lock:
+            if self._jobs is None:
+                self._jobs = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="extraction"
+                )
+                if self.use_processes:
+                    # spawn: sicher auch in einem Prozess mit laufenden Threads
+                    self._parsers = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+            return self._jobs, self._parsers
+
+    def submit(self, file_id: str, bind: Engine) -> None:
+        """Plant die Extraktion; ``bind`` ist die Engine der anfragenden Session."""
+        jobs, _ = self._executors()
+        jobs.submit(self._run_logged, file_id, bind)
+
+    def _run_logged(self, file_id: str, bind: Engine) -> None:
+        try:
+            self._run(file_id, bind)
+        except Exception as e:
+            logger.exception(f"Extraktions-Job für Datei {file_id} abgebrochen")
+            try:
+                # Status nicht auf PROCESSING stehen lassen
+                self._finish(file_id, bind, None, f"Interner Fehler: {e}")
+            except Exception:
+                pass
+
+    def _parse(self, path: str, content_type: str, filename: str, file_hash: Optional[str]) -> str:
+        """Text aus dem gemeinsamen Extraktionsspeicher; geparst wird nur bei unbekanntem Inhalt."""
+        _, parsers = self._executors()
+        args = (path, content_type, filename, settings.upload_dir, file_hash)
+        if parsers is None:
+            artifact = extract_to_store(*args)
+        else:
+            artifact = parsers.submit(extract_to_store, *args).result()
+        if artifact["reused"]:
+            logger.info(f"Extraktion für {filename} aus gemeinsamem Speicher übernommen")
+        return artifact["text"]
+
+    def _run(self, file_id: str, bind: Engine) -> None:
+        with Session(bind=bind) as db:
+            uploaded = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+            if not uploaded:
+                return  # inzwischen gelöscht
+            uploaded.extraction_status = EXTRACTION_PROCESSING
+            db.commit()
+            path, content_type, filename, file_hash = (
+                uploaded.stored_path, uploaded.content_type or "", uploaded.filename, uploaded.file_hash
+            )
+
+        try:
+            text = self._parse(path, content_type, filename, file_hash)
+        except Exception as e:
+            logger.warning(f"Textextraktion für {filename} fehlgeschlagen: {e}")
+            self._finish(file_id, bind, None, str(e))
+            return
+        self._finish(file_id, bind, text, None)
+
+    def _finish(self, file_id: str, bind: Engine, text: Optional[str], error: Optional[str]) -> None:
+        with Session(bind=bind) as db:
+            uploaded = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
+            if not uploaded:
+                return
+            if error is None:
+                uploaded.extracted_text = text
+                uploaded.extraction_status = EXTRACTION_READY
+                uploaded.extraction_error = None
+                # Erst jetzt indexieren: der document-service nutzt das gemeinsame Extraktionsergebnis
+                enqueue_index(db, uploaded)
+            else:
+                uploaded.extraction_status = EXTRACTION_FAILED
+                uploaded.extraction_error = error
+            db.commit()
+        if error is None:
+            index_worker.notify(bind)
+
+    def resume_pending(self, bind: Engine) -> int:
+        """Nach einem Neustart unterbrochene Extraktionen erneut einplanen."""
+        with Session(bind=bind) as db:
+            file_ids = [
+                file_id
+                for (file_id,) in db.query(UploadedFile.id).filter(
+                    UploadedFile.extraction_status.in_([EXTRACTION_PENDING, EXTRACTION_PROCESSING])
+                )
+            ]
+        for file_id in file_ids:
+            self.submit(file_id, bind)
+        return len(file_ids)
+
+
+extraction_queue = ExtractionQueue.from_settings()
@@ -0,0 +1,332 @@
+"""
+Übergabe von Uploads an den Vektorindex des document-service.
+
+Nach abgeschlossener Textextraktion bzw. beim Löschen einer Datei wird ein
+``IndexJob`` in der Datenbank angelegt; der ``IndexWorker`` arbeitet die
+Aufträge im Hintergrund ab:
+- höchstens ``settings.index_workers`` Aufrufe gleichzeitig (Backpressure),
+- Retry mit exponentiellem Backoff bei Verbindungsfehlern, 429 und 5xx
+  (Retry-After wird beachtet),
+- ein Idempotency-Key pro Auftrag, damit Wiederholungen keine doppelten Vektoren erzeugen,
+- Aufträge einer Datei laufen strikt nacheinander (Löschen nie vor dem Indexieren).
+Die Aufträge sind persistent; nach einem Neustart wird weitergearbeitet.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import httpx
+from sqlalchemy import func, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.database import (
+    INDEX_ACTION_DELETE,
+    INDEX_ACTION_INDEX,
+    INDEX_JOB_CANCELLED,
+    INDEX_JOB_DONE,
+    INDEX_JOB_FAILED,
+    INDEX_JOB_PENDING,
+    INDEX_JOB_RUNNING,
+    IndexJob,
+    UploadedFile,
+)
+from app.services.extraction import EXTRACTION_VERSION
+
+logger = logging.getLogger(__name__)
+
+# Spätestens nach dieser Zeit prüft der Worker erneut auf fällige Retries
+POLL_SECONDS = 5.0
+
+
+class RetryableIndexError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def enqueue_index(db: Session, uploaded: UploadedFile) -> IndexJob:
+    """Legt einen Indexierungsauftrag an (ohne Commit); gleicher Inhalt wird nur einmal beauftragt."""
+    key = f"index:{uploaded.id}:{uploaded.file_hash or ''}"
+    existing = db.query(IndexJob).filter(IndexJob.idempotency_key == key).first()
+    if existing:
+        return existing
+
+    job = IndexJob(
+        file_id=uploaded.id,
+        audit_id=uploaded.audit_id,
+        action=INDEX_ACTION_INDEX,
+        filename=uploaded.filename,
+        relative_path=os.path.relpath(uploaded.stored_path, settings.upload_dir),
+        content_hash=uploaded.file_hash,
+        idempotency_key=key,
+    )
+    db.add(job)
+    return job
+
+
+def enqueue_deindex(db: Session, uploaded: UploadedFile) -> IndexJob:
+    """Legt einen Löschauftrag an (ohne Commit); offene Indexierungen der Datei entfallen."""
+    db.query(IndexJob).filter(
+        IndexJob.file_id == uploaded.id,
+        IndexJob.action == INDEX_ACTION_INDEX,
+        IndexJob.status == INDEX_JOB_PENDING,
+    ).update({IndexJob.status: INDEX_JOB_CANCELLED}, synchronize_session=False)
+
+    key = f"delete:{uploaded.id}"
+    existing = db.query(IndexJob).filter(IndexJob.idempotency_key == key).first()
+    if existing:
+        return existing
+
+    job = IndexJob(
+        file_id=uploaded.id,
+        audit_id=uploaded.audit_id,
+        action=INDEX_ACTION_DELETE,
+        filename=uploaded.filename,
+        idempotency_key=key,
+    )
+    db.add(job)
+    return job
+
+
+class IndexWorker:
+    def __init__(
+        self,
+        base_url: str,
+        workers: int,
+        max_attempts: int,
+        backoff_base: float,
+        backoff_max: float,
+        timeout: float,
+        transport: Optional[httpx.BaseTransport] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.transport = transport
+
+        self._bind: Optional[Engine] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._running_files: set = set()
+
+    @classmethod
+    def from_settings(cls) -> "IndexWorker":
+        return cls(
+            base_url=settings.document_service_url,
+            workers=settings.index_workers,
+            max_attempts=settings.index_max_attempts,
+            backoff_base=settings.index_backoff_base,
+            backoff_max=settings.index_backoff_max,
+            timeout=settings.index_request_timeout,
+        )
+
+    # --- Steuerung ---
+
+    def start(self, bind: Engine) -> None:
+        """Startet den Hintergrund-Thread (einmalig) und übernimmt unterbrochene Aufträge."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._bind = bind
+            with Session(bind=bind) as db:
+                # Nach einem Absturz hängengebliebene Aufträge erneut einplanen
+                db.query(IndexJob).filter(IndexJob.status == INDEX_JOB_RUNNING).update(
+                    {IndexJob.status: INDEX_JOB_PENDING}, synchronize_session=False
+                )
+                db.commit()
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="indexing")
+            self._thread = threading.Thread(target=self._loop, name="index-dispatcher", daemon=True)
+            self._thread.start()
+
+    def notify(self, bind: Engine) -> None:
+        """Nach dem Commit neuer Aufträge aufrufen."""
+        if not settings.index_worker_enabled:
+            return
+        self.start(bind)
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        while True:
+            self._wakeup.wait(timeout=POLL_SECONDS)
+            self._wakeup.clear()
+            try:
+                self._dispatch()
+            except Exception:
+                logger.exception("Verteilen der Indexierungsaufträge fehlgeschlagen")
+
+    def _dispatch(self) -> None:
+        with self._lock:
+            free = self.workers - len(self._running_files)
+        if free <= 0:
+            return
+        for job_id, file_id in self._claim(self._bind, free):
+            self._pool.submit(self._run_in_pool, job_id, file_id)
+
+    def _run_in_pool(self, job_id: int, file_id: str) -> None:
+        try:
+            self._execute(self._bind, job_id)
+        except Exception:
+            logger.exception(f"Indexierungsauftrag {job_id} abgebrochen")
+        finally:
+            with self._lock:
+                self._running_files.discard(file_id)
+            self._wakeup.set()
+
+    def run_due(self, bind: Engine) -> int:
+        """Arbeitet alle fälligen Aufträge synchron ab (z.B. für Wartungsskripte und Tests)."""
+        processed = 0
+        for job_id, file_id in self._claim(bind, limit=None):
+            try:
+                self._execute(bind, job_id)
+            finally:
+                with self._lock:
+                    self._running_files.discard(file_id)
+            processed += 1
+        return processed
+
+    # --- Aufträge ---
+
+    def _claim(self, bind: Engine, limit: Optional[int]) -> List[tuple]:
+        """Reserviert fällige Aufträge; pro Datei höchstens einer, in Auftragsreihenfolge."""
+        claimed: List[tuple] = []
+        with Session(bind=bind) as db:
+            running = {
+                file_id for (file_id,) in
+                db.query(IndexJob.file_id).filter(IndexJob.status == INDEX_JOB_RUNNING)
+            }
+            candidates = (
+                db.query(IndexJob.id, IndexJob.file_id, IndexJob.next_attempt_at)
+                .filter(IndexJob.status == INDEX_JOB_PENDING)
+                .order_by(IndexJob.id.asc())
+                .all()
+            )
+            now = time.time()
+            seen = set()
+            for job_id, file_id, next_attempt_at in candidates:
+                if limit is not None and len(claimed) >= limit:
+                    break
+                blocked = file_id in seen or file_id in running
+                seen.add(file_id)
+                with self._lock:
+                    blocked = blocked or file_id in self._running_files
+                if blocked or next_attempt_at > now:
+                    continue
+                # Optimistisch reservieren: greift ein anderer Prozess zu, ist rowcount 0
+                result = db.execute(
+                    update(IndexJob)
+                    .where(IndexJob.id == job_id, IndexJob.status == INDEX_JOB_PENDING)
+                    .values(status=INDEX_JOB_RUNNING)
+                )
+                db.commit()
+                if result.rowcount:
+                    with self._lock:
+                        self._running_files.add(file_id)
+                    claimed.append((job_id, file_id))
+        return claimed
+
+    def _execute(self, bind: Engine, job_id: int) -> None:
+        with Session(bind=bind) as db:
+            job = db.query(IndexJob).filter(IndexJob.id == job_id).first()
+            if not job:
+                return
+            job.attempts += 1
+            try:
+                self._send(job)
+            except RetryableIndexError as e:
+                if job.attempts >= self.max_attempts:
+                    job.status = INDEX_JOB_FAILED
+                    logger.warning(f"Indexierungsauftrag {job.id} endgültig fehlgeschlagen: {e}")
+                else:
+                    delay = e.retry_after if e.retry_after is not None else self._backoff(job.attempts)
+                    job.status = INDEX_JOB_PENDING
+                    job.next_attempt_at = time.time() + min(delay, self.backoff_max)
+                    logger.info(f"Indexierungsauftrag {job.id} wird in {delay:.0f}s wiederholt: {e}")
+                job.last_error = str(e)
+            except Exception as e:
+                job.status = INDEX_JOB_FAILED
+                job.last_error = str(e)
+                logger.warning(f"Indexierungsauftrag {job.id} fehlgeschlagen: {e}")
+            else:
+                job.status = INDEX_JOB_DONE
+                job.last_error = None
+            db.commit()
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return delay * (0.5 + random.random() / 2)
+
+    def _send(self, job: IndexJob) -> None:
+        headers = {"Idempotency-Key": job.idempotency_key}
+        try:
+            with httpx.Client(timeout=self.timeout, transport=self.transport) as client:
+                if job.action == INDEX_ACTION_INDEX:
+                    response = client.post(
+                        f"{self.base_url}/documents/index",
+                        headers=headers,
+                        json={
+                            "file_id": job.file_id,
+                            "audit_id": job.audit_id,
+                            "filename": job.filename,
+                            "path": job.relative_path,
+                            "content_hash": job.content_hash,
+                            "extraction_version": EXTRACTION_VERSION,
+                        },
+                    )
+                else:
+                    response = client.delete(
+                        f"{self.base_url}/documents/files/{job.file_id}",
+                        headers=headers,
+                    )
+        except httpx.TransportError as e:
+            raise RetryableIndexError(f"document-service nicht erreichbar: {e}")
+
+        if response.status_code == 404 and job.action == INDEX_ACTION_DELETE:
+            return  # nichts (mehr) im Index
+        if response.status_code == 429 or response.status_code >= 500:
+            raise RetryableIndexError(
+                f"document-service antwortet {response.status_code}",
+                retry_after=_parse_retry_after(response.headers.get("retry-after")),
+            )
+        response.raise_for_status()
+
+    def metrics(self, bind: Engine) -> Dict[str, Any]:
+        with Session(bind=bind) as db:
+            counts = dict(
+                db.query(IndexJob.status, func.count(IndexJob.id)).group_by(IndexJob.status).all()
+            )
+        with self._lock:
+            in_flight = len(self._running_files)
+        return {
+            "worker_enabled": settings.index_worker_enabled,
+            "workers": self.workers,
+            "in_flight": in_flight,
+            "jobs": {
+                status: counts.get(status, 0)
+                for status in (
+                    INDEX_JOB_PENDING, INDEX_JOB_RUNNING, INDEX_JOB_DONE, INDEX_JOB_FAILED, INDEX_JOB_CANCELLED,
+                )
+            },
+        }
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+index_worker = IndexWorker.from_settings()
@@ -0,0 +1,289 @@
+"""
+Prozessweiter Scheduler vor dem OpenAI-Client.
+
+Alle LLM-Aufrufe (Chat, Analyse, Bericht) laufen über ``llm_scheduler``:
+- Nebenläufigkeit global und pro Aufruftyp begrenzt,
+- Warteschlange mit Priorität (Chat vor Verlaufszusammenfassung vor Bericht vor Analyse),
+- Token-pro-Minute-Budget über ein gleitendes 60-Sekunden-Fenster,
+- exponentielles Backoff bei 429/5xx unter Beachtung von Retry-After.
+"""
+import asyncio
+import itertools
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import openai
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Kleinere Zahl = höhere Priorität
+CALL_PRIORITIES = {"chat": 0, "summary": 1, "report": 2, "analysis": 3}
+
+TOKEN_WINDOW_SECONDS = 60.0
+
+
+class _Ticket:
+    """Belegter Slot; ``usage`` ist der Eintrag im Token-Fenster ([Zeitpunkt, Tokens])."""
+
+    def __init__(self, call_type: str, usage: List[float]) -> None:
+        self.call_type = call_type
+        self.usage = usage
+        self.released = False
+
+
+class LLMScheduler:
+    def __init__(
+        self,
+        max_concurrency: int,
+        type_limits: Dict[str, int],
+        tokens_per_minute: int = 0,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+    ) -> None:
+        self.max_concurrency = max(1, max_concurrency)
+        self.type_limits = {t: max(1, n) for t, n in type_limits.items()}
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._seq = itertools.count()
+        # (priorität, seq, future, aufruftyp, tokens, eingereiht_um)
+        self._waiters: List[tuple] = []
+        self._in_flight = {t: 0 for t in self.type_limits}
+        self._usage: deque = deque()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._stats = {
+            t: {
+                "requests": 0,
+                "retries": 0,
+                "rate_limited": 0,
+                "failures": 0,
+                "wait_seconds_total": 0.0,
+                "wait_seconds_max": 0.0,
+            }
+            for t in self.type_limits
+        }
+
+    @classmethod
+    def from_settings(cls) -> "LLMScheduler":
+        return cls(
+            max_concurrency=settings.llm_max_concurrency,
+            type_limits={
+                "chat": settings.llm_chat_concurrency,
+                "summary": settings.llm_summary_concurrency,
+                "report": settings.llm_report_concurrency,
+                "analysis": settings.llm_analysis_concurrency,
+            },
+            tokens_per_minute=settings.llm_tokens_per_minute,
+            max_retries=settings.llm_max_retries,
+            backoff_base=settings.llm_backoff_base,
+            backoff_max=settings.llm_backoff_max,
+        )
+
+    # --- Slots ---
+
+    def _tokens_in_window(self, now: float) -> float:
+        while self._usage and now - self._usage[0][0] >= TOKEN_WINDOW_SECONDS:
+            self._usage.popleft()
+        return sum(entry[1] for entry in self._usage)
+
+    def _schedule_wakeup(self, now: float) -> None:
+        if self._wakeup is not None or not self._usage:
+            return
+        delay = max(0.01, TOKEN_WINDOW_SECONDS - (now - self._usage[0][0]))
+        self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self) -> None:
+        self._wakeup = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        for entry in sorted(self._waiters):
+            _, _, future, call_type, tokens, enqueued_at = entry
+            if future.done():
+                self._waiters.remove(entry)
+                continue
+            if sum(self._in_flight.values()) >= self.max_concurrency:
+                break
+            if self._in_flight[call_type] >= self.type_limits[call_type]:
+                continue
+            if self.tokens_per_minute > 0:
+                used = self._tokens_in_window(now)
+                if used > 0 and used + tokens > self.tokens_per_minute:
+                    # Budget erschöpft: nichts Niedrigeres vorziehen, später erneut prüfen
+                    self._schedule_wakeup(now)
+                    break
+
+            self._waiters.remove(entry)
+            self._in_flight[call_type] += 1
+            usage = [now, tokens]
+            self._usage.append(usage)
+
+            stats = self._stats[call_type]
+            waited = now - enqueued_at
+            stats["requests"] += 1
+            stats["wait_seconds_total"] += waited
+            stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+
+            future.set_result(_Ticket(call_type, usage))
+
+    async def _acquire(self, call_type: str, tokens: int) -> _Ticket:
+        if call_type not in self.type_limits:
+            raise ValueError(f"Unbekannter LLM-Aufruftyp: {call_type}")
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(
+            (CALL_PRIORITIES.get(call_type, 99), next(self._seq), future, call_type, tokens, time.monotonic())
+        )
+        self._dispatch()
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(future.result())
+            self._dispatch()
+            raise
+
+    def _release(self, ticket: _Ticket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        self._in_flight[ticket.call_type] -= 1
+        self._dispatch()
+
+    # --- Retry ---
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Wartezeit vor dem nächsten Versuch oder None, falls der Fehler nicht wiederholbar ist."""
+        if isinstance(error, openai.APIStatusError):
+            if error.status_code != 429 and error.status_code < 500:
+                return None
+            retry_after = _parse_retry_after(error.response.headers if error.response else {})
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+        elif not isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+            return None
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def _on_error(self, call_type: str, error: Exception, attempt: int) -> Optional[float]:
+        stats = self._stats[call_type]
+        if isinstance(error, openai.RateLimitError):
+            stats["rate_limited"] += 1
+        delay = self._retry_delay(error, attempt)
+        if delay is None or attempt >= self.max_retries:
+            stats["failures"] += 1
+            return None
+        stats["retries"] += 1
+        logger.warning(f"LLM-Aufruf ({call_type}) fehlgeschlagen, neuer Versuch in {delay:.1f}s: {error}")
+        return delay
+
+    # --- Öffentliche API ---
+
+    async def call(self, call_type: str, estimated_tokens: int, request: Callable[[], Awaitable[T]]) -> T:
+        """Führt einen nicht-streamenden Aufruf aus; während des Backoffs ist der Slot frei."""
+        attempt = 0
+        while True:
+            ticket = await self._acquire(call_type, estimated_tokens)
+            try:
+                result = await request()
+            except Exception as e:
+                delay = self._on_error(call_type, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+            else:
+                usage = getattr(result, "usage", None)
+                if usage is not None and getattr(usage, "total_tokens", None):
+                    ticket.usage[1] = usage.total_tokens
+                return result
+            finally:
+                self._release(ticket)
+            await asyncio.sleep(delay)
+
+    async def stream(
+        self,
+        call_type: str,
+        estimated_tokens: int,
+        request: Callable[[], Awaitable[Any]],
+    ) -> AsyncIterator[Any]:
+        """
+        Öffnet einen Stream (mit Retry beim Verbindungsaufbau) und hält den Slot,
+        bis der Stream vollständig gelesen oder vom Aufrufer geschlossen wurde.
+        """
+        attempt = 0
+        while True:
+            ticket = await self._acquire(call_type, estimated_tokens)
+            upstream = None
+            try:
+                try:
+                    upstream = await request()
+                except Exception as e:
+                    delay = self._on_error(call_type, e, attempt)
+                    if delay is None:
+                        raise
+                    attempt += 1
+                else:
+                    async for chunk in upstream:
+                        yield chunk
+                    return
+            finally:
+                if upstream is not None and hasattr(upstream, "close"):
+                    await upstream.close()
+                self._release(ticket)
+            await asyncio.sleep(delay)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        per_type = {}
+        for call_type, stats in self._stats.items():
+            queued = [w for w in self._waiters if w[3] == call_type and not w[2].done()]
+            per_type[call_type] = {
+                "limit": self.type_limits[call_type],
+                "in_flight": self._in_flight[call_type],
+                "queued": len(queued),
+                "oldest_wait_seconds": round(max((now - w[5] for w in queued), default=0.0), 3),
+                "requests": stats["requests"],
+                "retries": stats["retries"],
+                "rate_limited": stats["rate_limited"],
+                "failures": stats["failures"],
+                "avg_wait_seconds": round(stats["wait_seconds_total"] / stats["requests"], 3)
+                if stats["requests"] else 0.0,
+                "max_wait_seconds": round(stats["wait_seconds_max"], 3),
+            }
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": sum(self._in_flight.values()),
+            "queued": sum(v["queued"] for v in per_type.values()),
+            "tokens_per_minute_limit": self.tokens_per_minute,
+            "tokens_last_minute": int(self._tokens_in_window(now)),
+            "call_types": per_type,
+        }
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+
+llm_scheduler = LLMScheduler.from_settings()
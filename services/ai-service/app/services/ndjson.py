@@ -0,0 +1,143 @@
+"""
+NDJSON-Frames für Streaming-Antworten.
+
+- ``encode_frame`` serialisiert einen Frame (mit orjson, falls installiert),
+- ``coalesce`` fasst kurz aufeinanderfolgende Token-Deltas zu einem Frame zusammen,
+- ``stream_stats`` zählt Frames, Deltas und abgebrochene Antworten für ``/api/metrics/streams``.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def encode_frame(frame: Dict[str, Any]) -> bytes:
+    """Ein Frame als UTF-8-Zeile inklusive abschließendem Zeilenumbruch."""
+    if orjson is not None:
+        return orjson.dumps(frame, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(frame, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+async def coalesce(
+    chunks: AsyncIterator[str],
+    max_delay: float,
+    max_chars: int,
+) -> AsyncIterator[str]:
+    """
+    Puffert Text-Deltas und gibt sie gebündelt weiter: spätestens ``max_delay``
+    Sekunden nach dem ersten gepufferten Delta oder sobald ``max_chars`` Zeichen
+    vorliegen. Das erste Delta geht sofort raus, damit die Zeit bis zum ersten
+    Token nicht steigt. ``max_delay <= 0`` reicht jedes Delta unverändert durch.
+
+    Der Upstream wird in einem eigenen Task gelesen; pro Delta fällt so nur ein
+    ``append`` an, Timer und Task-Wechsel nur pro ausgegebenem Frame.
+    """
+    if max_delay <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    buffer: List[str] = []
+    size = 0
+    finished = False
+    error: Optional[BaseException] = None
+    has_data = asyncio.Event()
+    flush_now = asyncio.Event()
+
+    async def pump() -> None:
+        nonlocal size, finished, error
+        try:
+            async for chunk in chunks:
+                buffer.append(chunk)
+                size += len(chunk)
+                has_data.set()
+                if size >= max_chars:
+                    flush_now.set()
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            has_data.set()
+            flush_now.set()
+
+    producer = asyncio.ensure_future(pump())
+    first = True
+    try:
+        while True:
+            await has_data.wait()
+            if not first and not flush_now.is_set():
+                try:
+                    await asyncio.wait_for(flush_now.wait(), max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            first = False
+
+            if buffer:
+                text = "".join(buffer)
+                buffer.clear()
+                size = 0
+                yield text
+
+            if finished and not buffer:
+                if error is not None:
+                    raise error
+                return
+            if not buffer:
+                has_data.clear()
+            if size < max_chars and not finished:
+                flush_now.clear()
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.wait({producer})
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+class StreamStats:
+    """Summen über alle gestreamten Antworten, getrennt nach Stream-Art."""
+
+    def __init__(self) -> None:
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def record(
+        self,
+        kind: str,
+        deltas: int,
+        frames: int,
+        bytes_sent: int,
+        duration: float,
+        truncated: bool = False,
+    ) -> None:
+        totals = self._totals.setdefault(
+            kind,
+            {"responses": 0, "truncated": 0, "deltas": 0, "frames": 0, "bytes": 0, "duration_seconds": 0.0},
+        )
+        totals["responses"] += 1
+        totals["truncated"] += int(truncated)
+        totals["deltas"] += deltas
+        totals["frames"] += frames
+        totals["bytes"] += bytes_sent
+        totals["duration_seconds"] += duration
+
+    def metrics(self) -> Dict[str, Any]:
+        result = {}
+        for kind, totals in self._totals.items():
+            responses = totals["responses"] or 1
+            result[kind] = {
+                "responses": totals["responses"],
+                "truncated_responses": totals["truncated"],
+                "avg_deltas_per_response": round(totals["deltas"] / responses, 1),
+                "avg_frames_per_response": round(totals["frames"] / responses, 1),
+                "avg_bytes_per_response": round(totals["bytes"] / responses),
+                "avg_duration_seconds": round(totals["duration_seconds"] / responses, 3),
+            }
+        return {"encoder": "orjson" if orjson is not None else "json", "streams": result}
+
+
+stream_stats = StreamStats()
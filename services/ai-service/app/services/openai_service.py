@@ -1,4 +1,7 @@
+import asyncio
 import json
+import logging
+import time
 from typing import List, Dict, Any, Optional, AsyncGenerator
 
 from sqlalchemy.orm import Session
@@ -6,14 +9,34 @@ from openai import AsyncOpenAI
 
 from app.config import settings
 from app.models.database import ChatSession, Message
+from app.services.chat_context import build_chat_messages, load_audit_context
 from app.services.document_client import DocumentClient
+from app.services.llm_scheduler import llm_scheduler
+from app.services.ndjson import coalesce, encode_frame, stream_stats
+from app.services.tokenizer import count_tokens, split_by_tokens
+
+logger = logging.getLogger(__name__)
+
+# Angenommene Antwortlänge für die Token-Budgetierung, falls kein max_tokens gesetzt ist
+DEFAULT_COMPLETION_TOKENS = 1000
+
+# Laufende Verlaufsverdichtungen (Referenzen halten, damit die Tasks nicht eingesammelt werden)
+_compaction_tasks: set = set()
+_compacting_sessions: set = set()
+
+def _elapsed_ms(started: float) -> int:
+    return round((time.perf_counter() - started) * 1000)
+
+
+ANALYSIS_SYSTEM_PROMPT = "Du bist ein Experte für interne Revision und Dokumentenanalyse. Antworte auf Deutsch."
 
 
 class OpenAIService:
     def __init__(self, audit_context: str = "") -> None:
         if not settings.openai_api_key:
             raise RuntimeError("OPENAI_API_KEY is not configured")
-        self.client = AsyncOpenAI(api_key=settings.openai_api_key)
+        # Retries übernimmt der prozessweite LLM-Scheduler
+        self.client = AsyncOpenAI(api_key=settings.openai_api_key, max_retries=0)
         self.model = settings.openai_model
         self.document_client = DocumentClient()
         self.audit_context = audit_context
@@ -47,7 +70,7 @@ class OpenAIService:
         documents = results.get("data", {}).get("Get", {}).get("Document", [])
 
         if not documents:
-            return {"context_text": "", "sources": []}
+            return {"context_text": "", "snippets": [], "sources": []}
 
         lines: List[str] = []
         sources: List[Dict[str, Any]] = []
@@ -62,10 +85,9 @@ class OpenAIService:
                 "snippet": snippet[:200] + "..." if len(snippet) > 200 else snippet,
             })
 
-        return {"context_text": "\n".join(lines), "sources": sources}
+        return {"context_text": "\n".join(lines), "snippets": lines, "sources": sources}
 
-    async def analyze_document(self, extracted_text: str, analysis_type: str, custom_prompt: str = "") -> str:
-        """Analyze a document's extracted text with a specific analysis type."""
+    def _analysis_prompt(self, analysis_type: str, custom_prompt: str = "") -> str:
         prompts = {
             "RISK": (
                 "Analysiere den folgenden Dokumenttext und identifiziere alle Risiken, "
@@ -83,23 +105,137 @@ class OpenAIService:
             ),
             "CUSTOM": custom_prompt or "Analysiere den folgenden Dokumenttext.",
         }
+        return prompts.get(analysis_type, prompts["SUMMARY"])
 
-        prompt = prompts.get(analysis_type, prompts["SUMMARY"])
+    def _estimate_tokens(self, messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> int:
+        prompt_tokens = sum(count_tokens(m["content"], self.model) for m in messages)
+        return prompt_tokens + (max_tokens or DEFAULT_COMPLETION_TOKENS)
 
-        messages = [
-            {"role": "system", "content": "Du bist ein Experte für interne Revision und Dokumentenanalyse. Antworte auf Deutsch."},
-            {"role": "user", "content": f"{prompt}\n\n---\n\nDokumenttext:\n{extracted_text[:15000]}"},
-        ]
-
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        usage: Dict[str, int],
+        call_type: str = "analysis",
+        **kwargs,
+    ) -> str:
+        """Single non-streaming completion; accumulates token usage into ``usage``."""
+        response = await llm_scheduler.call(
+            call_type,
+            self._estimate_tokens(messages, kwargs.get("max_tokens")),
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                **kwargs,
+            ),
         )
-
+        usage["llm_calls"] += 1
+        if response.usage:
+            usage["prompt_tokens"] += response.usage.prompt_tokens or 0
+            usage["completion_tokens"] += response.usage.completion_tokens or 0
+            usage["total_tokens"] += response.usage.total_tokens or 0
         return response.choices[0].message.content or ""
 
-    async def generate_report(self, report_data: Dict[str, Any]) -> str:
-        """Generate an audit report from structured data."""
+    async def _reduce_partials(
+        self,
+        prompt: str,
+        partials: List[str],
+        usage: Dict[str, int],
+        semaphore: asyncio.Semaphore,
+    ) -> str:
+        """Merge partial section analyses, hierarchically if they exceed the section budget."""
+        budget = settings.analysis_section_tokens
+
+        async def reduce_group(group: List[str]) -> str:
+            joined = "\n\n".join(
+                f"### Teilanalyse {idx}\n{text}" for idx, text in enumerate(group, start=1)
+            )
+            messages = [
+                {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                {"role": "user", "content": (
+                    "Die folgenden Teilanalysen stammen aus aufeinanderfolgenden Abschnitten "
+                    "desselben Dokuments. Führe sie zu einer einzigen, konsolidierten Analyse "
+                    "zusammen, entferne Dopplungen und behalte alle relevanten Details.\n\n"
+                    f"Ursprüngliche Aufgabe: {prompt}\n\n---\n\n{joined}"
+                )},
+            ]
+            async with semaphore:
+                return await self._complete(messages, usage)
+
+        while len(partials) > 1:
+            groups: List[List[str]] = [[]]
+            group_tokens = 0
+            for partial in partials:
+                tokens = count_tokens(partial, self.model)
+                # Mindestens zwei Teilergebnisse pro Gruppe, damit jede Runde schrumpft
+                if len(groups[-1]) >= 2 and group_tokens + tokens > budget:
+                    groups.append([])
+                    group_tokens = 0
+                groups[-1].append(partial)
+                group_tokens += tokens
+            partials = list(await asyncio.gather(*(reduce_group(g) for g in groups)))
+
+        return partials[0]
+
+    async def analyze_document_with_stats(
+        self,
+        extracted_text: str,
+        analysis_type: str,
+        custom_prompt: str = "",
+    ) -> Dict[str, Any]:
+        """
+        Analyze a document's full extracted text.
+
+        Texts longer than ``settings.analysis_section_tokens`` are split into
+        sections that are analyzed concurrently (bounded by
+        ``settings.analysis_max_concurrency``) and merged in a reduce step.
+        Returns the result together with token usage and wall time.
+        """
+        started = time.perf_counter()
+        usage = {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        prompt = self._analysis_prompt(analysis_type, custom_prompt)
+        sections = split_by_tokens(extracted_text, settings.analysis_section_tokens, self.model)
+
+        if len(sections) <= 1:
+            messages = [
+                {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                {"role": "user", "content": f"{prompt}\n\n---\n\nDokumenttext:\n{extracted_text}"},
+            ]
+            result = await self._complete(messages, usage)
+        else:
+            semaphore = asyncio.Semaphore(max(1, settings.analysis_max_concurrency))
+            total = len(sections)
+
+            async def analyze_section(idx: int, section: str) -> str:
+                messages = [
+                    {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+                    {"role": "user", "content": (
+                        f"{prompt}\n\nDies ist Abschnitt {idx} von {total} eines längeren Dokuments. "
+                        "Beschränke dich auf diesen Abschnitt.\n\n---\n\n"
+                        f"Dokumenttext (Abschnitt {idx}/{total}):\n{section}"
+                    )},
+                ]
+                async with semaphore:
+                    return await self._complete(messages, usage)
+
+            partials = await asyncio.gather(
+                *(analyze_section(idx, section) for idx, section in enumerate(sections, start=1))
+            )
+            result = await self._reduce_partials(prompt, list(partials), usage, semaphore)
+
+        stats = {
+            "sections": len(sections),
+            **usage,
+            "duration_ms": round((time.perf_counter() - started) * 1000),
+        }
+        logger.info(f"Dokumentanalyse {analysis_type}: {stats}")
+        return {"result": result, "stats": stats}
+
+    async def analyze_document(self, extracted_text: str, analysis_type: str, custom_prompt: str = "") -> str:
+        """Analyze a document's extracted text with a specific analysis type."""
+        run = await self.analyze_document_with_stats(extracted_text, analysis_type, custom_prompt)
+        return run["result"]
+
+    def _report_messages(self, report_data: Dict[str, Any]) -> List[Dict[str, str]]:
         prompt = (
             "Erstelle einen professionellen Prüfungsbericht basierend auf den folgenden Daten. "
             "Strukturiere den Bericht mit: "
@@ -108,52 +244,220 @@ class OpenAIService:
             "Verwende Markdown-Formatierung."
         )
 
-        messages = [
+        return [
             {"role": "system", "content": "Du bist ein Experte für interne Revision und Berichtserstellung. Antworte auf Deutsch."},
             {"role": "user", "content": f"{prompt}\n\n---\n\nPrüfungsdaten:\n{json.dumps(report_data, ensure_ascii=False, indent=2)}"},
         ]
 
-        response = await self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            max_tokens=4000,
+    async def generate_report(self, report_data: Dict[str, Any]) -> str:
+        """Generate an audit report from structured data."""
+        messages = self._report_messages(report_data)
+        response = await llm_scheduler.call(
+            "report",
+            self._estimate_tokens(messages, 4000),
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=4000,
+            ),
         )
 
         return response.choices[0].message.content or ""
 
-    async def chat_stream(
+    async def generate_report_stream(self, report_data: Dict[str, Any]) -> AsyncGenerator[str, None]:
+        """Generate an audit report, yielding markdown deltas as they arrive."""
+        messages = self._report_messages(report_data)
+        stream = llm_scheduler.stream(
+            "report",
+            self._estimate_tokens(messages, 4000),
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=4000,
+                stream=True,
+            ),
+        )
+
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                yield content
+
+    def _unsummarized_messages(self, db: Session, session: ChatSession) -> List[Message]:
+        query = db.query(Message).filter(Message.session_id == session.id)
+        if session.summary_message_id:
+            query = query.filter(Message.id > session.summary_message_id)
+        return query.order_by(Message.id.asc()).all()
+
+    async def compact_history(self, db: Session, session: ChatSession) -> bool:
+        """
+        Faltet die ältesten, noch nicht zusammengefassten Nachrichten in die
+        Sitzungszusammenfassung, sobald sie ``settings.chat_history_token_budget``
+        überschreiten. Danach bleibt höchstens die Hälfte des Budgets übrig,
+        sodass nur alle paar Runden verdichtet wird.
+        """
+        budget = settings.chat_history_token_budget
+        messages = [m for m in self._unsummarized_messages(db, session) if m.role in ("user", "assistant")]
+        token_counts = [count_tokens(m.content, self.model) for m in messages]
+        remaining = sum(token_counts)
+        if remaining <= budget:
+            return False
+
+        folded: List[Message] = []
+        # Die letzten zwei Nachrichten (Frage + Antwort) bleiben immer im Wortlaut erhalten
+        for message, tokens in zip(messages[:-2], token_counts[:-2]):
+            if remaining <= budget // 2:
+                break
+            folded.append(message)
+            remaining -= tokens
+        if not folded:
+            return False
+
+        transcript = "\n".join(
+            f"{'Nutzer' if m.role == 'user' else 'Assistent'}: {m.content}" for m in folded
+        )
+        previous = session.summary or "(noch keine)"
+        prompt = (
+            "Aktualisiere die Zusammenfassung eines Gesprächs zur internen Revision. "
+            "Behalte Fakten, Entscheidungen, genannte Dokumente und offene Fragen; "
+            "fasse dich knapp (höchstens 250 Wörter).\n\n"
+            f"Bisherige Zusammenfassung:\n{previous}\n\n"
+            f"Neue Gesprächsabschnitte:\n{transcript}"
+        )
+        try:
+            summary = await self._complete(
+                [
+                    {"role": "system", "content": "Du fasst Gesprächsverläufe präzise zusammen. Antworte auf Deutsch."},
+                    {"role": "user", "content": prompt},
+                ],
+                {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+                call_type="summary",
+                max_tokens=500,
+            )
+        except Exception as e:
+            logger.warning(f"Verlaufszusammenfassung fehlgeschlagen: {e}")
+            return False
+        if not summary.strip():
+            return False
+
+        session.summary = summary
+        session.summary_message_id = folded[-1].id
+        db.commit()
+        return True
+
+    def schedule_compaction(self, bind, session_id: str) -> Optional[asyncio.Task]:
+        """
+        Startet ``compact_history`` als eigenständigen Task mit eigener Session,
+        damit der Chat-Stream nicht auf den Zusammenfassungs-Aufruf wartet.
+        Pro Sitzung läuft höchstens eine Verdichtung gleichzeitig.
+        """
+        if session_id in _compacting_sessions:
+            return None
+        _compacting_sessions.add(session_id)
+        task = asyncio.get_running_loop().create_task(self._compact_detached(bind, session_id))
+        _compaction_tasks.add(task)
+        task.add_done_callback(_compaction_tasks.discard)
+        return task
+
+    async def _compact_detached(self, bind, session_id: str) -> None:
+        try:
+            with Session(bind=bind) as db:
+                session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+                if session is not None:
+                    await self.compact_history(db, session)
+        except Exception:
+            logger.exception(f"Verlaufsverdichtung für Sitzung {session_id} fehlgeschlagen")
+        finally:
+            _compacting_sessions.discard(session_id)
+
+    async def _chat_deltas(self, messages: List[Dict[str, str]], delta_count: List[int]) -> AsyncGenerator[str, None]:
+        stream = llm_scheduler.stream(
+            "chat",
+            self._estimate_tokens(messages),
+            lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=True,
+            ),
+        )
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                delta_count[0] += 1
+                yield content
+
+    def _prepare_chat(
         self,
         db: Session,
         audit_id: str,
         session_id: Optional[str],
         user_message: str,
-    ) -> AsyncGenerator[str, None]:
-        # Session management
-        if session_id:
-            session = self.get_session(db, session_id)
-            if not session:
-                session = self.create_session(db, audit_id)
-        else:
+        timings: Dict[str, int],
+    ) -> Dict[str, Any]:
+        """
+        Datenbankteil der Chat-Vorbereitung: Sitzung auflösen, Frage speichern,
+        Verlauf und Prüfungskontext laden. Läuft in einem Worker-Thread, während
+        parallel die Dokumentsuche wartet.
+        """
+        started = time.perf_counter()
+        session = self.get_session(db, session_id) if session_id else None
+        if not session:
             session = self.create_session(db, audit_id)
-
-        current_session_id = str(session.id)
-
-        # Save user message
         msg_user = Message(session_id=session.id, role="user", content=user_message)
         db.add(msg_user)
         db.commit()
+        timings["insert_ms"] = _elapsed_ms(started)
+
+        # Chat history: nur noch nicht zusammengefasste Nachrichten, ohne die aktuelle Frage
+        started = time.perf_counter()
+        history = [
+            {"role": m.role, "content": m.content}
+            for m in self._unsummarized_messages(db, session)
+            if m.role in ("user", "assistant") and m.id != msg_user.id
+        ]
+        timings["history_ms"] = _elapsed_ms(started)
+
+        started = time.perf_counter()
+        audit_context = self.audit_context or load_audit_context(db, audit_id)
+        timings["audit_context_ms"] = _elapsed_ms(started)
+
+        return {"session": session, "history": history, "audit_context": audit_context}
 
-        # Retrieval (graceful fallback)
+    async def _retrieve(self, audit_id: str, user_message: str, timings: Dict[str, int]) -> Dict[str, Any]:
+        started = time.perf_counter()
         try:
-            retrieval = await self.build_retrieval_context(
-                audit_id=audit_id, user_message=user_message
-            )
-            context_text = retrieval["context_text"]
-            sources = retrieval["sources"]
+            return await self.build_retrieval_context(audit_id=audit_id, user_message=user_message)
         except Exception as e:
+            # Graceful fallback
             print(f"Retrieval failed (continuing without context): {e}")
-            context_text = ""
-            sources = []
+            return {"context_text": "", "snippets": [], "sources": []}
+        finally:
+            timings["retrieval_ms"] = _elapsed_ms(started)
+
+    async def chat_stream(
+        self,
+        db: Session,
+        audit_id: str,
+        session_id: Optional[str],
+        user_message: str,
+    ) -> AsyncGenerator[bytes, None]:
+        # Dokumentsuche (Netzwerk) und Datenbankarbeit laufen gleichzeitig;
+        # die Zeit bis zum ersten Token richtet sich nach der langsameren Stufe.
+        started = time.perf_counter()
+        timings: Dict[str, int] = {}
+        retrieval, prepared = await asyncio.gather(
+            self._retrieve(audit_id, user_message, timings),
+            asyncio.to_thread(self._prepare_chat, db, audit_id, session_id, user_message, timings),
+        )
+        session = prepared["session"]
+        history = prepared["history"]
+        snippets = retrieval["snippets"]
+        sources = retrieval["sources"]
+        current_session_id = str(session.id)
 
         # Build system prompt with audit context
         system_parts = [
@@ -164,63 +468,88 @@ class OpenAIService:
             "Antworte auf Deutsch.",
         ]
 
-        if self.audit_context:
-            system_parts.append(f"\nAktueller Prüfungskontext:\n{self.audit_context}")
+        if prepared["audit_context"]:
+            system_parts.append(f"\nAktueller Prüfungskontext:\n{prepared['audit_context']}")
 
         system_prompt = " ".join(system_parts)
 
-        messages: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
-
-        if context_text:
-            messages.append({
-                "role": "system",
-                "content": f"Relevante Dokumentauszüge:\n\n{context_text}",
-            })
-
-        # Chat history
-        history = (
-            db.query(Message)
-            .filter(Message.session_id == session.id)
-            .order_by(Message.created_at.desc())
-            .limit(10)
-            .all()
+        context = build_chat_messages(
+            system_prompt=system_prompt,
+            user_message=user_message,
+            snippets=snippets,
+            summary=session.summary,
+            history=history,
+            budget=settings.chat_context_token_budget,
+            retrieval_share=settings.chat_retrieval_token_share,
+            model=self.model,
         )
-        for m in reversed(history):
-            if m.role in ("user", "assistant"):
-                messages.append({"role": m.role, "content": m.content})
-
-        messages.append({"role": "user", "content": user_message})
+        messages = context["messages"]
+        # Nur Quellen melden, deren Auszug tatsächlich im Prompt gelandet ist
+        sources = sources[:context["stats"]["snippets"]]
+        timings["prepare_ms"] = _elapsed_ms(started)
 
         # Yield metadata first
-        yield json.dumps({
+        frame = encode_frame({
             "type": "metadata",
             "session_id": current_session_id,
             "sources": sources,
-        }) + "\n"
+            "context": context["stats"],
+            "timings": timings,
+        })
+        frames, bytes_sent = 1, len(frame)
+        yield frame
 
-        # Stream OpenAI response
+        # Stream OpenAI response; Token-Deltas werden zu größeren Frames gebündelt
         full_response = ""
+        delta_count = [0]
+        truncated = False
+        deltas = coalesce(
+            self._chat_deltas(messages, delta_count),
+            max_delay=settings.chat_stream_flush_ms / 1000,
+            max_chars=settings.chat_stream_flush_chars,
+        )
         try:
-            stream = await self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                stream=True,
+            try:
+                async for text in deltas:
+                    full_response += text
+                    frame = encode_frame({"type": "content", "chunk": text})
+                    frames += 1
+                    bytes_sent += len(frame)
+                    yield frame
+            except Exception as e:
+                error_msg = f"\n\n[Fehler bei der KI-Antwort: {str(e)}]"
+                full_response += error_msg
+                frame = encode_frame({"type": "content", "chunk": error_msg})
+                frames += 1
+                bytes_sent += len(frame)
+                yield frame
+        except (asyncio.CancelledError, GeneratorExit):
+            # Client hat die Verbindung getrennt (Tab geschlossen, neue Frage gestellt)
+            truncated = True
+            raise
+        finally:
+            # Schließt den Upstream-Stream und gibt den Scheduler-Slot sofort frei
+            await deltas.aclose()
+            stream_stats.record(
+                "chat", delta_count[0], frames, bytes_sent, time.perf_counter() - started, truncated
             )
 
-            async for chunk in stream:
-                content = chunk.choices[0].delta.content
-                if content:
-                    full_response += content
-                    yield json.dumps({"type": "content", "chunk": content}) + "\n"
-        except Exception as e:
-            error_msg = f"\n\n[Fehler bei der KI-Antwort: {str(e)}]"
-            full_response += error_msg
-            yield json.dumps({"type": "content", "chunk": error_msg}) + "\n"
-
-        # Save assistant message
-        if full_response:
-            msg_assistant = Message(
-                session_id=session.id, role="assistant", content=full_response
-            )
-            db.add(msg_assistant)
-            db.commit()
+            # Save assistant message (bei Abbruch die bis dahin erzeugte Teilantwort)
+            if full_response:
+                msg_assistant = Message(
+                    session_id=session.id,
+                    role="assistant",
+                    content=full_response,
+                    truncated=truncated,
+                )
+                db.add(msg_assistant)
+                db.commit()
+            if truncated:
+                logger.info(
+                    f"Chat-Stream abgebrochen (Sitzung {current_session_id}), "
+                    f"Teilantwort mit {len(full_response)} Zeichen gespeichert"
+                )
+
+        # Ältere Nachrichten verdichten, damit der nächste Prompt nicht wächst – nach dem
+        # letzten Frame im Hintergrund, der Stream endet ohne auf die Zusammenfassung zu warten
+        self.schedule_compaction(db.get_bind(), current_session_id)
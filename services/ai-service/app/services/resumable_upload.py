@@ -0,0 +1,325 @@
+"""
+Fortsetzbare Uploads großer Dateien in nummerierten Teilen.
+
+Ablauf:
+1. ``create_upload`` legt den Upload an und reserviert eine (dünn belegte)
+   Zieldatei unter ``<upload_dir>/.partial/<upload_id>``.
+2. Jeder Teil wird per PUT direkt an seinen Offset ``(n - 1) * part_size``
+   geschrieben (``write_part``) und mit seiner SHA-256 vermerkt. Teile dürfen
+   parallel, in beliebiger Reihenfolge und beliebig oft gesendet werden.
+3. ``upload_state`` zeigt, welche Teile fehlen – nach einem Abbruch werden
+   nur diese erneut gesendet.
+4. ``complete_upload`` prüft Vollständigkeit (und ggf. den Gesamt-Hash),
+   verschiebt die Datei an ihren endgültigen Ort und legt die ``UploadedFile``
+   an; die Extraktion startet danach wie beim einfachen Upload.
+
+Der Speicherbedarf je Anfrage ist durch die Blockgröße des Request-Streams
+begrenzt; kein Teil und keine Datei wird vollständig im Speicher gehalten.
+"""
+import hashlib
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import anyio
+import anyio.to_thread
+from sqlalchemy import update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.database import (
+    EXTRACTION_PENDING,
+    UPLOAD_COMPLETED,
+    UPLOAD_COMPLETING,
+    UPLOAD_OPEN,
+    Audit,
+    ChatSession,
+    ResumableUpload,
+    UploadedFile,
+    UploadPart,
+    generate_uuid,
+)
+from app.services.extraction import file_sha256
+
+logger = logging.getLogger(__name__)
+
+PARTIAL_DIRNAME = ".partial"
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def partial_path(upload_id: str) -> str:
+    return os.path.join(settings.upload_dir, PARTIAL_DIRNAME, upload_id)
+
+
+def stored_path(audit_id: int, file_id: str, filename: str) -> str:
+    """
+    Zielpfad im Audit-Verzeichnis. Das Präfix aus der Datei-ID (wie im Export)
+    verhindert, dass ein gleichnamiger Upload eine ältere Datei überschreibt;
+    Pfadanteile im Dateinamen werden verworfen.
+    """
+    audit_dir = os.path.join(settings.upload_dir, str(audit_id))
+    os.makedirs(audit_dir, exist_ok=True)
+    name = os.path.basename(filename.replace("\\", "/")) or "datei"
+    return os.path.join(audit_dir, f"{file_id[:8]}_{name}")
+
+
+def part_count(upload: ResumableUpload) -> int:
+    return max(1, -(-upload.total_size // upload.part_size))
+
+
+def part_length(upload: ResumableUpload, part_number: int) -> int:
+    if part_number < part_count(upload):
+        return upload.part_size
+    return upload.total_size - (part_count(upload) - 1) * upload.part_size
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_expired(db: Session) -> int:
+    """Entfernt abgelaufene, nicht abgeschlossene Uploads samt Teildatei."""
+    expired = (
+        db.query(ResumableUpload)
+        .filter(ResumableUpload.status == UPLOAD_OPEN, ResumableUpload.expires_at < time.time())
+        .all()
+    )
+    for upload in expired:
+        _remove(partial_path(upload.id))
+        db.delete(upload)
+    if expired:
+        db.commit()
+        logger.info(f"{len(expired)} abgelaufene Uploads entfernt")
+    return len(expired)
+
+
+def create_upload(
+    db: Session,
+    audit_id: int,
+    filename: str,
+    size: int,
+    content_type: Optional[str] = None,
+    session_id: Optional[str] = None,
+    sha256: Optional[str] = None,
+) -> ResumableUpload:
+    if not db.query(Audit.id).filter(Audit.id == audit_id).first():
+        raise UploadError(404, "Audit not found")
+    if session_id:
+        owner = db.query(ChatSession.audit_id).filter(ChatSession.id == session_id).scalar()
+        if owner is not None and owner != audit_id:
+            raise UploadError(400, "Session gehört zu anderer Prüfung")
+    if size > settings.upload_max_size:
+        raise UploadError(413, f"Datei überschreitet die Höchstgröße von {settings.upload_max_size} Bytes")
+
+    purge_expired(db)
+    upload = ResumableUpload(
+        audit_id=audit_id,
+        session_id=session_id,
+        filename=filename,
+        content_type=content_type,
+        total_size=size,
+        part_size=settings.upload_part_size,
+        sha256=sha256.lower() if sha256 else None,
+        expires_at=time.time() + settings.upload_expiry_hours * 3600,
+    )
+    db.add(upload)
+    db.flush()
+
+    # Zieldatei in voller Größe anlegen (dünn belegt), damit Teile an ihren Offset geschrieben werden können
+    path = partial_path(upload.id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.truncate(size)
+    db.commit()
+    db.refresh(upload)
+    return upload
+
+
+def get_upload(db: Session, upload_id: str) -> ResumableUpload:
+    upload = db.query(ResumableUpload).filter(ResumableUpload.id == upload_id).first()
+    if upload is None:
+        raise UploadError(404, "Upload not found")
+    return upload
+
+
+def upload_state(upload: ResumableUpload) -> Dict[str, Any]:
+    received = {part.part_number: part for part in upload.parts}
+    count = part_count(upload)
+    return {
+        "upload_id": upload.id,
+        "audit_id": upload.audit_id,
+        "filename": upload.filename,
+        "status": upload.status,
+        "file_id": upload.file_id,
+        "size": upload.total_size,
+        "part_size": upload.part_size,
+        "part_count": count,
+        "received_bytes": sum(part.size for part in received.values()),
+        "parts": [
+            {
+                "part_number": part.part_number,
+                "offset": (part.part_number - 1) * upload.part_size,
+                "size": part.size,
+                "sha256": part.sha256,
+            }
+            for part in upload.parts
+        ],
+        "missing_parts": [n for n in range(1, count + 1) if n not in received],
+        "expires_at": upload.expires_at,
+    }
+
+
+def _begin_part(bind: Engine, upload_id: str, part_number: int) -> Tuple[int, int]:
+    """Prüft den Teil und verwirft einen früheren Eintrag; liefert (Offset, erwartete Länge)."""
+    with Session(bind=bind) as db:
+        upload = get_upload(db, upload_id)
+        if upload.status != UPLOAD_OPEN:
+            raise UploadError(409, "Upload ist bereits abgeschlossen")
+        if not 1 <= part_number <= part_count(upload):
+            raise UploadError(400, f"Teilnummer muss zwischen 1 und {part_count(upload)} liegen")
+        # Die Bytes auf der Platte werden gleich überschrieben
+        db.query(UploadPart).filter(
+            UploadPart.upload_id == upload_id, UploadPart.part_number == part_number
+        ).delete()
+        db.commit()
+        return (part_number - 1) * upload.part_size, part_length(upload, part_number)
+
+
+def _record_part(bind: Engine, upload_id: str, part_number: int, size: int, checksum: str) -> None:
+    with Session(bind=bind) as db:
+        db.merge(UploadPart(upload_id=upload_id, part_number=part_number, size=size, sha256=checksum))
+        db.commit()
+
+
+async def write_part(
+    bind: Engine,
+    upload_id: str,
+    part_number: int,
+    chunks: AsyncIterator[bytes],
+    expected_sha256: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Schreibt den Teil blockweise an seinen Offset und prüft Länge und Hash.
+    Ein erneut gesendeter Teil ersetzt den bisherigen; schlägt die Prüfung
+    fehl, gilt der Teil als nicht empfangen.
+
+    Datenbankzugriffe laufen in kurzen Sessions im Threadpool vor und nach
+    dem Empfang; während der Body übertragen wird, ist keine Verbindung belegt.
+    """
+    offset, expected_size = await anyio.to_thread.run_sync(_begin_part, bind, upload_id, part_number)
+
+    digest = hashlib.sha256()
+    written = 0
+    async with await anyio.open_file(partial_path(upload_id), mode="r+b") as target:
+        await target.seek(offset)
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if written + len(chunk) > expected_size:
+                # Nicht in den nächsten Teil hineinschreiben
+                raise UploadError(400, f"Teil {part_number} ist größer als {expected_size} Bytes")
+            await target.write(chunk)
+            digest.update(chunk)
+            written += len(chunk)
+
+    if written != expected_size:
+        raise UploadError(400, f"Teil {part_number} unvollständig: {written} von {expected_size} Bytes")
+    checksum = digest.hexdigest()
+    if expected_sha256 and expected_sha256.lower() != checksum:
+        raise UploadError(400, f"Prüfsumme von Teil {part_number} stimmt nicht überein")
+
+    await anyio.to_thread.run_sync(_record_part, bind, upload_id, part_number, written, checksum)
+    return {"part_number": part_number, "offset": offset, "size": written, "sha256": checksum}
+
+
+def complete_upload(db: Session, upload_id: str, sha256: Optional[str] = None) -> Tuple[UploadedFile, bool]:
+    """
+    Schließt den Upload ab und liefert (Datei, jetzt abgeschlossen). Wiederholte
+    Aufrufe liefern dieselbe Datei mit ``False``, damit ein Client nach einer
+    verlorenen Antwort gefahrlos erneut abschließen kann, ohne dass die
+    Extraktion ein zweites Mal startet.
+    """
+    upload = get_upload(db, upload_id)
+    if upload.status == UPLOAD_COMPLETED:
+        uploaded = db.query(UploadedFile).filter(UploadedFile.id == upload.file_id).first()
+        if uploaded is None:
+            raise UploadError(410, "Hochgeladene Datei wurde inzwischen gelöscht")
+        return uploaded, False
+
+    missing: List[int] = upload_state(upload)["missing_parts"]
+    if missing:
+        raise UploadError(409, f"Es fehlen noch {len(missing)} Teile")
+
+    # Nur ein Aufruf darf abschließen
+    claimed = db.execute(
+        update(ResumableUpload)
+        .where(ResumableUpload.id == upload_id, ResumableUpload.status == UPLOAD_OPEN)
+        .values(status=UPLOAD_COMPLETING)
+    ).rowcount
+    db.commit()
+    if not claimed:
+        raise UploadError(409, "Upload wird bereits abgeschlossen")
+
+    source = partial_path(upload_id)
+    try:
+        file_hash = file_sha256(source)
+        expected = (sha256 or upload.sha256 or "").lower()
+        if expected and expected != file_hash:
+            raise UploadError(400, "Prüfsumme der Datei stimmt nicht überein")
+    except Exception:
+        db.execute(
+            update(ResumableUpload).where(ResumableUpload.id == upload_id).values(status=UPLOAD_OPEN)
+        )
+        db.commit()
+        raise
+
+    session_id = upload.session_id
+    if not session_id or not db.query(ChatSession.id).filter(ChatSession.id == session_id).first():
+        session = ChatSession(audit_id=upload.audit_id)
+        db.add(session)
+        db.flush()
+        session_id = session.id
+
+    file_id = generate_uuid()
+    target = stored_path(upload.audit_id, file_id, upload.filename)
+    os.replace(source, target)
+
+    uploaded = UploadedFile(
+        id=file_id,
+        audit_id=upload.audit_id,
+        session_id=session_id,
+        filename=upload.filename,
+        content_type=upload.content_type,
+        stored_path=target,
+        file_hash=file_hash,
+        extraction_status=EXTRACTION_PENDING,
+    )
+    db.add(uploaded)
+    db.flush()
+    upload.status = UPLOAD_COMPLETED
+    upload.file_id = uploaded.id
+    upload.parts = []
+    db.commit()
+    db.refresh(uploaded)
+    logger.info(f"Upload {upload_id} abgeschlossen: {upload.filename} ({upload.total_size} Bytes)")
+    return uploaded, True
+
+
+def abort_upload(db: Session, upload_id: str) -> None:
+    upload = get_upload(db, upload_id)
+    if upload.status != UPLOAD_OPEN:
+        raise UploadError(409, "Upload ist bereits abgeschlossen")
+    _remove(partial_path(upload_id))
+    db.delete(upload)
+    db.commit()
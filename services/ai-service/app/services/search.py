@@ -0,0 +1,234 @@
+"""
+Volltextsuche über Feststellungen, Risiken, Berichte und Dokumenttexte.
+
+Der Index ist die Tabelle ``search_entries`` (siehe app/models/database.py):
+unter Postgres mit generierter ``tsvector``-Spalte (deutsche Stammformen) und
+GIN-Index, unter SQLite mit einer FTS5-Tabelle, die per Trigger nachgeführt
+wird. Einträge werden nach jedem Flush aktualisiert – in derselben
+Transaktion wie die Änderung selbst, ein separater Indexlauf entfällt.
+"""
+import html
+import itertools
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import bindparam, event, func, insert, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.models.database import (
+    SEARCH_KINDS,
+    AuditFinding,
+    AuditReport,
+    Risk,
+    SearchEntry,
+    UploadedFile,
+    UploadedFileText,
+)
+
+# Markierungen aus dem Private-Use-Bereich; erst nach dem HTML-Escaping durch <mark> ersetzt
+MARK_OPEN = "\ue000"
+MARK_CLOSE = "\ue001"
+# Postgres begrenzt einen tsvector auf 1 MB; sehr lange Dokumente werden gekürzt indexiert
+MAX_BODY_CHARS = 500_000
+SNIPPET_WORDS = 24
+
+INDEXED_TYPES = (AuditFinding, Risk, AuditReport, UploadedFileText)
+
+
+# --- Indexpflege ---
+
+
+def _ref(obj: Any) -> Optional[Tuple[str, str]]:
+    if isinstance(obj, AuditFinding):
+        return "finding", obj.id
+    if isinstance(obj, Risk):
+        return "risk", str(obj.id)
+    if isinstance(obj, AuditReport):
+        return "report", obj.id
+    if isinstance(obj, UploadedFileText):
+        return "document", obj.file_id
+    if isinstance(obj, UploadedFile):
+        return "document", obj.id
+    return None
+
+
+def _entry(connection: Connection, obj: Any) -> Optional[Dict[str, Any]]:
+    kind, ref_id = _ref(obj)
+    if isinstance(obj, AuditFinding):
+        audit_id, title = obj.audit_id, obj.title
+        body = "\n".join(part for part in (obj.description, obj.action_description) if part)
+    elif isinstance(obj, Risk):
+        audit_id, title, body = obj.audit_id, obj.title, obj.description
+    elif isinstance(obj, AuditReport):
+        audit_id, title, body = obj.audit_id, f"Prüfungsbericht v{obj.version}", obj.content_markdown
+    else:
+        uploaded = connection.execute(
+            select(UploadedFile.filename, UploadedFile.audit_id).where(UploadedFile.id == obj.file_id)
+        ).first()
+        if uploaded is None:
+            return None
+        audit_id, title, body = uploaded.audit_id, uploaded.filename, obj.to_text()
+    return {
+        "kind": kind,
+        "ref_id": ref_id,
+        "audit_id": audit_id,
+        "title": title or "",
+        "body": (body or "")[:MAX_BODY_CHARS],
+    }
+
+
+def _upsert(connection: Connection, entry: Dict[str, Any]) -> None:
+    result = connection.execute(
+        update(SearchEntry)
+        .where(SearchEntry.kind == entry["kind"], SearchEntry.ref_id == entry["ref_id"])
+        .values(audit_id=entry["audit_id"], title=entry["title"], body=entry["body"])
+    )
+    if not result.rowcount:
+        connection.execute(insert(SearchEntry).values(**entry))
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_search_index(session: Session, flush_context) -> None:
+    """Überträgt neue, geänderte und gelöschte Objekte in den Suchindex."""
+    changed = [
+        obj for obj in itertools.chain(session.new, session.dirty)
+        if isinstance(obj, INDEXED_TYPES) and obj not in session.deleted
+        and (obj in session.new or session.is_modified(obj, include_collections=False))
+    ]
+    deleted = {_ref(obj) for obj in session.deleted if isinstance(obj, INDEXED_TYPES + (UploadedFile,))}
+    if not changed and not deleted:
+        return
+
+    connection = session.connection()
+    for kind, ref_id in deleted:
+        connection.execute(
+            SearchEntry.__table__.delete().where(SearchEntry.kind == kind, SearchEntry.ref_id == ref_id)
+        )
+    for obj in changed:
+        entry = _entry(connection, obj)
+        if entry is not None:
+            _upsert(connection, entry)
+
+
+def backfill(bind: Engine) -> int:
+    """Baut den Index aus den Bestandsdaten auf, falls er leer ist (z.B. nach dem ersten Start)."""
+    with Session(bind=bind) as db:
+        if db.query(func.count(SearchEntry.id)).scalar():
+            return 0
+        connection = db.connection()
+        indexed = 0
+        for model in INDEXED_TYPES:
+            batch = []
+            for obj in db.query(model).yield_per(200):
+                entry = _entry(connection, obj)
+                if entry is not None:
+                    batch.append(entry)
+                if len(batch) >= 200:
+                    connection.execute(insert(SearchEntry), batch)
+                    indexed += len(batch)
+                    batch = []
+            if batch:
+                connection.execute(insert(SearchEntry), batch)
+                indexed += len(batch)
+        db.commit()
+    return indexed
+
+
+# --- Suche ---
+
+
+def _render(value: Optional[str]) -> str:
+    return html.escape(value or "").replace(MARK_OPEN, "<mark>").replace(MARK_CLOSE, "</mark>")
+
+
+def _fts5_query(query: str) -> str:
+    """Suchbegriffe als Präfix-Phrasen (UND-verknüpft); FTS5-Syntax aus der Eingabe wird neutralisiert."""
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", query.lower()))
+
+
+def _filters(audit_id: Optional[int], kinds: Sequence[str], params: Dict[str, Any]) -> str:
+    clauses = ""
+    if audit_id is not None:
+        clauses += " AND e.audit_id = :audit_id"
+        params["audit_id"] = audit_id
+    if set(kinds) != set(SEARCH_KINDS):
+        clauses += " AND e.kind IN :kinds"
+        params["kinds"] = list(kinds)
+    return clauses
+
+
+def _search_sqlite(db: Session, query: str, params: Dict[str, Any], filters: str):
+    match = _fts5_query(query)
+    if not match:
+        return []
+    statement = text(
+        "SELECT e.kind, e.ref_id, e.audit_id, "
+        "highlight(search_fts, 0, :open, :close) AS title, "
+        "snippet(search_fts, 1, :open, :close, '…', :words) AS snippet, "
+        "-bm25(search_fts, 4.0, 1.0) AS score "
+        "FROM search_fts JOIN search_entries e ON e.id = search_fts.rowid "
+        f"WHERE search_fts MATCH :match{filters} "
+        "ORDER BY bm25(search_fts, 4.0, 1.0) LIMIT :limit"
+    )
+    return db.execute(statement.bindparams(*_expanding(params)), {**params, "match": match}).all()
+
+
+def _search_postgres(db: Session, query: str, params: Dict[str, Any], filters: str):
+    # Erst ranken und begrenzen, dann nur für die Treffer ts_headline berechnen
+    statement = text(
+        "WITH q AS (SELECT websearch_to_tsquery('german', :query) AS query), "
+        "hits AS ("
+        "  SELECT e.id, ts_rank_cd(e.document, q.query) AS score FROM search_entries e, q "
+        f"  WHERE e.document @@ q.query{filters} ORDER BY score DESC LIMIT :limit"
+        ") "
+        "SELECT e.kind, e.ref_id, e.audit_id, "
+        "ts_headline('german', e.title, q.query, :title_options) AS title, "
+        "ts_headline('german', e.body, q.query, :body_options) AS snippet, "
+        "hits.score "
+        "FROM hits JOIN search_entries e ON e.id = hits.id, q ORDER BY hits.score DESC"
+    )
+    marks = f"StartSel={MARK_OPEN}, StopSel={MARK_CLOSE}"
+    return db.execute(statement.bindparams(*_expanding(params)), {
+        **params,
+        "query": query,
+        "title_options": f"{marks}, HighlightAll=true",
+        "body_options": f"{marks}, MaxWords={SNIPPET_WORDS}, MinWords=8, MaxFragments=2, FragmentDelimiter=…",
+    }).all()
+
+
+def _expanding(params: Dict[str, Any]) -> list:
+    return [bindparam("kinds", expanding=True)] if "kinds" in params else []
+
+
+def search(
+    db: Session,
+    query: str,
+    audit_id: Optional[int] = None,
+    kinds: Sequence[str] = SEARCH_KINDS,
+    limit: int = 20,
+) -> List[Dict[str, Any]]:
+    """
+    Trefferliste nach Relevanz; ``title`` und ``snippet`` sind HTML-escaped,
+    Fundstellen mit ``<mark>`` hervorgehoben.
+    """
+    params: Dict[str, Any] = {
+        "limit": limit, "open": MARK_OPEN, "close": MARK_CLOSE, "words": SNIPPET_WORDS,
+    }
+    filters = _filters(audit_id, kinds, params)
+    if db.get_bind().dialect.name == "postgresql":
+        rows = _search_postgres(db, query, params, filters)
+    else:
+        rows = _search_sqlite(db, query, params, filters)
+
+    return [
+        {
+            "type": row.kind,
+            "id": int(row.ref_id) if row.kind == "risk" else row.ref_id,
+            "audit_id": row.audit_id,
+            "title": _render(row.title),
+            "snippet": _render(row.snippet),
+            "score": round(float(row.score), 4),
+        }
+        for row in rows
+    ]
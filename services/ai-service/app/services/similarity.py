@@ -0,0 +1,471 @@
+"""
+Ähnliche Feststellungen und Risiken über Text-Embeddings.
+
+- Ein after_flush-Hook markiert neue bzw. inhaltlich geänderte Feststellungen
+  und Risiken als ausstehend (``TextEmbedding.vector`` ist NULL),
+- der ``EmbeddingWorker`` berechnet ausstehende Embeddings gebündelt im Hintergrund,
+- ``SimilarityIndex`` hält alle fertigen Vektoren im Speicher und lädt nur
+  neu berechnete nach; eine Anfrage ist ein Matrix-Vektor-Produkt.
+
+Bestandsdaten werden mit ``backfill`` eingeplant (beim Start automatisch
+oder per ``python -m app.services.similarity``).
+"""
+import array
+import hashlib
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from openai import OpenAI
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.database import Audit, AuditFinding, Risk, TextEmbedding
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_KINDS = ("finding", "risk")
+# Eingaben werden auf diese Länge gekürzt (weit unter dem Token-Limit des Modells)
+MAX_INPUT_CHARS = 8000
+# Spätestens nach dieser Zeit versucht der Worker fehlgeschlagene Batches erneut
+POLL_SECONDS = 30.0
+
+
+def embedding_text(title: Optional[str], description: Optional[str]) -> str:
+    return "\n".join(part.strip() for part in (title, description) if part and part.strip())[:MAX_INPUT_CHARS]
+
+
+def _content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _ref(obj: Any) -> Tuple[str, str]:
+    if isinstance(obj, AuditFinding):
+        return "finding", obj.id
+    return "risk", str(obj.id)
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return array.array("f", (v / norm for v in vector)).tobytes()
+
+
+def _unpack(raw: bytes):
+    if numpy is not None:
+        return numpy.frombuffer(raw, dtype=numpy.float32)
+    return array.array("f", raw)
+
+
+# --- Änderungen erfassen ---
+
+
+@event.listens_for(Session, "after_flush")
+def _track_changes(session: Session, flush_context) -> None:
+    """Plant Embeddings für neue und inhaltlich geänderte Feststellungen/Risiken ein."""
+    changed = [
+        obj for obj in itertools.chain(session.new, session.dirty)
+        if isinstance(obj, (AuditFinding, Risk)) and obj not in session.deleted
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, (AuditFinding, Risk))]
+    if not changed and not deleted:
+        return
+
+    connection = session.connection()
+    for obj in deleted:
+        kind, ref_id = _ref(obj)
+        connection.execute(
+            delete(TextEmbedding).where(TextEmbedding.kind == kind, TextEmbedding.ref_id == ref_id)
+        )
+    for obj in changed:
+        kind, ref_id = _ref(obj)
+        content_hash = _content_hash(embedding_text(obj.title, obj.description))
+        where = (TextEmbedding.kind == kind, TextEmbedding.ref_id == ref_id)
+        current = connection.execute(select(TextEmbedding.content_hash).where(*where)).scalar()
+        if current == content_hash:
+            continue
+        if current is None:
+            connection.execute(insert(TextEmbedding).values(
+                kind=kind, ref_id=ref_id, audit_id=obj.audit_id, content_hash=content_hash,
+            ))
+        else:
+            connection.execute(update(TextEmbedding).where(*where).values(
+                audit_id=obj.audit_id, content_hash=content_hash, vector=None, model=None, embedded_at=None,
+            ))
+        session.info["similarity_pending"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_worker(session: Session) -> None:
+    if session.info.pop("similarity_pending", False):
+        embedding_worker.notify(session.get_bind())
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session) -> None:
+    session.info.pop("similarity_pending", None)
+
+
+def backfill(bind: Engine, model: Optional[str] = None) -> int:
+    """
+    Plant Embeddings für alle Feststellungen und Risiken ohne aktuellen Vektor ein.
+
+    Vektoren eines anderen Modells bzw. einer anderen Dimension werden dabei verworfen.
+    """
+    model = model or embedding_worker.model
+    with Session(bind=bind) as db:
+        db.query(TextEmbedding).filter(
+            TextEmbedding.vector.isnot(None), TextEmbedding.model != model
+        ).update({TextEmbedding.vector: None, TextEmbedding.model: None, TextEmbedding.embedded_at: None},
+                 synchronize_session=False)
+
+        existing = set(db.query(TextEmbedding.kind, TextEmbedding.ref_id).all())
+        rows = []
+        for kind, source in (("finding", AuditFinding), ("risk", Risk)):
+            query = db.query(source.id, source.audit_id, source.title, source.description)
+            for ref_id, audit_id, title, description in query.yield_per(500):
+                if (kind, str(ref_id)) in existing:
+                    continue
+                rows.append({
+                    "kind": kind,
+                    "ref_id": str(ref_id),
+                    "audit_id": audit_id,
+                    "content_hash": _content_hash(embedding_text(title, description)),
+                })
+        for start in range(0, len(rows), 500):
+            db.execute(insert(TextEmbedding), rows[start:start + 500])
+        db.commit()
+    return len(rows)
+
+
+# --- Hintergrundberechnung ---
+
+
+class EmbeddingWorker:
+    def __init__(
+        self,
+        batch_size: int,
+        dimensions: int,
+        model: Optional[str] = None,
+        embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+    ) -> None:
+        self.batch_size = max(1, batch_size)
+        self.dimensions = dimensions
+        self.embedding_model = settings.openai_embedding_model
+        # Modell und Dimension gemeinsam: Vektoren sind nur innerhalb derselben Kennung vergleichbar
+        self.model = model or f"{self.embedding_model}:{dimensions}"
+        self._embed = embed or self._openai_embed
+        self._client: Optional[OpenAI] = None
+
+        self._bind: Optional[Engine] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"batches": 0, "embedded": 0, "failures": 0}
+
+    @classmethod
+    def from_settings(cls) -> "EmbeddingWorker":
+        return cls(batch_size=settings.similarity_batch_size, dimensions=settings.similarity_dimensions)
+
+    def start(self, bind: Engine) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._bind = bind
+            self._thread = threading.Thread(target=self._loop, name="embedding-worker", daemon=True)
+            self._thread.start()
+
+    def notify(self, bind: Engine) -> None:
+        """Nach dem Commit neuer oder geänderter Texte aufrufen."""
+        if not settings.similarity_worker_enabled:
+            return
+        self.start(bind)
+        self._wakeup.set()
+
+    def _loop(self) -> None:
+        while True:
+            self._wakeup.wait(timeout=POLL_SECONDS)
+            self._wakeup.clear()
+            try:
+                self.run_pending(self._bind)
+            except Exception as e:
+                self._stats["failures"] += 1
+                logger.warning(f"Berechnung der Embeddings fehlgeschlagen, neuer Versuch später: {e}")
+
+    def run_pending(self, bind: Engine) -> int:
+        """Berechnet alle ausstehenden Embeddings synchron (z.B. für den Backfill und Tests)."""
+        total = 0
+        while True:
+            processed = self._run_batch(bind)
+            if not processed:
+                return total
+            total += processed
+
+    def _run_batch(self, bind: Engine) -> int:
+        with Session(bind=bind) as db:
+            pending = (
+                db.query(TextEmbedding.id, TextEmbedding.kind, TextEmbedding.ref_id, TextEmbedding.content_hash)
+                .filter(TextEmbedding.vector.is_(None))
+                .order_by(TextEmbedding.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not pending:
+                return 0
+
+            texts = _load_texts(db, pending)
+            items = []
+            for row in pending:
+                text = texts.get((row.kind, row.ref_id))
+                if text is None:
+                    # Quelle inzwischen gelöscht
+                    db.execute(delete(TextEmbedding).where(TextEmbedding.id == row.id))
+                elif _content_hash(text) == row.content_hash:
+                    items.append((row, text))
+            if not items:
+                db.commit()
+                return len(pending)
+
+            vectors = self._embed([text for _, text in items])
+            now = time.time()
+            for (row, _), vector in zip(items, vectors):
+                # Nur speichern, wenn sich der Text seitdem nicht erneut geändert hat
+                db.execute(
+                    update(TextEmbedding)
+                    .where(TextEmbedding.id == row.id, TextEmbedding.content_hash == row.content_hash)
+                    .values(vector=_pack(vector), model=self.model, embedded_at=now)
+                )
+            db.commit()
+            self._stats["batches"] += 1
+            self._stats["embedded"] += len(items)
+            return len(pending)
+
+    def _openai_embed(self, texts: List[str]) -> List[List[float]]:
+        if self._client is None:
+            if not settings.openai_api_key:
+                raise RuntimeError("OPENAI_API_KEY is not configured")
+            self._client = OpenAI(api_key=settings.openai_api_key)
+        response = self._client.embeddings.create(
+            model=self.embedding_model, input=texts, dimensions=self.dimensions,
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def metrics(self, bind: Engine) -> Dict[str, Any]:
+        with Session(bind=bind) as db:
+            pending = db.query(func.count(TextEmbedding.id)).filter(TextEmbedding.vector.is_(None)).scalar()
+            ready = db.query(func.count(TextEmbedding.id)).filter(TextEmbedding.vector.isnot(None)).scalar()
+        return {
+            "worker_enabled": settings.similarity_worker_enabled,
+            "model": self.model,
+            "pending": pending,
+            "ready": ready,
+            "indexed": similarity_index.size(),
+            **self._stats,
+        }
+
+
+def _load_texts(db: Session, rows: Sequence[Any]) -> Dict[Tuple[str, str], str]:
+    finding_ids = [row.ref_id for row in rows if row.kind == "finding"]
+    risk_ids = [int(row.ref_id) for row in rows if row.kind == "risk"]
+    texts = {}
+    if finding_ids:
+        for ref_id, title, description in db.query(
+            AuditFinding.id, AuditFinding.title, AuditFinding.description
+        ).filter(AuditFinding.id.in_(finding_ids)):
+            texts[("finding", ref_id)] = embedding_text(title, description)
+    if risk_ids:
+        for ref_id, title, description in db.query(Risk.id, Risk.title, Risk.description).filter(Risk.id.in_(risk_ids)):
+            texts[("risk", str(ref_id))] = embedding_text(title, description)
+    return texts
+
+
+# --- Index im Speicher ---
+
+
+class SimilarityIndex:
+    """
+    Alle fertigen Vektoren als Matrix (mit numpy) bzw. Liste von Arrays.
+
+    Vor jeder Anfrage prüft eine Aggregatabfrage (Anzahl, jüngster Zeitstempel),
+    ob andere Prozesse neue Vektoren geschrieben haben; nachgeladen werden nur
+    diese. Gibt es ausstehende Einträge, werden deren veraltete Vektoren
+    verworfen. Stimmt die Anzahl danach nicht, wird der Index vollständig neu geladen.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rows: Dict[Tuple[str, str], Tuple[int, str, Any]] = {}  # Schlüssel -> (audit_id, model, vector)
+        self._loaded_until = 0.0
+        self._matrix = None  # (keys, audit_ids, models, matrix), bei Änderungen verworfen
+
+    def size(self) -> int:
+        return len(self._rows)
+
+    def _load(self, db: Session, since: Optional[float]) -> None:
+        query = db.query(
+            TextEmbedding.kind, TextEmbedding.ref_id, TextEmbedding.audit_id,
+            TextEmbedding.model, TextEmbedding.vector, TextEmbedding.embedded_at,
+        ).filter(TextEmbedding.vector.isnot(None))
+        if since is None:
+            self._rows = {}
+            self._loaded_until = 0.0
+        else:
+            query = query.filter(TextEmbedding.embedded_at > since)
+        for kind, ref_id, audit_id, model, vector, embedded_at in query.yield_per(1000):
+            self._rows[(kind, ref_id)] = (audit_id, model, _unpack(vector))
+            self._loaded_until = max(self._loaded_until, embedded_at or 0.0)
+        self._matrix = None
+
+    def _drop_pending(self, db: Session) -> None:
+        """Entfernt Einträge, deren Vektor inzwischen ungültig ist (Text geändert, Modellwechsel)."""
+        pending = db.query(TextEmbedding.kind, TextEmbedding.ref_id).filter(TextEmbedding.embedded_at.is_(None))
+        dropped = [key for key in pending if self._rows.pop(tuple(key), None) is not None]
+        if dropped:
+            self._matrix = None
+
+    def refresh(self, db: Session) -> None:
+        # embedded_at ist genau bei fertigen Vektoren gesetzt
+        total, count, latest = db.query(
+            func.count(TextEmbedding.id), func.count(TextEmbedding.embedded_at), func.max(TextEmbedding.embedded_at)
+        ).one()
+        with self._lock:
+            # Eine Invalidierung fällt in Anzahl und Zeitstempel nicht auf, wenn gleichzeitig
+            # ein anderer Vektor hinzukommt; ausstehende Einträge daher direkt prüfen
+            if total > count:
+                self._drop_pending(db)
+            if (latest or 0.0) > self._loaded_until:
+                self._load(db, self._loaded_until)
+            if count != len(self._rows):
+                self._load(db, None)
+
+    def _snapshot(self):
+        """Spaltenweise Sicht auf den Index; wird nach jedem Nachladen einmal neu aufgebaut."""
+        if self._matrix is None:
+            keys = list(self._rows)
+            audit_ids = [self._rows[key][0] for key in keys]
+            models = [self._rows[key][1] for key in keys]
+            vectors = [self._rows[key][2] for key in keys]
+            kinds = [key[0] for key in keys]
+            if numpy is not None and keys:
+                # Vektoren abweichender Dimension (altes Modell) zählen nicht mit
+                dimensions = len(vectors[0])
+                models = [m if len(v) == dimensions else None for m, v in zip(models, vectors)]
+                vectors = numpy.vstack([
+                    v if len(v) == dimensions else numpy.zeros(dimensions, dtype=numpy.float32) for v in vectors
+                ])
+                audit_ids = numpy.array(audit_ids)
+                models = numpy.array(models, dtype=object)
+                kinds = numpy.array(kinds, dtype=object)
+            self._matrix = (keys, audit_ids, models, kinds, vectors)
+        return self._matrix
+
+    def nearest(
+        self,
+        key: Tuple[str, str],
+        k: int,
+        kinds: Sequence[str],
+        exclude_audit_id: Optional[int],
+    ) -> Optional[List[Tuple[Tuple[str, str], int, float]]]:
+        """Die ``k`` ähnlichsten Einträge zu ``key`` oder None, falls für ``key`` noch kein Vektor vorliegt."""
+        with self._lock:
+            target = self._rows.get(key)
+            if target is None:
+                return None
+            _, model, query = target
+            keys, audit_ids, models, row_kinds, vectors = self._snapshot()
+
+        if numpy is not None:
+            if len(query) != vectors.shape[1]:
+                return []
+            mask = (models == model) & numpy.isin(row_kinds, list(kinds))
+            if exclude_audit_id is not None:
+                mask &= audit_ids != exclude_audit_id
+            mask[keys.index(key)] = False
+            scores = numpy.where(mask, vectors @ query, -numpy.inf)
+            top = numpy.argpartition(-scores, k - 1)[:k] if len(scores) > k else numpy.arange(len(scores))
+            top = top[numpy.argsort(-scores[top])]
+            return [(keys[i], int(audit_ids[i]), float(scores[i])) for i in top if mask[i]]
+
+        candidates = (
+            (sum(a * b for a, b in zip(vector, query)), i)
+            for i, vector in enumerate(vectors)
+            if keys[i] != key and models[i] == model and row_kinds[i] in kinds
+            and (exclude_audit_id is None or audit_ids[i] != exclude_audit_id)
+        )
+        return [(keys[i], audit_ids[i], score) for score, i in heapq.nlargest(k, candidates)]
+
+
+def find_similar(
+    db: Session,
+    kind: str,
+    ref_id: str,
+    audit_id: int,
+    k: int = 5,
+    kinds: Sequence[str] = ("finding",),
+    include_same_audit: bool = False,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Ähnliche Feststellungen/Risiken inklusive Maßnahmenbeschreibung, absteigend
+    nach Kosinus-Ähnlichkeit. None, solange das Embedding noch aussteht.
+    """
+    similarity_index.refresh(db)
+    # Etwas mehr Kandidaten, falls Quellen inzwischen gelöscht wurden
+    hits = similarity_index.nearest(
+        (kind, ref_id), k + 5, kinds, None if include_same_audit else audit_id
+    )
+    if hits is None:
+        return None
+
+    finding_ids = [key[1] for key, _, _ in hits if key[0] == "finding"]
+    risk_ids = [int(key[1]) for key, _, _ in hits if key[0] == "risk"]
+    findings = {f.id: f for f in db.query(AuditFinding).filter(AuditFinding.id.in_(finding_ids))} if finding_ids else {}
+    risks = {str(r.id): r for r in db.query(Risk).filter(Risk.id.in_(risk_ids))} if risk_ids else {}
+    audit_titles = dict(
+        db.query(Audit.id, Audit.title).filter(Audit.id.in_({a for _, a, _ in hits})).all()
+    ) if hits else {}
+
+    results = []
+    for (hit_kind, hit_id), hit_audit_id, score in hits:
+        source = findings.get(hit_id) if hit_kind == "finding" else risks.get(hit_id)
+        if source is None:
+            continue
+        item = {
+            "type": hit_kind,
+            "id": source.id,
+            "audit_id": source.audit_id,
+            "audit_title": audit_titles.get(source.audit_id),
+            "title": source.title,
+            "description": source.description,
+            "score": round(score, 4),
+        }
+        if hit_kind == "finding":
+            item["severity"] = source.severity
+            item["action_description"] = source.action_description
+        results.append(item)
+        if len(results) >= k:
+            break
+    return results
+
+
+embedding_worker = EmbeddingWorker.from_settings()
+similarity_index = SimilarityIndex()
+
+
+if __name__ == "__main__":
+    from app.models.database import engine, init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    scheduled = backfill(engine)
+    logger.info(f"{scheduled} Embeddings eingeplant, berechne ...")
+    logger.info(f"{embedding_worker.run_pending(engine)} Embeddings berechnet.")
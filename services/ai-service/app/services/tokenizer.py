@@ -0,0 +1,70 @@
+import logging
+from functools import lru_cache
+from typing import List
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Grobe Schätzung, falls tiktoken bzw. dessen Encoding-Dateien nicht verfügbar sind
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken-Encoding nicht verfügbar, nutze Schätzung: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Zählt Tokens lokal (tiktoken) oder schätzt sie über die Zeichenanzahl."""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_by_tokens(text: str, max_tokens: int, model: str) -> List[str]:
+    """
+    Teilt Text in Abschnitte mit höchstens ``max_tokens`` Tokens.
+    Getrennt wird an Zeilengrenzen; überlange Zeilen werden hart geteilt.
+    """
+    sections: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    def flush() -> None:
+        nonlocal current, current_tokens
+        if current:
+            sections.append("\n".join(current).strip())
+        current = []
+        current_tokens = 0
+
+    for line in text.replace("\r\n", "\n").split("\n"):
+        line_tokens = count_tokens(line, model) + 1
+        if line_tokens > max_tokens:
+            flush()
+            step = max(1, len(line) * max_tokens // line_tokens)
+            for start in range(0, len(line), step):
+                sections.append(line[start:start + step])
+            continue
+        if current_tokens + line_tokens > max_tokens:
+            flush()
+        current.append(line)
+        current_tokens += line_tokens
+
+    flush()
+    return [s for s in sections if s]
@@ -0,0 +1,95 @@
+"""
+Misst Frames und CPU-Zeit pro gestreamter Chat-Antwort.
+
+Ein simulierter OpenAI-Stream liefert Token-Deltas im festen Takt; die Antwort
+läuft durch FastAPI/Starlette (httpx-ASGI-Transport) und wird wie in
+``chatService.ts`` zeilenweise geparst. Verglichen werden: jedes Delta als
+eigener Frame mit ``json`` (bisheriges Verhalten) und gebündelte Frames mit
+dem schnelleren Encoder.
+
+    python benchmarks/chat_stream.py [--deltas 1500] [--interval-ms 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from app.services.ndjson import coalesce, encode_frame
+
+
+async def fake_deltas(count: int, interval: float):
+    for i in range(count):
+        await asyncio.sleep(interval)
+        yield f" tok{i % 10}"
+
+
+def json_frame(frame: dict) -> str:
+    return json.dumps(frame) + "\n"
+
+
+def build_app(deltas: int, interval: float, flush_ms: float, flush_chars: int, encoder) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/chat")
+    async def chat():
+        async def generate():
+            yield encoder({"type": "metadata", "session_id": "bench", "sources": []})
+            async for text in coalesce(fake_deltas(deltas, interval), flush_ms / 1000, flush_chars):
+                yield encoder({"type": "content", "chunk": text})
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    return app
+
+
+async def run(label: str, app: FastAPI) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        frames = 0
+        text = []
+        async with client.stream("POST", "/chat") as response:
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                frame = json.loads(line)
+                frames += 1
+                if frame["type"] == "content":
+                    text.append(frame["chunk"])
+        cpu = time.process_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+    print(f"{label:<34} frames={frames:>5}  cpu={cpu * 1000:>7.1f} ms  wall={wall:>5.2f} s  chars={len(''.join(text))}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--deltas", type=int, default=1500)
+    parser.add_argument("--interval-ms", type=float, default=2.0)
+    parser.add_argument("--flush-ms", type=float, default=30.0)
+    parser.add_argument("--flush-chars", type=int, default=256)
+    args = parser.parse_args()
+    interval = args.interval_ms / 1000
+
+    # Grundlast des simulierten Upstreams (Timer pro Delta), in beiden Messungen enthalten
+    cpu_start = time.process_time()
+    async for _ in fake_deltas(args.deltas, interval):
+        pass
+    print(f"{'Grundlast: nur simulierter Upstream':<34} cpu={(time.process_time() - cpu_start) * 1000:>7.1f} ms")
+
+    await run("vorher: ein Frame pro Delta (json)", build_app(args.deltas, interval, 0, 0, json_frame))
+    await run(
+        "nachher: gebündelt (encode_frame)",
+        build_app(args.deltas, interval, args.flush_ms, args.flush_chars, encode_frame),
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
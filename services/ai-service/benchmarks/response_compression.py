@@ -0,0 +1,107 @@
+"""
+Misst Bytes auf der Leitung für typische Antworten mit und ohne Kompression.
+
+Legt in einer temporären SQLite-Datenbank ein Audit mit Feststellungen,
+Risiken, mehreren Berichtsversionen und Dokumentanalysen an und ruft die
+Lese-Endpunkte mit ``Accept-Encoding: identity``, ``gzip`` und (falls das
+Paket ``brotli`` installiert ist) ``br`` ab.
+
+    python benchmarks/response_compression.py [--reports 10] [--findings 200]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp = tempfile.mkdtemp(prefix="compression-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp, 'bench.db')}")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_tmp, "uploads"))
+os.environ.setdefault("INDEX_WORKER_ENABLED", "false")
+
+import httpx
+
+from app.api import compression
+from app.config import settings
+from app.main import app
+from app.models.database import DocumentAnalysis, SessionLocal, UploadedFile, init_db
+
+
+def seed_analyses(audit_id: int, count: int) -> str:
+    """Analysen lassen sich ohne LLM nicht über die API erzeugen; daher direkt anlegen."""
+    with SessionLocal() as db:
+        uploaded = UploadedFile(audit_id=audit_id, filename="vertrag.pdf", stored_path="/dev/null")
+        db.add(uploaded)
+        db.flush()
+        for i in range(count):
+            db.add(DocumentAnalysis(
+                file_id=uploaded.id,
+                analysis_type="RISK",
+                model="bench",
+                result="\n".join(
+                    f"- Risiko {i}.{j}: Die Vertragsklausel {j} regelt die Haftung nicht eindeutig; "
+                    "Empfehlung: Haftungshöchstgrenze und Kündigungsrechte ergänzen."
+                    for j in range(40)
+                ),
+            ))
+        db.commit()
+        return uploaded.id
+
+
+async def measure(client: httpx.AsyncClient, label: str, url: str, encodings: list) -> None:
+    sizes = []
+    for encoding in encodings:
+        started = time.perf_counter()
+        async with client.stream("GET", url, headers={"Accept-Encoding": encoding}) as response:
+            raw = b"".join([chunk async for chunk in response.aiter_raw()])
+        elapsed = (time.perf_counter() - started) * 1000
+        sizes.append(f"{encoding}={len(raw):>8} B ({elapsed:>5.1f} ms)")
+    print(f"{label:<28} " + "  ".join(sizes))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--reports", type=int, default=10)
+    parser.add_argument("--findings", type=int, default=200)
+    parser.add_argument("--analyses", type=int, default=20)
+    args = parser.parse_args()
+
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        audit = (await client.post("/api/audits", json={
+            "title": "Jahresabschlussprüfung",
+            "description": "Prüfung der internen Kontrollen im Einkauf. " * 20,
+        })).json()
+        audit_id = audit["id"]
+        for i in range(args.findings):
+            await client.post(f"/api/findings/audits/{audit_id}", json={
+                "title": f"Feststellung {i}: Vier-Augen-Prinzip nicht eingehalten",
+                "description": "Bestellungen über 10.000 EUR wurden ohne zweite Freigabe ausgelöst. " * 3,
+                "severity": ("LOW", "MEDIUM", "HIGH")[i % 3],
+            })
+            await client.post(f"/api/risks/audits/{audit_id}", json={
+                "title": f"Risiko {i}", "description": "Unautorisierte Zahlungen", "impact": "HIGH",
+            })
+        for _ in range(args.reports):
+            await client.post(f"/api/reports/audits/{audit_id}/generate", json={"use_ai": False, "force": True})
+        file_id = seed_analyses(audit_id, args.analyses)
+
+        encodings = ["identity", "gzip"] + (["br"] if compression.brotli is not None else [])
+        print(
+            f"Mindestgröße {settings.compression_min_size} B, "
+            f"Brotli {'verfügbar' if compression.brotli else 'nicht installiert'}"
+        )
+        await measure(client, "GET /audits/{id}", f"/api/audits/{audit_id}", encodings)
+        await measure(client, "GET /findings/audits/{id}", f"/api/findings/audits/{audit_id}", encodings)
+        await measure(client, "GET /risks/audits/{id}", f"/api/risks/audits/{audit_id}", encodings)
+        await measure(client, "GET /reports/audits/{id}", f"/api/reports/audits/{audit_id}", encodings)
+        await measure(client, "GET /analysis/document/{id}", f"/api/analysis/document/{file_id}", encodings)
+        await measure(client, "GET /audits/{id}/overview", f"/api/audits/{audit_id}/overview", encodings)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
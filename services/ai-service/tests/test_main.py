@@ -1,25 +1,28 @@
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 from unittest.mock import MagicMock, AsyncMock
 
 import sys
 import os
+import tempfile
 sys.path.append(os.getcwd())
 os.environ["OPENAI_API_KEY"] = "dummy"
+# Indexierungsaufträge werden in den Tests gezielt mit eigenem Worker abgearbeitet
+os.environ["INDEX_WORKER_ENABLED"] = "false"
+os.environ["SIMILARITY_WORKER_ENABLED"] = "false"
 
 from app.main import app
 from app.models.database import Base, get_db
 from app.api.routes import chat
 
-# Setup in-memory SQLite database
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Setup temporary SQLite database (eine Datei statt :memory:, damit die
+# Hintergrund-Extraktion eigene Verbindungen neben den Requests öffnen kann)
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -48,6 +51,18 @@ mock_ai_service.chat = AsyncMock(return_value={
 # Patch the global instance in the route
 chat.ai_service = mock_ai_service
 
+def wait_for_extraction(file_id, timeout=30.0):
+    """Wartet, bis die Hintergrund-Extraktion eines Uploads abgeschlossen ist."""
+    import time
+
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(f"/api/upload/{file_id}/status").json()
+        if status["extraction_status"] in ("READY", "FAILED") or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
 def test_chat_endpoint():
     response = client.post(
         "/api/chat",
@@ -60,3 +75,1217 @@ def test_chat_endpoint():
     
     # Verify service called
     assert mock_ai_service.chat.called
+
+
+def test_findings_keyset_pagination():
+    audit = client.post("/api/audits", json={"title": "Paging"}).json()
+    for i in range(5):
+        client.post(f"/api/findings/audits/{audit['id']}", json={"title": f"F{i}"})
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    seen = []
+    cursor = None
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            statements.clear()
+            response = client.get(f"/api/findings/audits/{audit['id']}", params=params)
+            assert response.status_code == 200
+            # Anzahl und Seitenschlüssel werden für ETag und Antwort nur einmal abgefragt
+            assert sum("count(" in sql.lower() for sql in statements) == 1
+            assert len(statements) == 4  # Audit, Anzahl, Schlüssel, Zeilen
+            assert response.headers["X-Total-Count"] == "5"
+            page = response.json()
+            assert len(page) <= 2
+            seen.extend(f["id"] for f in page)
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert len(seen) == 5
+    assert len(set(seen)) == 5
+
+    response = client.get(f"/api/findings/audits/{audit['id']}", params={"cursor": "!!"})
+    assert response.status_code == 400
+
+
+def test_dashboard_stats():
+    audit = client.post("/api/audits", json={"title": "Dashboard"}).json()
+    finding = client.post(
+        f"/api/findings/audits/{audit['id']}",
+        json={"title": "Überfällig", "severity": "HIGH"},
+    ).json()
+    client.patch(f"/api/findings/{finding['id']}", json={"action_due_date": "2000-01-01"})
+
+    response = client.get("/api/dashboard/stats", params={"fresh": True})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total_audits"] >= 1
+    assert data["high_severity_findings"] >= 1
+    assert any(f["id"] == finding["id"] for f in data["overdue_preview"])
+    rollup = next(r for r in data["per_audit"] if r["audit_id"] == audit["id"])
+    assert rollup == {
+        "audit_id": audit["id"],
+        "total_findings": 1,
+        "open_findings": 1,
+        "high_severity_findings": 1,
+        "overdue_actions": 1,
+    }
+
+
+def test_audit_overview():
+    audit = client.post("/api/audits", json={"title": "Overview"}).json()
+    client.post(f"/api/findings/audits/{audit['id']}", json={"title": "F"})
+    client.post(f"/api/risks/audits/{audit['id']}", json={"title": "R"})
+    client.post(f"/api/reports/audits/{audit['id']}/generate", json={"use_ai": False})
+
+    response = client.get(f"/api/audits/{audit['id']}/overview")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["title"] == "Overview"
+    assert [f["title"] for f in data["findings"]] == ["F"]
+    assert [r["title"] for r in data["risks"]] == ["R"]
+    assert data["documents"] == []
+    assert "content_markdown" not in data["reports"][0]
+
+    response = client.get(
+        f"/api/audits/{audit['id']}/overview",
+        params={"include": "reports", "expand": "report_content"},
+    )
+    data = response.json()
+    assert "findings" not in data
+    assert data["reports"][0]["content_markdown"].startswith("# Prüfungsbericht")
+    # Listen in der Form der einzelnen Routen, damit die Phasenseiten sie direkt übernehmen können
+    assert data["reports"] == client.get(f"/api/reports/audits/{audit['id']}").json()
+
+    assert client.get(f"/api/audits/{audit['id']}/overview", params={"include": "foo"}).status_code == 400
+
+
+def test_conditional_get_with_etags():
+    audit = client.post("/api/audits", json={"title": "ETag"}).json()
+    finding = client.post(f"/api/findings/audits/{audit['id']}", json={"title": "F"}).json()
+
+    for url in (
+        f"/api/audits/{audit['id']}",
+        f"/api/audits/{audit['id']}/overview",
+        f"/api/findings/audits/{audit['id']}",
+        f"/api/findings/{finding['id']}",
+    ):
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag.startswith('W/"')
+
+        cached = client.get(url, headers={"If-None-Match": etag})
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["ETag"] == etag
+
+    list_url = f"/api/findings/audits/{audit['id']}"
+    etag = client.get(list_url).headers["ETag"]
+    detail_etag = client.get(f"/api/findings/{finding['id']}").headers["ETag"]
+    client.patch(f"/api/findings/{finding['id']}", json={"status": "CLOSED"})
+
+    response = client.get(list_url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["status"] == "CLOSED"
+    assert response.headers["ETag"] != etag
+    assert client.get(f"/api/findings/{finding['id']}", headers={"If-None-Match": detail_etag}).status_code == 200
+
+    client.post(f"/api/findings/audits/{audit['id']}", json={"title": "G"})
+    refreshed = client.get(list_url, headers={"If-None-Match": response.headers["ETag"]})
+    assert refreshed.status_code == 200
+    assert refreshed.headers["X-Total-Count"] == "2"
+
+
+def test_audit_export_streams_zip(tmp_path, monkeypatch):
+    import io
+    import json
+    import zipfile
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    audit = client.post("/api/audits", json={"title": "Export"}).json()
+    client.post(f"/api/findings/audits/{audit['id']}", json={"title": "Kasse; \"offen\"", "severity": "HIGH"})
+    client.post(f"/api/risks/audits/{audit['id']}", json={"title": "Betrug"})
+    client.post(f"/api/reports/audits/{audit['id']}/generate", json={"use_ai": False})
+    upload = client.post(
+        "/api/upload",
+        data={"audit_id": str(audit["id"])},
+        files={"file": ("../notiz.txt", "Prüfnotiz".encode("utf-8"), "text/plain")},
+    ).json()
+
+    response = client.get(f"/api/audits/{audit['id']}/export")
+    assert response.status_code == 200
+    assert response.headers["Content-Type"] == "application/zip"
+    assert "Content-Length" not in response.headers
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.testzip() is None
+    names = archive.namelist()
+    assert {"audit.json", "findings.csv", "findings.json", "risks.csv", "risks.json", "analyses.jsonl", "manifest.json"} <= set(names)
+    assert archive.read(f"documents/{upload['id'][:8]}_notiz.txt").decode("utf-8") == "Prüfnotiz"
+    report = next(n for n in names if n.startswith("reports/bericht_v1_"))
+    assert archive.read(report).decode("utf-8").startswith("# Prüfungsbericht")
+    assert 'Kasse; ""offen""' in archive.read("findings.csv").decode("utf-8-sig")
+    manifest = json.loads(archive.read("manifest.json"))
+    assert (manifest["findings"], manifest["risks"], manifest["documents"]) == (1, 1, 1)
+
+    assert client.get("/api/audits/999999/export").status_code == 404
+
+
+def test_file_content_supports_ranges_and_conditional_requests(tmp_path, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    audit = client.post("/api/audits", json={"title": "Download"}).json()
+    payload = bytes(range(256)) * 1024
+    upload = client.post(
+        "/api/upload",
+        data={"audit_id": str(audit["id"])},
+        files={"file": ("scan.pdf", payload, "application/octet-stream")},
+    ).json()
+    url = f"/api/upload/{upload['id']}/content"
+
+    full = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert full.status_code == 200
+    assert full.content == payload
+    assert full.headers["Content-Type"] == "application/pdf"
+    assert full.headers["Accept-Ranges"] == "bytes"
+    assert full.headers["Content-Disposition"].startswith("inline")
+    assert "Content-Encoding" not in full.headers
+    etag = full.headers["ETag"]
+
+    part = client.get(url, headers={"Range": "bytes=1000-1999"})
+    assert part.status_code == 206
+    assert part.content == payload[1000:2000]
+    assert part.headers["Content-Range"] == f"bytes 1000-1999/{len(payload)}"
+    assert part.headers["Content-Length"] == "1000"
+
+    tail = client.get(url, headers={"Range": "bytes=-100"})
+    assert tail.status_code == 206 and tail.content == payload[-100:]
+
+    stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"veraltet"'})
+    assert stale.status_code == 200 and len(stale.content) == len(payload)
+    assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag}).status_code == 206
+
+    unsatisfiable = client.get(url, headers={"Range": f"bytes={len(payload)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["Content-Range"] == f"bytes */{len(payload)}"
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    since = client.get(url, headers={"If-Modified-Since": full.headers["Last-Modified"]})
+    assert since.status_code == 304
+
+    download = client.get(url, params={"download": "true"})
+    assert download.headers["Content-Disposition"].startswith("attachment")
+    assert client.get("/api/upload/unbekannt/content").status_code == 404
+
+
+def test_resumable_upload_in_parts(tmp_path, monkeypatch):
+    import hashlib
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "upload_part_size", 1000)
+    audit = client.post("/api/audits", json={"title": "Großer Upload"}).json()
+    payload = ("Beleg " * 430).encode("utf-8")  # 2580 Bytes -> 3 Teile
+    created = client.post(
+        "/api/upload/resumable",
+        json={"audit_id": audit["id"], "filename": "../belege.txt", "size": len(payload), "content_type": "text/plain"},
+    )
+    assert created.status_code == 201
+    upload_id = created.json()["upload_id"]
+    assert created.json()["missing_parts"] == [1, 2, 3]
+    base = f"/api/upload/resumable/{upload_id}"
+
+    # Teile außer der Reihe; falsche Prüfsumme und zu langer Teil werden abgelehnt
+    assert client.put(f"{base}/parts/3", content=payload[2000:]).json()["size"] == 580
+    bad = client.put(f"{base}/parts/1", content=payload[:1000], headers={"X-Part-SHA256": "0" * 64})
+    assert bad.status_code == 400
+    assert client.put(f"{base}/parts/2", content=payload[1000:2001]).status_code == 400
+    assert client.put(f"{base}/parts/4", content=b"x").status_code == 400
+    assert client.post(f"{base}/complete").status_code == 409
+
+    state = client.get(base).json()
+    assert state["missing_parts"] == [1, 2]
+    assert state["received_bytes"] == 580
+
+    digest = hashlib.sha256(payload[:1000]).hexdigest()
+    part = client.put(f"{base}/parts/1", content=payload[:1000], headers={"X-Part-SHA256": digest})
+    assert part.json() == {"part_number": 1, "offset": 0, "size": 1000, "sha256": digest}
+    client.put(f"{base}/parts/2", content=payload[1000:2000])
+
+    completed = client.post(f"{base}/complete", json={"sha256": hashlib.sha256(payload).hexdigest()})
+    assert completed.status_code == 200
+    uploaded = completed.json()
+    assert uploaded["filename"] == "../belege.txt"
+    assert client.post(f"{base}/complete").json()["id"] == uploaded["id"]
+    assert client.get(base).json()["status"] == "COMPLETED"
+
+    stored = tmp_path / str(audit["id"]) / f"{uploaded['id'][:8]}_belege.txt"
+    assert stored.read_bytes() == payload
+    assert not (tmp_path / ".partial" / upload_id).exists()
+    assert client.get(f"/api/upload/{uploaded['id']}/content").content == payload
+
+    # Gleichnamiger Upload überschreibt die bestehende Datei nicht
+    same_name = client.post(
+        "/api/upload",
+        data={"audit_id": str(audit["id"])},
+        files={"file": ("belege.txt", b"andere Belege", "text/plain")},
+    ).json()
+    assert same_name["id"] != uploaded["id"]
+    assert stored.read_bytes() == payload
+    assert client.get(f"/api/upload/{same_name['id']}/content").content == b"andere Belege"
+    # Extraktion vor dem Zurücksetzen von upload_dir abwarten
+    assert wait_for_extraction(uploaded["id"])["extraction_status"] == "READY"
+    wait_for_extraction(same_name["id"])
+
+    aborted = client.post(
+        "/api/upload/resumable", json={"audit_id": audit["id"], "filename": "x.pdf", "size": 10}
+    ).json()
+    assert client.delete(f"/api/upload/resumable/{aborted['upload_id']}").status_code == 204
+    assert client.get(f"/api/upload/resumable/{aborted['upload_id']}").status_code == 404
+
+
+# Schema vor den nachträglich ergänzten Spalten und Indizes (Stand vor der Paginierung)
+LEGACY_SCHEMA = [
+    "CREATE TABLE audits (id INTEGER NOT NULL PRIMARY KEY, title VARCHAR(255) NOT NULL, description TEXT, "
+    "status VARCHAR(32) NOT NULL, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), "
+    "updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP), audit_type VARCHAR(64), scope TEXT, objectives TEXT, "
+    "start_date DATE, end_date DATE, responsible_person VARCHAR(255))",
+    "CREATE TABLE sessions (id VARCHAR NOT NULL PRIMARY KEY, audit_id INTEGER NOT NULL REFERENCES audits (id), "
+    "created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP))",
+    "CREATE TABLE messages (id INTEGER NOT NULL PRIMARY KEY, session_id VARCHAR NOT NULL REFERENCES sessions (id), "
+    "role VARCHAR(32) NOT NULL, content TEXT NOT NULL, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP))",
+    "CREATE TABLE uploaded_files (id VARCHAR NOT NULL PRIMARY KEY, audit_id INTEGER NOT NULL REFERENCES audits (id), "
+    "session_id VARCHAR REFERENCES sessions (id), filename VARCHAR(512) NOT NULL, content_type VARCHAR(128), "
+    "stored_path VARCHAR(1024) NOT NULL, extracted_text TEXT, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP))",
+    "CREATE TABLE audit_findings (id VARCHAR NOT NULL PRIMARY KEY, audit_id INTEGER NOT NULL REFERENCES audits (id), "
+    "title VARCHAR(255) NOT NULL, description TEXT, severity VARCHAR(32), status VARCHAR(32) NOT NULL, "
+    "action_description TEXT, action_due_date DATE, action_status VARCHAR(32), "
+    "created_at DATETIME DEFAULT (CURRENT_TIMESTAMP), updated_at DATETIME DEFAULT (CURRENT_TIMESTAMP))",
+    "CREATE TABLE risks (id INTEGER NOT NULL PRIMARY KEY, audit_id INTEGER NOT NULL REFERENCES audits (id), "
+    "title VARCHAR(255) NOT NULL, description TEXT, impact VARCHAR(32), likelihood VARCHAR(32), "
+    "created_at DATETIME DEFAULT (CURRENT_TIMESTAMP))",
+    "CREATE TABLE audit_plan_items (id INTEGER NOT NULL PRIMARY KEY, audit_id INTEGER NOT NULL REFERENCES audits (id), "
+    "title VARCHAR(255) NOT NULL, description TEXT, category VARCHAR(64), is_completed BOOLEAN, sort_order INTEGER, "
+    "due_date DATE, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP))",
+    "CREATE TABLE document_analyses (id VARCHAR NOT NULL PRIMARY KEY, "
+    "file_id VARCHAR NOT NULL REFERENCES uploaded_files (id), analysis_type VARCHAR(64) NOT NULL, prompt TEXT, "
+    "result TEXT, created_at DATETIME DEFAULT (CURRENT_TIMESTAMP))",
+    "CREATE TABLE audit_reports (id VARCHAR NOT NULL PRIMARY KEY, audit_id INTEGER NOT NULL REFERENCES audits (id), "
+    "version INTEGER NOT NULL, content_markdown TEXT, generated_at DATETIME DEFAULT (CURRENT_TIMESTAMP))",
+]
+
+
+def test_schema_migration_upgrades_existing_tables(tmp_path):
+    from sqlalchemy import inspect, text
+    from app.models import database
+
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO audits (id, title, status) VALUES (1, 'Altbestand', 'PLANUNG')"))
+        connection.execute(text("INSERT INTO sessions (id, audit_id) VALUES ('s1', 1)"))
+        connection.execute(text("INSERT INTO messages (session_id, role, content) VALUES ('s1', 'user', 'Hallo')"))
+        connection.execute(text(
+            "INSERT INTO uploaded_files (id, audit_id, filename, stored_path) VALUES ('f1', 1, 'alt.pdf', '/tmp/alt.pdf')"
+        ))
+
+    Base.metadata.create_all(bind=legacy)
+    database._migrate_schema(legacy)
+    database._migrate_schema(legacy)  # mehrfach ausführbar
+
+    inspector = inspect(legacy)
+    for table in ("sessions", "uploaded_files", "audit_findings", "risks", "audit_plan_items", "audit_reports"):
+        assert ["audit_id"] in [index["column_names"] for index in inspector.get_indexes(table)]
+    assert ["file_id"] in [index["column_names"] for index in inspector.get_indexes("document_analyses")]
+    assert ["cache_key"] in [index["column_names"] for index in inspector.get_indexes("document_analyses")]
+
+    def columns(table):
+        return {column["name"]: column for column in inspector.get_columns(table)}
+
+    assert {"model", "cache_key"} <= set(columns("document_analyses"))
+    assert "input_hash" in columns("audit_reports")
+    assert {"summary", "summary_message_id"} <= set(columns("sessions"))
+    assert columns("messages")["truncated"]["nullable"] is False
+
+    assert {"extraction_error", "file_hash"} <= set(columns("uploaded_files"))
+    assert ["file_hash"] in [index["column_names"] for index in inspector.get_indexes("uploaded_files")]
+
+    for table in ("audits", "uploaded_files", "audit_findings", "risks"):
+        assert columns(table)["row_version"]["nullable"] is False
+
+    from app.models.database import Audit, Message, UploadedFile
+    with sessionmaker(bind=legacy)() as db:
+        assert db.query(Message).one().truncated is False
+        assert db.query(UploadedFile).one().extraction_status == "READY"
+        audit = db.query(Audit).one()
+        assert audit.row_version == 1
+        audit.title = "Geändert"
+        db.commit()
+        assert audit.row_version == 2
+
+
+def test_large_responses_are_compressed_but_streams_are_not():
+    audit = client.post("/api/audits", json={"title": "Kompression", "description": "Lang " * 500}).json()
+
+    response = client.get(f"/api/audits/{audit['id']}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert int(response.headers["Content-Length"]) < 1000
+    assert response.json()["description"].startswith("Lang")
+
+    small = client.get("/api/health", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+    identity = client.get(f"/api/audits/{audit['id']}", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in identity.headers
+
+    stream = client.post(
+        f"/api/reports/audits/{audit['id']}/generate/stream",
+        json={"use_ai": False},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert stream.headers["Content-Type"].startswith("application/x-ndjson")
+    assert "Content-Encoding" not in stream.headers
+
+
+def test_full_text_search_is_maintained_on_writes(tmp_path, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    audit = client.post("/api/audits", json={"title": "Suche"}).json()
+    finding = client.post(
+        f"/api/findings/audits/{audit['id']}",
+        json={"title": "Lieferantenstammdaten ungeprüft", "description": "Bankverbindungen <b>ohne</b> Freigabe geändert"},
+    ).json()
+    risk = client.post(f"/api/risks/audits/{audit['id']}", json={"title": "Zahlungsbetrug"}).json()
+    upload = client.post(
+        "/api/upload",
+        data={"audit_id": str(audit["id"])},
+        files={"file": ("vertrag.txt", b"Die Vertragsstrafe betraegt fuenf Prozent.", "text/plain")},
+    ).json()
+    assert wait_for_extraction(upload["id"])["extraction_status"] == "READY"
+
+    def search(q, **params):
+        response = client.get("/api/search", params={"q": q, "audit_id": audit["id"], **params})
+        assert response.status_code == 200
+        return response.json()["results"]
+
+    hits = search("bankverbindung")
+    assert [(h["type"], h["id"]) for h in hits] == [("finding", finding["id"])]
+    assert "<mark>Bankverbindungen</mark>" in hits[0]["snippet"]
+    assert "&lt;b&gt;" in hits[0]["snippet"]
+
+    assert [(h["type"], h["id"]) for h in search("Zahlung")] == [("risk", risk["id"])]
+    assert [h["type"] for h in search("Vertragsstrafe")] == ["document"]
+    assert search("Vertragsstrafe", types="finding,risk") == []
+
+    client.patch(f"/api/findings/{finding['id']}", json={"title": "Kreditorenstamm"})
+    assert [h["id"] for h in search("Kreditorenstamm")] == [finding["id"]]
+    assert search("Lieferantenstammdaten") == []
+
+    client.delete(f"/api/risks/{risk['id']}")
+    client.delete(f"/api/upload/{upload['id']}")
+    assert search("Zahlung") == []
+    assert search("Vertragsstrafe") == []
+
+    assert client.get("/api/search", params={"q": "x y", "types": "foo"}).status_code == 400
+    assert client.get("/api/search", params={"q": "\"*("}).json()["results"] == []
+
+
+def test_similar_findings_from_other_audits():
+    from app.services.similarity import EmbeddingWorker
+
+    vocabulary = ["kasse", "bargeld", "lieferant", "stammdaten", "urlaub", "reisekosten"]
+
+    def fake_embed(texts):
+        return [[text.lower().count(word) + 0.01 for word in vocabulary] for text in texts]
+
+    worker = EmbeddingWorker(batch_size=3, dimensions=len(vocabulary), model="bag-of-words", embed=fake_embed)
+    past = client.post("/api/audits", json={"title": "Vorjahr"}).json()
+    current = client.post("/api/audits", json={"title": "Aktuell"}).json()
+    cash = client.post(
+        f"/api/findings/audits/{past['id']}",
+        json={"title": "Kasse nicht gezählt", "description": "Bargeld in der Kasse ohne Zählprotokoll"},
+    ).json()
+    client.patch(f"/api/findings/{cash['id']}", json={"action_description": "Monatliche Kassenzählung"})
+    client.post(f"/api/findings/audits/{past['id']}", json={"title": "Reisekosten", "description": "Urlaub abgerechnet"})
+    new = client.post(
+        f"/api/findings/audits/{current['id']}",
+        json={"title": "Bargeld", "description": "Kasse mit Fehlbetrag"},
+    ).json()
+    sibling = client.post(f"/api/findings/audits/{current['id']}", json={"title": "Kasse Bargeld"}).json()
+
+    pending = client.get(f"/api/findings/{new['id']}/similar").json()
+    assert pending["status"] == "PENDING"
+
+    worker.run_pending(engine)
+    data = client.get(f"/api/findings/{new['id']}/similar", params={"k": 1}).json()
+    assert data["status"] == "READY"
+    assert [(r["id"], r["action_description"]) for r in data["results"]] == [(cash["id"], "Monatliche Kassenzählung")]
+    assert data["results"][0]["audit_title"] == "Vorjahr"
+
+    same_audit = client.get(f"/api/findings/{new['id']}/similar", params={"include_same_audit": True, "k": 1}).json()
+    assert same_audit["results"][0]["id"] == sibling["id"]
+
+    # Textänderung: neu einplanen, danach passt der Eintrag nicht mehr
+    client.patch(f"/api/findings/{cash['id']}", json={"title": "Urlaub", "description": "Reisekosten Urlaub"})
+    worker.run_pending(engine)
+    data = client.get(f"/api/findings/{new['id']}/similar", params={"k": 50}).json()
+    assert [r["score"] < 0.1 for r in data["results"] if r["id"] == cash["id"]] == [True]
+
+    # Invalidierung bei unveränderter Anzahl und ohne neueren Zeitstempel (z.B. Uhrabweichung
+    # eines anderen Workers): der veraltete Vektor darf nicht mehr gefunden werden
+    from app.models.database import TextEmbedding
+
+    extra = client.post(f"/api/findings/audits/{past['id']}", json={"title": "Lieferant"}).json()
+    worker.run_pending(engine)
+    db = TestingSessionLocal()
+    try:
+        db.query(TextEmbedding).filter(TextEmbedding.ref_id == extra["id"]).update({TextEmbedding.embedded_at: 1.0})
+        db.commit()
+    finally:
+        db.close()
+    client.patch(f"/api/findings/{sibling['id']}", json={"title": "Stammdaten"})
+    data = client.get(f"/api/findings/{new['id']}/similar", params={"include_same_audit": True, "k": 50}).json()
+    assert sibling["id"] not in [r["id"] for r in data["results"]]
+
+
+def test_extracted_text_stored_compressed(tmp_path, monkeypatch):
+    from app.config import settings
+    from app.models.database import UploadedFile, UploadedFileText
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    audit = client.post("/api/audits", json={"title": "Upload"}).json()
+    body = ("Prüfungsnachweis " * 2000).encode("utf-8")
+    response = client.post(
+        "/api/upload",
+        data={"audit_id": audit["id"]},
+        files={"file": ("nachweis.txt", body, "text/plain")},
+    )
+    assert response.status_code == 201
+    file_id = response.json()["id"]
+    assert response.json()["extraction_status"] == "PENDING"
+    status = wait_for_extraction(file_id)
+    assert status["extraction_status"] == "READY"
+    assert status["text_length"] == len(body.decode("utf-8"))
+
+    db = TestingSessionLocal()
+    try:
+        blob = db.query(UploadedFileText).filter(UploadedFileText.file_id == file_id).one()
+        assert len(blob.content) < len(body)
+        uploaded = db.query(UploadedFile).filter(UploadedFile.id == file_id).one()
+        assert uploaded.extracted_text == body.decode("utf-8")
+    finally:
+        db.close()
+
+
+def test_document_analysis_cache(tmp_path, monkeypatch):
+    from app.config import settings
+    from app.services.openai_service import OpenAIService
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "openai_api_key", "dummy")
+    analyze = AsyncMock(return_value={"result": "Zusammenfassung", "stats": {}})
+    monkeypatch.setattr(OpenAIService, "analyze_document_with_stats", analyze)
+
+    file_ids = []
+    for title in ("Cache A", "Cache B"):
+        audit = client.post("/api/audits", json={"title": title}).json()
+        response = client.post(
+            "/api/upload",
+            data={"audit_id": audit["id"]},
+            files={"file": ("vertrag.txt", b"identischer Inhalt", "text/plain")},
+        )
+        file_ids.append(response.json()["id"])
+        wait_for_extraction(file_ids[-1])
+
+    url = "/api/analysis/document/{}"
+    first = client.post(url.format(file_ids[0]), json={"analysis_type": "SUMMARY"}).json()
+    assert first["cached"] is False
+    repeat = client.post(url.format(file_ids[0]), json={"analysis_type": "SUMMARY"}).json()
+    assert repeat["cached"] is True
+    assert repeat["id"] == first["id"]
+    other = client.post(url.format(file_ids[1]), json={"analysis_type": "SUMMARY"}).json()
+    assert other["cached"] is True
+    assert other["file_id"] == file_ids[1]
+    assert analyze.await_count == 1
+
+    forced = client.post(url.format(file_ids[0]), json={"analysis_type": "SUMMARY", "force": True}).json()
+    assert forced["cached"] is False
+    assert analyze.await_count == 2
+
+    # Gleichzeitige Aufrufe teilen sich ein Ergebnis; compute hängt nicht an der Session des ersten Aufrufers
+    import asyncio
+    from app.api.routes.analysis import AnalysisRequest, _analyze_file
+    from app.models.database import DocumentAnalysis, UploadedFile
+
+    release = asyncio.Event()
+
+    async def slow_analysis(*args, **kwargs):
+        await release.wait()
+        return {"result": "Zusammenfassung", "stats": {}}
+
+    monkeypatch.setattr(OpenAIService, "analyze_document_with_stats", slow_analysis)
+
+    async def concurrent():
+        request = AnalysisRequest(analysis_type="SUMMARY", force=True)
+        first_db, second_db = TestingSessionLocal(), TestingSessionLocal()
+        first = asyncio.create_task(_analyze_file(
+            first_db, first_db.get(UploadedFile, file_ids[0]), request, OpenAIService,
+        ))
+        second = asyncio.create_task(_analyze_file(
+            second_db, second_db.get(UploadedFile, file_ids[0]), request, OpenAIService,
+        ))
+        await asyncio.sleep(0.05)
+        first_db.close()  # wie das Ende der ersten Anfrage
+        release.set()
+        try:
+            return await asyncio.gather(first, second)
+        finally:
+            second_db.close()
+
+    first, second = asyncio.run(concurrent())
+    assert first["id"] == second["id"]
+    db = TestingSessionLocal()
+    try:
+        assert db.query(DocumentAnalysis).filter(DocumentAnalysis.id == first["id"]).count() == 1
+    finally:
+        db.close()
+
+
+def test_long_document_analysis_map_reduce(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    from app.config import settings
+    from app.services.openai_service import OpenAIService
+
+    monkeypatch.setattr(settings, "openai_api_key", "dummy")
+    monkeypatch.setattr(settings, "analysis_section_tokens", 50)
+    service = OpenAIService()
+
+    async def fake_create(**kwargs):
+        content = kwargs["messages"][-1]["content"]
+        answer = "Gesamt" if "Teilanalyse" in content else "Teil"
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=answer))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2, total_tokens=12),
+        )
+
+    service.client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+    )
+    text = "\n".join(f"Absatz {i}: " + "Vertragsklausel " * 10 for i in range(40))
+    run = asyncio.run(service.analyze_document_with_stats(text, "SUMMARY"))
+
+    assert run["result"] == "Gesamt"
+    assert run["stats"]["sections"] > 1
+    assert run["stats"]["llm_calls"] > run["stats"]["sections"]
+    assert run["stats"]["total_tokens"] == 12 * run["stats"]["llm_calls"]
+
+
+def test_audit_batch_analysis_streams_ndjson(tmp_path, monkeypatch):
+    import json
+    from app.config import settings
+    from app.services.openai_service import OpenAIService
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "openai_api_key", "dummy")
+    monkeypatch.setattr(
+        OpenAIService,
+        "analyze_document_with_stats",
+        AsyncMock(return_value={"result": "Risiken", "stats": {}}),
+    )
+
+    audit = client.post("/api/audits", json={"title": "Batch"}).json()
+    for name, body in (("a.txt", b"Inhalt A"), ("b.txt", b"Inhalt B"), ("leer.txt", b"")):
+        response = client.post(
+            "/api/upload",
+            data={"audit_id": audit["id"]},
+            files={"file": (name, body, "text/plain")},
+        )
+        wait_for_extraction(response.json()["id"])
+
+    response = client.post(f"/api/analysis/audits/{audit['id']}", json={"analysis_type": "RISK"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    frames = [json.loads(line) for line in response.text.splitlines() if line]
+
+    assert frames[0] == {"type": "metadata", "audit_id": audit["id"], "analysis_type": "RISK", "total": 3}
+    assert sorted(f["filename"] for f in frames if f["type"] == "analysis") == ["a.txt", "b.txt"]
+    assert [f["filename"] for f in frames if f["type"] == "error"] == ["leer.txt"]
+    assert frames[-1]["type"] == "done"
+    assert (frames[-1]["succeeded"], frames[-1]["failed"]) == (2, 1)
+
+    # Client trennt nach dem ersten Ergebnis: wartende Analysen starten nicht mehr
+    import asyncio
+    from app.api.routes.analysis import AnalysisRequest, analyze_audit_documents
+
+    monkeypatch.setattr(settings, "analysis_batch_workers", 1)
+    calls = []
+
+    async def slow_analysis(*args, **kwargs):
+        calls.append(kwargs["extracted_text"])
+        await asyncio.sleep(0.05)
+        return {"result": "Risiken", "stats": {}}
+
+    monkeypatch.setattr(OpenAIService, "analyze_document_with_stats", slow_analysis)
+    for name in ("c.txt", "d.txt"):
+        response = client.post(
+            "/api/upload",
+            data={"audit_id": audit["id"]},
+            files={"file": (name, f"Inhalt {name}".encode(), "text/plain")},
+        )
+        wait_for_extraction(response.json()["id"])
+
+    async def disconnect_after_first_result():
+        db = TestingSessionLocal()
+        try:
+            response = await analyze_audit_documents(
+                audit["id"], AnalysisRequest(analysis_type="RISK", force=True), db
+            )
+            stream = response.body_iterator
+            await stream.__anext__()  # metadata
+            await stream.__anext__()  # erstes Ergebnis
+            await stream.aclose()
+            await asyncio.sleep(0.3)
+        finally:
+            db.close()
+
+    asyncio.run(disconnect_after_first_result())
+    assert 1 <= len(calls) < 4  # ohne Abbruch liefen alle vier Dateien mit Text
+
+
+def test_report_generation_stream(monkeypatch):
+    import json
+    from app.config import settings
+    from app.services.openai_service import OpenAIService
+
+    async def fake_stream(self, report_data):
+        for chunk in ("# Bericht", " für ", report_data["title"]):
+            yield chunk
+
+    monkeypatch.setattr(settings, "openai_api_key", "dummy")
+    monkeypatch.setattr(OpenAIService, "generate_report_stream", fake_stream)
+
+    audit = client.post("/api/audits", json={"title": "Streaming"}).json()
+    response = client.post(f"/api/reports/audits/{audit['id']}/generate/stream", json={"use_ai": True})
+    assert response.status_code == 200
+    frames = [json.loads(line) for line in response.text.splitlines() if line]
+
+    assert frames[0]["type"] == "metadata"
+    assert "".join(f["chunk"] for f in frames if f["type"] == "content") == "# Bericht für Streaming"
+    assert frames[-1]["type"] == "report"
+    assert frames[-1]["report"]["content_markdown"] == "# Bericht für Streaming"
+    assert frames[-1]["report"]["version"] == 1
+
+
+def test_report_generation_reuses_unchanged_inputs():
+    audit = client.post("/api/audits", json={"title": "Fingerprint"}).json()
+    url = f"/api/reports/audits/{audit['id']}/generate"
+
+    first = client.post(url, json={"use_ai": False}).json()
+    assert first["reused"] is False
+    repeat = client.post(url, json={"use_ai": False}).json()
+    assert repeat["reused"] is True
+    assert repeat["id"] == first["id"]
+
+    client.post(f"/api/findings/audits/{audit['id']}", json={"title": "Neu"})
+    changed = client.post(url, json={"use_ai": False}).json()
+    assert changed["reused"] is False
+    assert changed["version"] == 2
+
+    forced = client.post(url, json={"use_ai": False, "force": True}).json()
+    assert forced["reused"] is False
+    assert forced["version"] == 3
+
+
+def test_llm_scheduler_priority_and_retry():
+    import asyncio
+    import httpx
+    import openai
+    from app.services.llm_scheduler import LLMScheduler
+
+    async def scenario():
+        scheduler = LLMScheduler(
+            max_concurrency=1,
+            type_limits={"chat": 1, "report": 1, "analysis": 1},
+            backoff_base=0.01,
+        )
+        order = []
+        gate = asyncio.Event()
+
+        async def job(name):
+            order.append(name)
+            await gate.wait()
+            return name
+
+        first = asyncio.create_task(scheduler.call("analysis", 10, lambda: job("analysis-1")))
+        await asyncio.sleep(0)
+        queued = [
+            asyncio.create_task(scheduler.call("analysis", 10, lambda: job("analysis-2"))),
+            asyncio.create_task(scheduler.call("chat", 10, lambda: job("chat"))),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.metrics()["queued"] == 2
+        gate.set()
+        await asyncio.gather(first, *queued)
+        assert order == ["analysis-1", "chat", "analysis-2"]
+
+        attempts = []
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise openai.RateLimitError(
+                    "rate limited",
+                    response=httpx.Response(429, headers={"retry-after-ms": "5"}, request=request),
+                    body=None,
+                )
+            return "ok"
+
+        assert await scheduler.call("report", 10, flaky) == "ok"
+        metrics = scheduler.metrics()["call_types"]["report"]
+        assert (metrics["retries"], metrics["rate_limited"]) == (2, 2)
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    import asyncio
+    from app.services.single_flight import SingleFlight
+
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"result": len(calls)}
+
+        results = await asyncio.gather(*(flights.do("same", compute) for _ in range(5)))
+        assert calls == [1]
+        assert all(r is results[0] for r in results)
+        assert len(flights) == 0
+
+        await flights.do("same", compute)
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_chat_context_budget_and_history_compaction(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    from app.config import settings
+    from app.models.database import ChatSession, Message
+    from app.services.chat_context import build_chat_messages
+    from app.services.openai_service import OpenAIService
+
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Nachricht {i} " + "x" * 200}
+        for i in range(20)
+    ]
+    context = build_chat_messages(
+        system_prompt="System",
+        user_message="Frage",
+        snippets=["[1] " + "a" * 400, "[2] " + "b" * 400, "[3] " + "c" * 4000],
+        summary="Bisher besprochen",
+        history=history,
+        budget=800,
+        retrieval_share=0.5,
+        model="gpt-4o-mini",
+    )
+    stats = context["stats"]
+    assert stats["prompt_tokens"] <= 800
+    assert stats["snippets"] == 2
+    assert stats["summary"] is True
+    assert 0 < stats["history_messages"] < len(history)
+    # Jüngste Nachrichten bleiben erhalten, aktuelle Frage steht am Ende
+    assert context["messages"][-2] == history[-1]
+    assert context["messages"][-1] == {"role": "user", "content": "Frage"}
+
+    monkeypatch.setattr(settings, "openai_api_key", "dummy")
+    monkeypatch.setattr(settings, "chat_history_token_budget", 300)
+    service = OpenAIService()
+
+    async def fake_create(**kwargs):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="Zusammenfassung"))],
+            usage=None,
+        )
+
+    service.client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+    )
+
+    db = TestingSessionLocal()
+    session = ChatSession(audit_id=1)
+    db.add(session)
+    db.commit()
+    for message in history:
+        db.add(Message(session_id=session.id, **message))
+    db.commit()
+
+    assert asyncio.run(service.compact_history(db, session)) is True
+    remaining = service._unsummarized_messages(db, session)
+    assert session.summary == "Zusammenfassung"
+    assert 2 <= len(remaining) < len(history)
+    assert remaining[-1].content == history[-1]["content"]
+    assert asyncio.run(service.compact_history(db, session)) is False
+
+    # Nach dem Chat-Stream läuft die Verdichtung als eigener Task mit eigener Session
+    detached = ChatSession(audit_id=1)
+    db.add(detached)
+    db.commit()
+    for message in history:
+        db.add(Message(session_id=detached.id, **message))
+    db.commit()
+
+    async def compact_in_background():
+        task = service.schedule_compaction(engine, detached.id)
+        assert service.schedule_compaction(engine, detached.id) is None  # läuft bereits
+        await task
+
+    asyncio.run(compact_in_background())
+    db.refresh(detached)
+    assert detached.summary == "Zusammenfassung"
+    db.close()
+
+
+def test_chat_stream_prepares_context_concurrently(monkeypatch):
+    import asyncio
+    import json
+    import time
+    from types import SimpleNamespace
+    from app.config import settings
+    from app.models.database import Audit, ChatSession
+    from app.services.openai_service import OpenAIService
+
+    monkeypatch.setattr(settings, "openai_api_key", "dummy")
+    service = OpenAIService()
+
+    async def slow_retrieval(audit_id, user_message):
+        await asyncio.sleep(0.2)
+        return {"context_text": "", "snippets": ["[1] Aus Dokument 'a.pdf':\nText\n"], "sources": [{"label": "[1]"}]}
+
+    prepare_chat = service._prepare_chat
+
+    def slow_prepare(*args):
+        time.sleep(0.2)
+        return prepare_chat(*args)
+
+    class FakeStream:
+        def __init__(self):
+            self.chunks = iter(["Ant", "wort"])
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                content = next(self.chunks)
+            except StopIteration:
+                raise StopAsyncIteration
+            return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+    async def fake_create(**kwargs):
+        return FakeStream()
+
+    monkeypatch.setattr(service, "build_retrieval_context", slow_retrieval)
+    monkeypatch.setattr(service, "_prepare_chat", slow_prepare)
+    service.client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+    )
+
+    db = TestingSessionLocal()
+    audit = Audit(title="Kontextprüfung", status="PLANNED")
+    db.add(audit)
+    db.commit()
+
+    async def collect():
+        return [json.loads(line) async for line in service.chat_stream(db, str(audit.id), None, "Frage")]
+
+    frames = asyncio.run(collect())
+    metadata = frames[0]
+    timings = metadata["timings"]
+    assert {"retrieval_ms", "insert_ms", "history_ms", "audit_context_ms", "prepare_ms"} <= set(timings)
+    # Beide Stufen dauern je ~200 ms; nacheinander wären es mindestens 400 ms
+    assert timings["prepare_ms"] < 380
+    assert metadata["sources"] == [{"label": "[1]"}]
+    assert "".join(f["chunk"] for f in frames if f["type"] == "content") == "Antwort"
+
+    session = db.query(ChatSession).filter(ChatSession.id == metadata["session_id"]).first()
+    assert [m.role for m in sorted(session.messages, key=lambda m: m.id)] == ["user", "assistant"]
+    db.close()
+
+
+def test_ndjson_coalesces_chat_deltas():
+    import asyncio
+    import json
+    from app.services.ndjson import coalesce, encode_frame
+
+    async def deltas(fail=False):
+        for i in range(200):
+            await asyncio.sleep(0.001 if i % 50 == 0 else 0)
+            yield f"t{i} "
+        if fail:
+            raise RuntimeError("Verbindung verloren")
+
+    async def collect(**kwargs):
+        return [text async for text in coalesce(deltas(), **kwargs)]
+
+    expected = "".join(f"t{i} " for i in range(200))
+    coalesced = asyncio.run(collect(max_delay=0.05, max_chars=100))
+    assert "".join(coalesced) == expected
+    assert coalesced[0] == "t0 "  # erstes Delta ohne Verzögerung
+    assert 2 < len(coalesced) < 50
+    assert len(asyncio.run(collect(max_delay=0, max_chars=100))) == 200
+
+    async def collect_until_error():
+        received = []
+        try:
+            async for text in coalesce(deltas(fail=True), max_delay=0.05, max_chars=10_000):
+                received.append(text)
+        except RuntimeError:
+            return received
+        raise AssertionError("Fehler des Upstreams wurde verschluckt")
+
+    # Gepufferter Text geht vor dem Fehler nicht verloren
+    assert "".join(asyncio.run(collect_until_error())) == expected
+
+    frame = encode_frame({"type": "content", "chunk": "Prüfung"})
+    assert frame.endswith(b"\n")
+    assert json.loads(frame) == {"type": "content", "chunk": "Prüfung"}
+
+
+def test_chat_stream_disconnect_cancels_upstream(monkeypatch):
+    import asyncio
+    import json
+    from types import SimpleNamespace
+    from app.config import settings
+    from app.models.database import Message
+    from app.services.llm_scheduler import llm_scheduler
+    from app.services.openai_service import OpenAIService
+
+    monkeypatch.setattr(settings, "openai_api_key", "dummy")
+    service = OpenAIService()
+    upstreams = []
+
+    class SlowStream:
+        def __init__(self):
+            self.sent = 0
+            self.closed = False
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            await asyncio.sleep(0.01)
+            self.sent += 1
+            if self.sent > 500:
+                raise StopAsyncIteration
+            return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content="x"))])
+
+        async def close(self):
+            self.closed = True
+
+    async def fake_create(**kwargs):
+        upstreams.append(SlowStream())
+        return upstreams[-1]
+
+    async def no_retrieval(audit_id, user_message):
+        return {"context_text": "", "snippets": [], "sources": []}
+
+    monkeypatch.setattr(service, "build_retrieval_context", no_retrieval)
+    service.client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=fake_create))
+    )
+    db = TestingSessionLocal()
+
+    async def disconnect_after_first_chunk(cancel: bool):
+        stream = service.chat_stream(db, "0", None, "Lange Frage")
+        session_id = json.loads(await stream.__anext__())["session_id"]
+        await stream.__anext__()
+        if cancel:
+            # So bricht Starlette den Stream bei http.disconnect ab
+            task = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        else:
+            await stream.aclose()
+        return session_id
+
+    for cancel in (True, False):
+        session_id = asyncio.run(disconnect_after_first_chunk(cancel))
+        upstream = upstreams[-1]
+        assert upstream.closed and upstream.sent < 100
+        assert llm_scheduler.metrics()["call_types"]["chat"]["in_flight"] == 0
+
+        answer = (
+            db.query(Message)
+            .filter(Message.session_id == session_id, Message.role == "assistant")
+            .one()
+        )
+        assert answer.truncated is True
+        assert answer.content and set(answer.content) == {"x"}
+    db.close()
+
+
+def test_upload_extraction_runs_in_background(tmp_path, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    audit = client.post("/api/audits", json={"title": "Extraktion"}).json()
+    response = client.post(
+        "/api/upload",
+        data={"audit_id": audit["id"]},
+        files={"file": ("kaputt.pdf", b"kein PDF", "application/pdf")},
+    )
+    assert response.status_code == 201
+    file_id = response.json()["id"]
+    assert response.json()["extraction_status"] == "PENDING"
+
+    status = wait_for_extraction(file_id)
+    assert status["extraction_status"] == "FAILED"
+    assert status["extraction_error"]
+    assert status["text_length"] is None
+
+    listed = client.get(f"/api/upload/audits/{audit['id']}").json()
+    assert [f["extraction_status"] for f in listed] == ["FAILED"]
+    analysis = client.post(f"/api/analysis/document/{file_id}", json={"analysis_type": "SUMMARY"})
+    assert analysis.status_code == 400
+    assert client.get("/api/upload/unbekannt/status").status_code == 404
+
+
+def test_extraction_result_shared_by_content_hash(tmp_path, monkeypatch):
+    import gzip
+    import hashlib
+    import json
+    from app.config import settings
+    from app.services.extraction import artifact_path
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    audit = client.post("/api/audits", json={"title": "Gemeinsame Extraktion"}).json()
+    body = b"Seite eins\nSeite zwei"
+    content_hash = hashlib.sha256(body).hexdigest()
+
+    def upload(name):
+        response = client.post(
+            "/api/upload",
+            data={"audit_id": audit["id"]},
+            files={"file": (name, body, "text/plain")},
+        )
+        assert wait_for_extraction(response.json()["id"])["extraction_status"] == "READY"
+        return response.json()["id"]
+
+    first_id = upload("erste.txt")
+    path = artifact_path(str(tmp_path), content_hash)
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        artifact = json.load(f)
+    assert artifact["text"] == body.decode("utf-8")
+    assert artifact["units"] == [{"type": "document", "text": body.decode("utf-8")}]
+
+    # Gleicher Inhalt unter anderem Namen: kein zweiter Parse, das Artefakt wird übernommen
+    artifact["text"] = "aus dem Speicher"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(artifact, f)
+    second_id = upload("zweite.txt")
+    db = TestingSessionLocal()
+    try:
+        from app.models.database import DocumentAnalysis, UploadedFile
+        second = db.query(UploadedFile).filter(UploadedFile.id == second_id).one()
+        assert second.file_hash == content_hash
+        assert second.extracted_text == "aus dem Speicher"
+    finally:
+        db.close()
+
+    # Artefakt bleibt, solange noch eine Datei mit diesem Inhalt existiert
+    client.delete(f"/api/upload/{first_id}")
+    assert os.path.exists(path)
+    client.delete(f"/api/upload/{second_id}")
+    assert not os.path.exists(path)
+
+
+def test_upload_and_delete_hand_off_to_vector_index(tmp_path, monkeypatch):
+    import httpx
+    from app.config import settings
+    from app.models.database import IndexJob
+    from app.services.indexing import IndexWorker
+
+    monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+    audit = client.post("/api/audits", json={"title": "Indexierung"}).json()
+    response = client.post(
+        "/api/upload",
+        data={"audit_id": audit["id"]},
+        files={"file": ("index.txt", b"Indexierbarer Inhalt", "text/plain")},
+    )
+    file_id = response.json()["id"]
+    wait_for_extraction(file_id)
+
+    requests = []
+    responses = iter([httpx.Response(503), httpx.Response(200, json={"chunks": 1})])
+
+    def handler(request):
+        if file_id not in request.url.path and file_id.encode() not in request.content:
+            return httpx.Response(200, json={"chunks": 0})  # Aufträge anderer Tests
+        requests.append(request)
+        if request.method == "DELETE":
+            return httpx.Response(404)
+        return next(responses)
+
+    worker = IndexWorker(
+        base_url="http://document-service",
+        workers=2,
+        max_attempts=3,
+        backoff_base=0,
+        backoff_max=0,
+        timeout=5,
+        transport=httpx.MockTransport(handler),
+    )
+
+    def jobs():
+        db = TestingSessionLocal()
+        try:
+            return [
+                (j.action, j.status, j.attempts)
+                for j in db.query(IndexJob).filter(IndexJob.file_id == file_id).order_by(IndexJob.id)
+            ]
+        finally:
+            db.close()
+
+    assert jobs() == [("INDEX", "PENDING", 0)]
+    worker.run_due(engine)  # 503: erneut einplanen
+    assert jobs() == [("INDEX", "PENDING", 1)]
+    worker.run_due(engine)
+    assert jobs() == [("INDEX", "DONE", 2)]
+
+    index_calls = [r for r in requests if r.method == "POST"]
+    assert index_calls[0].headers["Idempotency-Key"] == index_calls[1].headers["Idempotency-Key"]
+    assert index_calls[0].url.path == "/documents/index"
+    assert b'"path":"' in index_calls[0].content.replace(b" ", b"")
+    assert b'"extraction_version":1' in index_calls[0].content.replace(b" ", b"")
+
+    assert client.delete(f"/api/upload/{file_id}").status_code == 204
+    worker.run_due(engine)
+    assert jobs() == [("INDEX", "DONE", 2), ("DELETE", "DONE", 1)]
+    assert requests[-1].url.path == f"/documents/files/{file_id}"
+
+    metrics = client.get("/api/metrics/indexing").json()
+    assert metrics["jobs"]["DONE"] >= 2
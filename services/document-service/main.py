@@ -1,12 +1,18 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from collections import OrderedDict
 import shutil
 import os
 import time
+import gzip
+import hashlib
+import json
 import logging
 from pypdf import PdfReader
 from sentence_transformers import SentenceTransformer
-from vector_store import get_weaviate_client, init_schema, delete_by_filename
+from vector_store import get_weaviate_client, init_schema, delete_by_filename, delete_by_file_id
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
@@ -131,59 +137,113 @@ def _extract_text(file_path: str, filename: str) -> str:
     return text
 
 
-def process_file_sync(file_path: str, filename: str, audit_id: int):
+# Shared extraction results written by the ai-service (app/services/extraction.py)
+# to the common uploads volume: <UPLOAD_DIR>/extracted/<sha256>.json.gz
+# Must equal EXTRACTION_VERSION in ai-service app/services/extraction.py. The ai-service
+# sends its version with every index request; mismatches are rejected in /documents/index.
+EXTRACTION_VERSION = 1
+
+
+def _file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_shared_extraction(content_hash: str) -> dict | None:
+    path = os.path.join(UPLOAD_DIR, "extracted", f"{content_hash}.json.gz")
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if artifact.get("version") != EXTRACTION_VERSION:
+        logger.warning(
+            f"Shared extraction {content_hash} has version {artifact.get('version')}, "
+            f"expected {EXTRACTION_VERSION}; extracting locally"
+        )
+        return None
+    return artifact
+
+
+def process_file_sync(file_path: str, filename: str, audit_id: int, content_hash: str | None = None):
     """Process file: extract text, chunk, embed, store in Weaviate."""
     try:
-        logger.info(f"Processing file: {filename}")
+        index_file_sync(file_path, filename, audit_id, content_hash)
+    except Exception as e:
+        logger.error(f"Failed to process file {filename}: {e}")
+
 
+def index_file_sync(
+    file_path: str,
+    filename: str,
+    audit_id: int,
+    content_hash: str | None = None,
+    file_id: str | None = None,
+) -> int:
+    """Extract, chunk, embed and store a file; returns the number of chunks. Raises on failure."""
+    logger.info(f"Processing file: {filename}")
+
+    # Reuse the ai-service extraction of the same content instead of parsing again
+    shared = _load_shared_extraction(content_hash or _file_sha256(file_path))
+    if shared is not None:
+        logger.info(f"Using shared extraction for {filename}")
+        text_content = shared["text"]
+    else:
         text_content = _extract_text(file_path, filename)
 
-        if not text_content.strip():
-            logger.warning(f"No text content in {filename}")
-            return
+    if file_id:
+        # Replace semantics: a retried or repeated index request never duplicates chunks
+        delete_by_file_id(file_id)
 
-        # Chunk by paragraphs, then by size
-        chunk_size = 1000
-        chunks = []
-        paragraphs = text_content.split("\n\n")
-        current_chunk = ""
+    if not text_content.strip():
+        logger.warning(f"No text content in {filename}")
+        return 0
 
-        for para in paragraphs:
-            if len(current_chunk) + len(para) > chunk_size and current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = para
-            else:
-                current_chunk += "\n\n" + para if current_chunk else para
+    # Chunk by paragraphs, then by size
+    chunk_size = 1000
+    chunks = []
+    paragraphs = text_content.split("\n\n")
+    current_chunk = ""
 
-        if current_chunk.strip():
+    for para in paragraphs:
+        if len(current_chunk) + len(para) > chunk_size and current_chunk:
             chunks.append(current_chunk.strip())
+            current_chunk = para
+        else:
+            current_chunk += "\n\n" + para if current_chunk else para
 
-        if not chunks:
-            chunks = [text_content[i:i+chunk_size] for i in range(0, len(text_content), chunk_size)]
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
 
-        logger.info(f"Generated {len(chunks)} chunks for {filename}")
+    if not chunks:
+        chunks = [text_content[i:i+chunk_size] for i in range(0, len(text_content), chunk_size)]
 
-        client = get_weaviate_client()
-        client.batch.configure(batch_size=100)
-
-        with client.batch as batch:
-            for chunk in chunks:
-                embedding = model.encode(chunk).tolist()
-                properties = {
-                    "content": chunk,
-                    "filename": filename,
-                    "audit_id": audit_id,
-                }
-                batch.add_data_object(
-                    data_object=properties,
-                    class_name="Document",
-                    vector=embedding,
-                )
-
-        logger.info(f"Successfully processed and uploaded {filename}")
+    logger.info(f"Generated {len(chunks)} chunks for {filename}")
 
-    except Exception as e:
-        logger.error(f"Failed to process file {filename}: {e}")
+    client = get_weaviate_client()
+    client.batch.configure(batch_size=100)
+
+    with client.batch as batch:
+        for chunk in chunks:
+            embedding = model.encode(chunk).tolist()
+            properties = {
+                "content": chunk,
+                "filename": filename,
+                "audit_id": audit_id,
+            }
+            if file_id:
+                properties["file_id"] = file_id
+            batch.add_data_object(
+                data_object=properties,
+                class_name="Document",
+                vector=embedding,
+            )
+
+    logger.info(f"Successfully processed and uploaded {filename}")
+    return len(chunks)
 
 
 @app.post("/documents/upload")
@@ -191,6 +251,7 @@ async def upload_document(
     background_tasks: BackgroundTasks,
     audit_id: int = Form(...),
     file: UploadFile = File(...),
+    content_hash: str | None = Form(None),
 ):
     if not model:
         raise HTTPException(status_code=503, detail="Model is still loading, please try again in a moment")
@@ -200,7 +261,7 @@ async def upload_document(
         with open(file_location, "wb+") as file_object:
             shutil.copyfileobj(file.file, file_object)
 
-        background_tasks.add_task(process_file_sync, file_location, file.filename, audit_id)
+        background_tasks.add_task(process_file_sync, file_location, file.filename, audit_id, content_hash)
 
         return {
             "filename": file.filename,
@@ -213,6 +274,113 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+class IndexRequest(BaseModel):
+    file_id: str
+    audit_id: int
+    filename: str
+    path: str  # relative to the shared uploads volume
+    content_hash: str | None = None
+    # EXTRACTION_VERSION of the ai-service that wrote the shared artifact
+    extraction_version: int | None = None
+
+
+# Backpressure: beyond this many queued index requests callers get 429 + Retry-After
+MAX_PENDING_INDEX_REQUESTS = 4
+INDEX_RETRY_AFTER_SECONDS = 10
+IDEMPOTENCY_CACHE_SIZE = 1000
+
+_index_in_flight: dict[str, asyncio.Future] = {}
+_index_results: "OrderedDict[str, dict]" = OrderedDict()
+
+
+@app.post("/documents/index")
+async def index_document(
+    payload: IndexRequest,
+    idempotency_key: str | None = Header(None),
+):
+    """
+    Index a file the ai-service stored on the shared uploads volume. Used by the
+    ai-service ingestion queue; repeated requests with the same Idempotency-Key
+    return the first result instead of embedding again.
+    """
+    if not model:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Model is still loading"},
+            headers={"Retry-After": str(INDEX_RETRY_AFTER_SECONDS)},
+        )
+
+    if payload.extraction_version is not None and payload.extraction_version != EXTRACTION_VERSION:
+        # Not retryable: the services disagree on the artifact format and must be deployed together
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                f"Extraction version mismatch: ai-service {payload.extraction_version}, "
+                f"document-service {EXTRACTION_VERSION}"
+            ),
+        )
+
+    upload_root = os.path.realpath(UPLOAD_DIR)
+    file_path = os.path.realpath(os.path.join(upload_root, payload.path))
+    if not file_path.startswith(upload_root + os.sep):
+        raise HTTPException(status_code=400, detail="Invalid path")
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found on uploads volume")
+
+    key = idempotency_key or f"index:{payload.file_id}:{payload.content_hash or ''}"
+    if key in _index_results:
+        return {**_index_results[key], "replayed": True}
+
+    future = _index_in_flight.get(key)
+    if future is None:
+        if len(_index_in_flight) >= MAX_PENDING_INDEX_REQUESTS:
+            return JSONResponse(
+                status_code=429,
+                content={"detail": "Too many pending index requests"},
+                headers={"Retry-After": str(INDEX_RETRY_AFTER_SECONDS)},
+            )
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(
+            executor,
+            index_file_sync,
+            file_path,
+            payload.filename,
+            payload.audit_id,
+            payload.content_hash,
+            payload.file_id,
+        )
+        _index_in_flight[key] = future
+        future.add_done_callback(lambda _: _index_in_flight.pop(key, None))
+
+    try:
+        chunks = await asyncio.shield(future)
+    except Exception as e:
+        logger.error(f"Indexing {payload.filename} failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Indexing failed: {str(e)}")
+
+    result = {"file_id": payload.file_id, "chunks": chunks}
+    _index_results[key] = result
+    while len(_index_results) > IDEMPOTENCY_CACHE_SIZE:
+        _index_results.popitem(last=False)
+    return {**result, "replayed": False}
+
+
+@app.delete("/documents/files/{file_id}")
+async def delete_file_vectors(file_id: str):
+    """Delete all chunks of an ai-service upload (idempotent)."""
+    try:
+        loop = asyncio.get_event_loop()
+        deleted = await loop.run_in_executor(executor, delete_by_file_id, file_id)
+    except Exception as e:
+        logger.error(f"Delete failed: {e}")
+        raise HTTPException(status_code=500, detail=f"Delete failed: {str(e)}")
+
+    # A later re-upload of the same file id must be indexed again
+    for key in [k for k, v in _index_results.items() if v["file_id"] == file_id]:
+        del _index_results[key]
+    return {"file_id": file_id, "deleted": deleted}
+
+
 @app.post("/documents/search")
 async def search_documents(query: str, audit_id: int = None):
     if not model:
@@ -64,3 +64,47 @@ def test_search_documents():
     
     assert response.status_code == 200
     assert response.json() == mock_response
+
+def test_process_file_uses_shared_extraction():
+    import gzip
+    import hashlib
+    import json
+
+    body = b"%PDF-1.4 binary content"
+    file_path = os.path.join(main.UPLOAD_DIR, "shared.pdf")
+    with open(file_path, "wb") as f:
+        f.write(body)
+    content_hash = hashlib.sha256(body).hexdigest()
+    os.makedirs(os.path.join(main.UPLOAD_DIR, "extracted"), exist_ok=True)
+    with gzip.open(os.path.join(main.UPLOAD_DIR, "extracted", f"{content_hash}.json.gz"), "wt", encoding="utf-8") as f:
+        json.dump({"version": main.EXTRACTION_VERSION, "text": "Shared text", "units": []}, f)
+
+    with patch.object(main, "_extract_text") as extract:
+        main.process_file_sync(file_path, "shared.pdf", 1)
+
+    assert not extract.called
+    assert mock_model.encode.call_args[0][0] == "Shared text"
+
+def test_index_document_is_idempotent():
+    os.makedirs(os.path.join(main.UPLOAD_DIR, "7"), exist_ok=True)
+    with open(os.path.join(main.UPLOAD_DIR, "7", "idx.txt"), "wb") as f:
+        f.write(b"Indexed content")
+    payload = {"file_id": "f-1", "audit_id": 7, "filename": "idx.txt", "path": "7/idx.txt"}
+    headers = {"Idempotency-Key": "index:f-1:abc"}
+
+    with patch.object(main, "index_file_sync", return_value=3) as index:
+        first = client.post("/documents/index", json=payload, headers=headers)
+        second = client.post("/documents/index", json=payload, headers=headers)
+
+    assert first.json() == {"file_id": "f-1", "chunks": 3, "replayed": False}
+    assert second.json()["replayed"] is True
+    assert index.call_count == 1
+
+    outside = client.post("/documents/index", json={**payload, "path": "../etc/passwd"}, headers=headers)
+    assert outside.status_code == 400
+
+    mismatch = {**payload, "extraction_version": main.EXTRACTION_VERSION + 1}
+    assert client.post("/documents/index", json=mismatch, headers={"Idempotency-Key": "index:f-1:v"}).status_code == 409
+
+    with patch.object(main, "delete_by_file_id", return_value=3):
+        assert client.delete("/documents/files/f-1").json() == {"file_id": "f-1", "deleted": 3}
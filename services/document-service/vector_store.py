@@ -28,7 +28,11 @@ def init_schema():
             {
                 "name": "audit_id",
                 "dataType": ["int"],
-            }
+            },
+            {
+                "name": "file_id",
+                "dataType": ["text"],
+            },
         ]
     }
 
@@ -37,6 +41,11 @@ def init_schema():
         print("Schema 'Document' created.")
     else:
         print("Schema 'Document' already exists.")
+        # Older schemas predate file_id (ai-service upload id); add it in place
+        existing = {p["name"] for p in client.schema.get("Document").get("properties", [])}
+        if "file_id" not in existing:
+            client.schema.property.create("Document", {"name": "file_id", "dataType": ["text"]})
+            print("Property 'file_id' added to schema 'Document'.")
 
 
 def delete_by_filename(filename: str) -> int:
@@ -70,3 +79,17 @@ def delete_by_filename(filename: str) -> int:
         print(f"Error deleting documents for {filename}: {e}")
 
     return deleted
+
+
+def delete_by_file_id(file_id: str) -> int:
+    """Delete all document chunks of an ai-service upload. Idempotent."""
+    client = get_weaviate_client()
+    result = client.batch.delete_objects(
+        class_name="Document",
+        where={
+            "path": ["file_id"],
+            "operator": "Equal",
+            "valueText": file_id,
+        },
+    )
+    return result.get("results", {}).get("successful", 0)